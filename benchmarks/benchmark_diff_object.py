@@ -0,0 +1,57 @@
+"""
+Time how long it takes to build a DiffObject comparing many large models.
+
+Each model has the given number of reactions (each with a reactant, a product, a parameter and a regulatory arrow), and
+every other model differs in the rate law of every tenth reaction. The time per reaction should not grow with the
+number of reactions.
+
+Usage (from the root of the repository): python -m benchmarks.benchmark_diff_object [reactions] [models] [backend]
+
+where backend is one of DiffObject.DIFF_BACKENDS (default "dict").
+"""
+import sys
+import time
+from sbml_diff.DiffObject import DiffObject, DIFF_BACKENDS
+
+
+def build_diff_object(num_reactions, num_models, backend="dict"):
+    diff_object = DiffObject(num_models, backend)
+    compartment = diff_object.check_compartment_exists("cell")
+
+    for model_num in range(num_models):
+        for i in range(num_reactions):
+            species_id = "S%s" % i
+            product_id = "S%s" % (i + 1)
+            reaction_id = "R%s" % i
+            rate_law = "k * %s" % species_id
+            if i % 10 == 0 and model_num % 2:
+                rate_law = "k2 * %s" % species_id
+
+            compartment.add_species(species_id, False, species_id, False, model_num)
+            reaction = compartment.add_reaction(reaction_id, rate_law, reaction_id, rate_law, False, True, False,
+                                                model_num)
+            reaction.add_reactant_arrow(reaction_id, species_id, "1", model_num)
+            reaction.add_product_arrow(reaction_id, product_id, "1", model_num)
+            reaction.add_parameter_arrow(reaction_id, "k", "monotonic_increasing", model_num)
+            compartment.add_regulatory_arrow("S%s" % (i + 2), reaction_id, "monotonic_decreasing", model_num)
+
+    return diff_object
+
+
+def main():
+    max_reactions = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    num_models = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    backend = sys.argv[3] if len(sys.argv) > 3 else DIFF_BACKENDS[0]
+
+    num_reactions = max(1, max_reactions // 8)
+    while num_reactions <= max_reactions:
+        start = time.time()
+        build_diff_object(num_reactions, num_models, backend)
+        elapsed = time.time() - start
+        print("%6d reactions x %d models (%s): %.2fs (%.1f us per reaction per model)"
+              % (num_reactions, num_models, backend, elapsed, 1e6 * elapsed / (num_reactions * num_models)))
+        num_reactions *= 2
+
+
+if __name__ == "__main__":
+    main()
@@ -45,16 +45,46 @@ if __name__ == '__main__':
     parser.add_argument('--hide-params', help="Hide parameters modified by rules/events", action="store_true")
     parser.add_argument('--hide-rules', help="Do not show rules", action="store_true")
 
-    parser.add_argument('--sympy', help="Determine arrow directions symbolically using sympy", action="store_true")
+    parser.add_argument('--sympy', help="Determine arrow directions symbolically using sympy (equivalent to "
+                                        "--effect-engine sympy)", action="store_true")
+    parser.add_argument('--effect-engine', choices=sbml_diff.EFFECT_ENGINES,
+                        help="Method used to determine arrow directions: numeric (compare the rate at two "
+                             "concentrations), sampled (compare the rate at many concentrations), dual (evaluate the "
+                             "derivative of the rate exactly at many concentrations, using automatic differentiation), "
+                             "interval (prove the sign of the derivative using interval arithmetic, or use dual if it "
+                             "cannot be proved) or sympy. The default is dual for models with more than %s reactions, "
+                             "and otherwise numeric" % sbml_diff.LARGE_MODEL_REACTIONS)
+    parser.add_argument('--diff-backend', choices=sbml_diff.DIFF_BACKENDS, default="dict",
+                        help="How the models containing each feature are stored: dict (a set of models for each version "
+                             "of each feature, the default) or columnar (a presence matrix for each kind of feature, "
+                             "which uses less memory when comparing many models, but can be slower; requires numpy)")
+    parser.add_argument('--sympy-timeout', type=float, default=sbml_diff.DEFAULT_SYMPY_TIMEOUT,
+                        help="Time limit in seconds for determining each arrow direction using sympy; directions that "
+                             "take longer are determined numerically")
+
+    parser.add_argument('--stats', help="Report on stderr how many arrow directions were determined, and how many were "
+                                        "reused", action="store_true")
+
+    parser.add_argument('--parser', choices=sbml_diff.PARSERS, default=sbml_diff.DEFAULT_PARSER,
+                        help="XML parser to use: stream (incrementally extracts only the elements that are compared), "
+                             "lxml or bs4 (BeautifulSoup). The default is %s" % sbml_diff.DEFAULT_PARSER)
+
+    parser.add_argument('--jobs', '-j', type=int, default=1,
+                        help="Number of processes to use to parse input files, and to determine arrow directions "
+                             "using sympy")
+
+    parser.add_argument('--cache-dir', help="Directory in which to cache parsed input files, so that files which have "
+                                            "been seen before are not parsed again, and the direction of arrows "
+                                            "determined for each kinetic law")
+    parser.add_argument('--cache-size', type=int, default=sbml_diff.DEFAULT_CACHE_SIZE // (1024 * 1024),
+                        help="Maximum size of the cache directory in MB (least recently used files are removed first)")
 
     parser.add_argument('--complete', help="If no changes, exit quietly. Otherwise return param table, kinetic table," +
                                            " and DOT output", action="store_true")
 
-    if (sys.version_info > (3, 0)):
-        file_type = argparse.FileType('r', encoding='UTF-8')
-    else:
-        file_type = argparse.FileType('r')
-    parser.add_argument('infile', type=file_type, nargs="+", help="List of input SBML files")
+    parser.add_argument('infile', type=argparse.FileType('rb'), nargs="+",
+                        help="List of input SBML files (which may be compressed using gzip, bz2 or xz, or be zip files "
+                             "or COMBINE archives containing a model)")
 
     args = parser.parse_args()
 
@@ -117,21 +147,40 @@ if __name__ == '__main__':
     if args.sympy:
         use_sympy = True
 
+    # If only tables or an abstract network are requested, only the parts of each model that these use are loaded
+    sections = None
+    if not args.complete and (args.kinetics or args.params or args.abstract):
+        sections = set()
+        for output, requested in [("kinetics", args.kinetics), ("params", args.params), ("abstract", args.abstract)]:
+            if requested:
+                sections.update(sbml_diff.OUTPUT_SECTIONS[output])
+        sections = sorted(sections)
+
     all_models = []
     all_model_names = []
     for inFile in args.infile:
-        model_string = inFile.read()
-        all_models.append(model_string)
+        # the file is decompressed and parsed as it is read, or (if uncompressed) parsed directly from a memory map;
+        # with several jobs, files are instead reopened by name in the worker processes, which map them there
+        try:
+            all_models.append(compression.open_model(inFile, mapped=args.jobs == 1))
+        except (ValueError, IOError, EOFError) as e:
+            sys.exit("Could not read %s: %s" % (inFile.name, e))
 
         file_name = os.path.basename(os.path.split(inFile.name)[1])
-        all_model_names.append(os.path.splitext(file_name)[0])
+        name, extension = os.path.splitext(file_name)
+        if extension in [".gz", ".bz2", ".xz"]:
+            name = os.path.splitext(name)[0]
+        all_model_names.append(name)
 
     output_formatter = sbml_diff.GenerateDot(all_colors, num_files, reaction_label=reaction_labels,
                                              selected_model=selected_model, show_stoichiometry=args.stoich,
                                              rankdir=rankdir, model_names=all_model_names)
 
     sd = sbml_diff.SBMLDiff(all_models, all_model_names, output_formatter, align=align, cartoon=cartoon,
-                            show_params=show_params, hide_rules=hide_rules, use_sympy=use_sympy)
+                            show_params=show_params, hide_rules=hide_rules, use_sympy=use_sympy, parser=args.parser,
+                            jobs=args.jobs, cache_dir=args.cache_dir, cache_size=args.cache_size * 1024 * 1024,
+                            sections=sections, sympy_timeout=args.sympy_timeout, effect_engine=args.effect_engine,
+                            diff_backend=args.diff_backend)
 
     if args.complete:
 
@@ -140,6 +189,8 @@ if __name__ == '__main__':
         sd.compare_params()
         print("")
         sd.diff_models()
+        if args.stats:
+            sd.report_classifications()
 
         if output_formatter.differences_found:
             # print results
@@ -179,6 +230,9 @@ if __name__ == '__main__':
     except RuntimeError as e:
         sys.exit(e.args[0])
 
+    if args.stats:
+        sd.report_classifications()
+
     # Print results
     sys.stdout = old_stdout
 
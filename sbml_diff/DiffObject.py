@@ -1,43 +1,123 @@
-import collections
-from functools import reduce
+# Ways of storing which models contain each feature (see DiffObject)
+DIFF_BACKENDS = ["dict", "columnar"]
+
+
+def model_bit(model_num):
+    """
+    Model sets are stored as integers, in which bit i is set if the model with index i is in the set (so that the union
+    and intersection of model sets are computed by | and &). This returns the set containing only the given model.
+    """
+    return 1 << model_num
+
+
+def all_models(num_models):
+    """The model set containing every one of num_models models"""
+    return (1 << num_models) - 1
+
+
+def count_models(model_set):
+    """The number of models in a model set"""
+    return bin(model_set).count("1")
+
+
+def model_indexes(model_set):
+    """The indexes of the models in a model set, in increasing order"""
+    indexes = []
+    model_num = 0
+    while model_set:
+        if model_set & 1:
+            indexes.append(model_num)
+        model_set >>= 1
+        model_num += 1
+    return indexes
+
+
+def new_diff_element(kind):
+    """Create a DiffElement (kind, the kind of feature it represents, is only used by the columnar backend)"""
+    return DiffElement()
 
 
 class DiffObject:
-    def __init__(self):
+    def __init__(self, num_models=None, backend="dict"):
+        """
+
+        Parameters
+        ----------
+        num_models : number of models being compared (required by the columnar backend)
+        backend : how the models containing each feature are stored (one of DIFF_BACKENDS): "dict" stores each
+            element's versions in a dict of model sets, and "columnar" stores the versions of every element of the same
+            kind in a single PresenceMatrix (see presence_matrix.py), which uses less memory when comparing many models
+            but is slower to build
+        """
+        if backend not in DIFF_BACKENDS:
+            raise ValueError("Unknown backend '%s' (must be one of %s)" % (backend, ", ".join(DIFF_BACKENDS)))
+
+        # Presence matrix for each kind of feature (if the columnar backend is used)
+        self.matrices = {}
+        self.num_models = num_models
+        self.backend = backend
+        self.new_element = new_diff_element
+        if backend == "columnar":
+            self.new_element = self.new_columnar_element
+
         self.compartments = {}
         self.add_compartment("NONE")
         self.events = []  # should probably be moved into compartment ?
         self.param_nodes = []
 
     def add_compartment(self, compartment_id):
-        self.compartments[compartment_id] = DiffCompartment()
+        self.compartments[compartment_id] = DiffCompartment(self.new_element)
         return self.compartments[compartment_id]
 
     def check_compartment_exists(self, compartment):
-        if compartment not in list(self.compartments.keys()):
+        if compartment not in self.compartments:
             self.add_compartment(compartment)
         return self.compartments[compartment]
 
     def add_event(self):
-        new_event = DiffEvent()
+        new_event = DiffEvent(self.new_element)
         self.events.append(new_event)
         return new_event
 
     def add_param_node(self, variable_id, variable_name, model_set):
         self.param_nodes.append({"variable_id": variable_id, "variable_name": variable_name, "model_set": model_set})
 
+    def new_columnar_element(self, kind):
+        """Create a ColumnarDiffElement, whose versions are stored in the presence matrix for this kind of feature"""
+        from .presence_matrix import ColumnarDiffElement, PresenceMatrix
+
+        if kind not in self.matrices:
+            self.matrices[kind] = PresenceMatrix(self.num_models)
+        return ColumnarDiffElement(self.matrices[kind])
+
+    def similarity(self):
+        """
+        Compute the similarity of each pair of models, from the features drawn for each (requires the columnar backend).
+
+        Returns
+        -------
+        array in which entry [i, j] is the Jaccard index of the sets of features present in models i and j (see
+        presence_matrix.similarity)
+        """
+        if self.backend != "columnar":
+            raise ValueError("Computing the similarity of models requires the columnar backend")
+
+        from .presence_matrix import similarity
+        return similarity(list(self.matrices.values()), self.num_models)
+
 
 class DiffCompartment:
-    def __init__(self):
+    def __init__(self, new_element=new_diff_element):
+        self.new_element = new_element
         self.species = {}
-        self.regulatory_arrows = DiffElement()
+        self.regulatory_arrows = new_element("regulatory_arrow")
         self.reactions = {}
         self.rules = []
 
     def add_species(self, species_id, is_boundary, species_name, elided, model_num):
 
-        if species_id not in list(self.species.keys()):
-            self.species[species_id] = DiffElement()
+        if species_id not in self.species:
+            self.species[species_id] = self.new_element("species")
 
         self.species[species_id].add({"species_id": species_id, "is_boundary": is_boundary, "species_name": species_name,
                           "elided": elided}, model_num)
@@ -47,36 +127,37 @@ class DiffCompartment:
                                     "arrow_direction": arrow_direction}, model_num)
 
     def add_reaction(self, reaction_id, rate_law, reaction_name, converted_rate_law, is_fast, is_irreversible, is_transcription, model_num):
-        if reaction_id not in list(self.reactions.keys()):
-            self.reactions[reaction_id] = DiffReaction(reaction_id)
+        if reaction_id not in self.reactions:
+            self.reactions[reaction_id] = DiffReaction(reaction_id, self.new_element)
 
         self.reactions[reaction_id].add_instance(rate_law, reaction_name, converted_rate_law, is_fast, is_irreversible, is_transcription, model_num)
 
         return self.reactions[reaction_id]
 
     def add_rule(self, rule_id):
-        new_rule = DiffRule(rule_id)
+        new_rule = DiffRule(rule_id, self.new_element)
         self.rules.append(new_rule)
         return new_rule
 
 class DiffEventAssignment:
-    def __init__(self):
-        self.affect_value_arrows = DiffElement()
-        self.affect_value_param_arrows = DiffElement()
-        self.math_expr = DiffElement()
+    def __init__(self, new_element=new_diff_element):
+        self.affect_value_arrows = new_element("assignment_affect_value_arrow")
+        self.affect_value_param_arrows = new_element("assignment_param_arrow")
+        self.math_expr = new_element("assignment_math")
 
 
 class DiffEvent:
-    def __init__(self):
+    def __init__(self, new_element=new_diff_element):
+        self.new_element = new_element
         self.event = {}
-        self.trigger_arrows = DiffElement()
+        self.trigger_arrows = new_element("event_trigger_arrow")
         self.assignments = {}
-        self.trigger_math = DiffElement()
-        self.trigger_params = DiffElement()
+        self.trigger_math = new_element("event_trigger_math")
+        self.trigger_params = new_element("event_trigger_param")
 
     def check_target_exists(self, target):
-        if target not in list(self.assignments.keys()):
-            self.assignments[target] = DiffEventAssignment()
+        if target not in self.assignments:
+            self.assignments[target] = DiffEventAssignment(self.new_element)
 
     def set_event(self, event_hash, event_name, model_set):
         self.event = {"event_hash": event_hash, "event_name": event_name, "model_set": model_set}
@@ -106,13 +187,13 @@ class DiffEvent:
 
 
 class DiffRule:
-    def __init__(self, rule_id):
+    def __init__(self, rule_id, new_element=new_diff_element):
         self.rule_id = rule_id
-        self.algebraic_arrows = DiffElement()
-        self.modifier_arrows = DiffElement()
-        self.target_arrows = DiffElement()
-        self.parameter_arrows = DiffElement()
-        self.rate_laws = DiffElement()
+        self.algebraic_arrows = new_element("rule_algebraic_arrow")
+        self.modifier_arrows = new_element("rule_modifier_arrow")
+        self.target_arrows = new_element("rule_target_arrow")
+        self.parameter_arrows = new_element("rule_parameter_arrow")
+        self.rate_laws = new_element("rule_rate_law")
 
     def add_rate_law(self, model_num, converted_rate_law):
         self.rate_laws.add({"converted_rate_law": converted_rate_law}, model_num)
@@ -131,12 +212,13 @@ class DiffRule:
 
 
 class DiffReaction:
-    def __init__(self, reaction_id):
+    def __init__(self, reaction_id, new_element=new_diff_element):
         self.reaction_id = reaction_id
-        self.reaction_node = DiffElement()
+        self.new_element = new_element
+        self.reaction_node = new_element("reaction")
         self.reactant_arrows = {}
         self.product_arrows = {}
-        self.transcription_reaction_nodes = DiffElement()
+        self.transcription_reaction_nodes = new_element("transcription_reaction")
         self.transcription_product_arrows = {}
         self.parameter_arrows = {}
 
@@ -146,13 +228,13 @@ class DiffReaction:
                                 "is_irreversible": is_irreversible, "is_transcription": is_transcription}, model_num)
 
     def add_reactant_arrow(self, reaction_id, reactant, stoich, model_num):
-        if reactant not in list(self.reactant_arrows.keys()):
-            self.reactant_arrows[reactant] = DiffElement()
+        if reactant not in self.reactant_arrows:
+            self.reactant_arrows[reactant] = self.new_element("reactant_arrow")
         self.reactant_arrows[reactant].add({"reaction_id": reaction_id, "reactant": reactant, "stoich": stoich}, model_num)
 
     def add_product_arrow(self, reaction_id, product, stoich, model_num):
-        if product not in list(self.product_arrows.keys()):
-            self.product_arrows[product] = DiffElement()
+        if product not in self.product_arrows:
+            self.product_arrows[product] = self.new_element("product_arrow")
 
         self.product_arrows[product].add({"reaction_id": reaction_id, "product": product, "stoich": stoich}, model_num)
 
@@ -162,39 +244,42 @@ class DiffReaction:
                  "reaction_name": reaction_name, "converted_law": converted_law, "product_status": product_status}, model_num)
 
     def add_transcription_product_arrow(self, reaction_id, product, stoich, model_num):
-        if product not in list(self.transcription_product_arrows.keys()):
-            self.transcription_product_arrows[product] = DiffElement()
+        if product not in self.transcription_product_arrows:
+            self.transcription_product_arrows[product] = self.new_element("transcription_product_arrow")
         self.transcription_product_arrows[product].add({"reaction_id": reaction_id, "product": product, "stoich": stoich}, model_num)
 
     def add_parameter_arrow(self, reaction_id, param, arrow_direction, model_num):
-        if param not in list(self.parameter_arrows.keys()):
-            self.parameter_arrows[param] = DiffElement()
+        if param not in self.parameter_arrows:
+            self.parameter_arrows[param] = self.new_element("reaction_parameter_arrow")
 
         self.parameter_arrows[param].add({"reaction_id": reaction_id, "param": param, "arrow_direction": arrow_direction}, model_num)
 
 
 class DiffElement:
+    __slots__ = ["record"]
+
     def __init__(self):
         self.record = {}
 
     def add(self, data_tuple, model_num):
         data_tuple = FrozenDict(data_tuple)
-        if data_tuple not in list(self.record.keys()):
-            self.record[data_tuple] = set()
-        self.record[data_tuple].add(model_num)
+        self.record[data_tuple] = self.record.get(data_tuple, 0) | (1 << model_num)
 
     def get_models(self):
-        return list(reduce(lambda x,y: x.union(self.record[y]), list(self.record.keys()), set()))
+        model_set = 0
+        for models in self.record.values():
+            model_set |= models
+        return model_set
 
     def get_data(self):
         return list(self.record.keys())
 
     def all_equal(self):
-        return len(list(self.record.values())) == 1
+        return len(self.record) == 1
 
     def compare(self):
         if self.all_equal():
-            return list(self.record.values())[0]
+            return next(iter(self.record.values()))
         else:
             return "different"
 
@@ -212,17 +297,20 @@ class DiffElement:
 
     def find_models(self, attribute_name, value):
 
-        model_set = set()
+        model_set = 0
         for data_tuple in self.record:
-            if attribute_name in list(data_tuple.keys()) and data_tuple[attribute_name] == value:
-                model_set = model_set.union(self.record[data_tuple])
+            if attribute_name in data_tuple and data_tuple[attribute_name] == value:
+                model_set |= self.record[data_tuple]
         return model_set
 
-class FrozenDict(collections.Mapping):
-    """This class is from https://stackoverflow.com/posts/2705638/revisions"""
+
+class FrozenDict(object):
+    """An immutable mapping of attribute names to values, whose hash is computed once, when it is created"""
+    __slots__ = ["_d", "_hash"]
 
     def __init__(self, *args, **kwargs):
         self._d = dict(*args, **kwargs)
+        self._hash = hash(frozenset(self._d.items()))
 
     def __iter__(self):
         return iter(self._d)
@@ -230,8 +318,34 @@ class FrozenDict(collections.Mapping):
     def __len__(self):
         return len(self._d)
 
+    def __contains__(self, key):
+        return key in self._d
+
     def __getitem__(self, key):
         return self._d[key]
 
+    def __eq__(self, other):
+        if not isinstance(other, FrozenDict):
+            return False
+        return self._hash == other._hash and self._d == other._d
+
+    def __ne__(self, other):
+        return not self == other
+
     def __hash__(self):
-        return hash(tuple(sorted(self._d.items())))
\ No newline at end of file
+        return self._hash
+
+    def __repr__(self):
+        return "FrozenDict(%r)" % self._d
+
+    def get(self, key, default=None):
+        return self._d.get(key, default)
+
+    def keys(self):
+        return self._d.keys()
+
+    def values(self):
+        return self._d.values()
+
+    def items(self):
+        return self._d.items()
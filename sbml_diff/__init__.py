@@ -1 +1,5 @@
-__all__ = ["accessor_functions", "effect_direction", "generate_dot", "rate_laws", "sbml_diff"]
+__version__ = "1.0"
+
+__all__ = ["accessor_functions", "cache", "compression", "document", "effect_direction", "generate_dot",
+           "interval_arithmetic", "ir", "model_index", "presence_matrix", "rate_laws", "sbml_diff",
+           "streaming"]
@@ -1,4 +1,5 @@
 from .effect_direction import categorise_interaction
+from .rate_laws import math_variables
 
 
 def get_params(model):
@@ -8,7 +9,7 @@ def get_params(model):
 
     Parameters
     ----------
-    model : bs4.BeautifulSoup object produced by parsing an SBML model
+    model : Model (intermediate representation of an SBML model)
         
 
     Returns
@@ -17,35 +18,37 @@ def get_params(model):
     param_values : a dict whose keys are the id of a parameter, and values are corresponding parameter values
 
     """
-    param_ids = []
     param_values = {}
 
-    if not model.select_one("listOfParameters"):
-        return set(), param_values
-
-    for param in model.select_one("listOfParameters").select("parameter"):
-        param_id = param.attrs["id"]
-        param_ids.append(param_id)
+    for param_id in model.parameters:
+        param = model.parameters[param_id]
 
         param_values[param_id] = "?"
-        if "value" in list(param.attrs.keys()):
-            param_values[param_id] = param.attrs["value"]
+        if param.value is not None:
+            param_values[param_id] = param.value
 
-    return set(param_ids), param_values
+    return set(model.parameters.keys()), param_values
 
 
-def get_regulatory_arrow(model, compartment, reactions, species_compartments, initial_values, elided_reactions=False, use_sympy=False):
+def get_regulatory_arrow(model, compartment, reactions=None, species_compartments=None, initial_values=None,
+                         elided_reactions=False, use_sympy=False):
     """
     Find all regulatory interactions in a particular compartment of a model, and construct an array of strings
     representing these.
     A regulatory interaction exists if a kinetic law includes a species id that is not a reactant.
 
+    To find the interactions in every compartment, use get_regulatory_arrows(), which needs only one pass over the
+    reactions.
+
     Parameters
     ----------
-    model : bs4.BeautifulSoup object produced by parsing an SBML model
+    model : Model (intermediate representation of an SBML model)
         
     compartment : the id of a compartment
 
+    reactions, species_compartments, initial_values : ignored, as these are now found from the model (they are kept so
+        that existing callers, which pass them positionally, still work)
+
     elided_reactions : a list of reactions, for which the corresponding reactions are not drawn
         
 
@@ -54,39 +57,63 @@ def get_regulatory_arrow(model, compartment, reactions, species_compartments, in
     arrows : an array, each element of which is a string representing a regulatory interaction
 
     """
-    if not elided_reactions:
-        elided_reactions = []
+    return get_regulatory_arrows(model, elided_reactions, use_sympy).get(compartment, [])
+
+
+def get_regulatory_arrows(model, elided_reactions=False, use_sympy=False, engine=None, cache=None, memo=None):
+    """
+    Find all regulatory interactions in a model, grouped by the compartment of the regulating species.
+
+    Each reaction is visited once, and the set of its reactants is only constructed once, so this takes time
+    proportional to the total size of the kinetic laws.
+
+    Parameters
+    ----------
+    model : Model (intermediate representation of an SBML model)
+
+    elided_reactions : a list of reactions, for which the corresponding reactions are not drawn
+
+    engine : method used to determine the direction of each interaction (see effect_direction.categorise_interaction)
+
+    cache : a cache.ClassificationCache, or None
+
+    memo : an effect_direction.InteractionMemo, or None
+
 
-    species_ids = get_species(model, compartment)
+    Returns
+    -------
+    arrows : a dict, whose keys are compartment ids and values are arrays of tuples (species id, reaction id,
+        direction) representing the regulatory interactions in that compartment
 
-    arrows = []
+    """
+    elided_reactions = set(elided_reactions or [])
 
-    if not reactions:
-        return arrows
+    arrows = {}
 
-    for reaction_id in reactions:
-        reaction = reactions[reaction_id]
+    for reaction_id, reaction in model.reactions.items():
         if reaction in elided_reactions:
             continue
 
-        kinetic_law = reaction.select_one("kineticLaw")
-        if not kinetic_law:
+        rate_law = reaction.rate_law
+        if not rate_law:
             continue
 
-        for ci in kinetic_law.select("ci"):
+        reactant_ids = set(reaction.reactant_ids)
+
+        for species_id in math_variables(rate_law):
 
-            # Check if this is a species id (it could validly be a species/compartment/parameter/function/reaction id)
-            species_id = ci.string.strip()
-            if species_id not in species_ids:
+            # Check if this is a species id (it could validly be a species/compartment/parameter/reaction id)
+            if species_id not in model.species:
                 continue
 
             # if not a reactant, add regulatory arrow
-            reactant_list, product_list, compartment, rate_law, _, _ = get_reaction_details(model, reaction, species_compartments)
-            if species_id in reactant_list:
+            if species_id in reactant_ids:
                 continue
 
-            arrow_direction = categorise_interaction(kinetic_law, species_id, initial_values, use_sympy=use_sympy)
-            arrows.append((species_id, reaction_id, arrow_direction))
+            arrow_direction = categorise_interaction(rate_law, species_id, model.initial_values, use_sympy=use_sympy,
+                                                     engine=engine, cache=cache, memo=memo)
+            compartment = model.species[species_id].compartment
+            arrows.setdefault(compartment, []).append((species_id, reaction_id, arrow_direction))
 
     return arrows
 
@@ -97,7 +124,7 @@ def get_species(model, compartment_id):
 
     Parameters
     ----------
-    model : bs4.BeautifulSoup object produced by parsing an SBML model
+    model : Model (intermediate representation of an SBML model)
         
     compartment_id : the id of a compartment
         
@@ -107,23 +134,17 @@ def get_species(model, compartment_id):
     ids : array listing id for each species in model
 
     """
-    ids = []
-    species_list = model.select_one("listOfSpecies")
-    if species_list:
-        for s in species_list.select("species"):
-            if s.attrs["compartment"] == compartment_id:
-                ids.append(s.attrs["id"])
-    return ids
+    return model.species_in_compartment.get(compartment_id, [])
 
 
-def get_species_compartment(model, species_id, species_compartments):
+def get_species_compartment(model, species_id):
     """
     Get the id of the compartment containing a species.
     Report params as belonging to compartment 'NONE'
 
     Parameters
     ----------
-    model : bs4.BeautifulSoup object produced by parsing an SBML model
+    model : Model (intermediate representation of an SBML model)
         
     species_id : id of the species
         
@@ -133,17 +154,12 @@ def get_species_compartment(model, species_id, species_compartments):
     compartment : id of the compartment
 
     """
+    if species_id in model.species:
+        return model.species[species_id].compartment
+    return "NONE"
 
-    if not species_compartments:
-        return "NONE"
 
-    if species_id in list(species_compartments.keys()):
-        return species_compartments[species_id]
-    else:
-        return "NONE"
-
-
-def get_reaction_details(model, reaction, species_compartments):
+def get_reaction_details(model, reaction):
     """
     Get details of a single reaction.
 
@@ -151,9 +167,9 @@ def get_reaction_details(model, reaction, species_compartments):
 
     Parameters
     ----------
-    model : bs4.BeautifulSoup object produced by parsing an SBML model
+    model : Model (intermediate representation of an SBML model)
 
-    reaction : bs4.BeautifulSoup object of the reaction of interest
+    reaction : Reaction of interest
 
 
     Returns
@@ -164,7 +180,7 @@ def get_reaction_details(model, reaction, species_compartments):
 
     compartment : id of compartment
 
-    rate_law : BautifulSoup object containing math element of kineticLaw
+    rate_law : MathExpr for the math element of kineticLaw
 
     reactant_stoichiometries : list of stoichiometries of reactants
 
@@ -175,57 +191,15 @@ def get_reaction_details(model, reaction, species_compartments):
     if not reaction:
         return [], [], False, False, [], []
 
-    reactants = reaction.select_one("listOfReactants")
-    reactant_list = []
-    reactant_stoichiometries = []
-    compartment = ""
-    if reactants:
-        for r in reactants.select("speciesReference"):
-
-            if "stoichiometry" in r.attrs:
-                stoich = r.attrs["stoichiometry"]
-            else:
-                stoich = "1"
-
-            reactant_stoichiometries.append(stoich)
-
-            species = r.attrs["species"]
-            reactant_list.append(species)
-
-            if not compartment:
-                compartment = get_species_compartment(model, species, species_compartments)
-            if compartment != get_species_compartment(model, species, species_compartments):
-                compartment = "NONE"
-
-    products = reaction.select_one("listOfProducts")
-    product_list = []
-    product_stoichiometries = []
-    if products:
-        for r in products.select("speciesReference"):
-
-            if "stoichiometry" in r.attrs:
-                stoich = r.attrs["stoichiometry"]
-            else:
-                stoich = "1"
-
-            product_stoichiometries.append(stoich)
-
-            species = r.attrs["species"]
-            product_list.append(species)
-
-            # if reaction has no reactants, try to categorise by products instead
-            if not compartment:
-                compartment = get_species_compartment(model, species, species_compartments)
-            if compartment != get_species_compartment(model, species, species_compartments):
-                compartment = "NONE"
-
-    kinetic_law = reaction.select_one("kineticLaw")
-    if kinetic_law:
-        rate_law = kinetic_law.select_one("math")
-    else:
+    reactant_stoichiometries = [ref.stoichiometry for ref in reaction.reactants]
+    product_stoichiometries = [ref.stoichiometry for ref in reaction.products]
+
+    rate_law = reaction.rate_law
+    if rate_law is None:
         rate_law = ""
 
-    return reactant_list, product_list, compartment, rate_law, reactant_stoichiometries, product_stoichiometries
+    return reaction.reactant_ids, reaction.product_ids, reaction.compartment, rate_law, reactant_stoichiometries, \
+        product_stoichiometries
 
 
 def get_reactions(model):
@@ -234,7 +208,7 @@ def get_reactions(model):
 
     Parameters
     ----------
-    model : bs4.BeautifulSoup object produced by parsing an SBML model
+    model : Model (intermediate representation of an SBML model)
         
 
     Returns
@@ -242,24 +216,16 @@ def get_reactions(model):
     reactions : list containing id for every reaction in model
 
     """
-    reactions = []
-
-    reaction_list = model.select_one("listOfReactions")
-    if not reaction_list:
-        return reactions
+    return list(model.reactions.keys())
 
-    for r in reaction_list.select("reaction"):
-        reactions.append(r.attrs["id"])
-    return reactions
 
-
-def get_rule_details(model, target_id, species_compartments):
+def get_rule_details(model, target_id):
     """
     Given the id of a species affected by a rule, find details of that rule.
 
     Parameters
     ----------
-    model : bs4.BeautifulSoup object produced by parsing an SBML model
+    model : Model (intermediate representation of an SBML model)
         
     target_id : the id of the species being affected
         
@@ -272,36 +238,29 @@ def get_rule_details(model, target_id, species_compartments):
 
     compartment : the id of the compartment containing the target
 
-    rate_law : BeautifulSoup object containing the math element for the rule
+    rate_law : MathExpr for the math element of the rule
 
     """
-    rule = model.select_one("listOfRules").find(variable=target_id)
-
-    species_ids = []
-    species_list = model.select_one("listOfSpecies")
-    if species_list:
-        for s in species_list.select("species"):
-            species_ids.append(s.attrs["id"])
+    rule = model.rules.get(target_id)
 
     if not rule:
         return [], False, False
 
-    target = rule.attrs["variable"]
+    target = rule.variable
 
     # get modifier details
     modifiers = []
-    for ci in rule.select("ci"):
+    if rule.math:
+        for species_id in math_variables(rule.math):
 
-        # Check if this is a species id (it could validly be a species/compartment/parameter/function/reaction id)
-        species_id = ci.string.strip()
-        if species_id not in species_ids:
-            continue
+            # Check if this is a species id (it could validly be a species/compartment/parameter/reaction id)
+            if species_id not in model.species:
+                continue
 
-        modifiers.append(species_id)
+            modifiers.append(species_id)
 
-    compartment = get_species_compartment(model, target, species_compartments).strip()
-    rate_law = rule.select_one("math")
-    return modifiers, compartment, rate_law
+    compartment = get_species_compartment(model, target).strip()
+    return modifiers, compartment, rule.math
 
 
 def get_variables_set_by_rules(model):
@@ -311,7 +270,7 @@ def get_variables_set_by_rules(model):
 
     Parameters
     ----------
-    model : bs4.BeautifulSoup object produced by parsing an SBML model
+    model : Model (intermediate representation of an SBML model)
         
 
     Returns
@@ -319,17 +278,7 @@ def get_variables_set_by_rules(model):
     list containing id of each species set by a rate or assignment rule
 
     """
-    species = []
-    rule_list = model.select_one("listOfRules")
-
-    if not rule_list:
-        return []
-
-    for r in rule_list.select("assignmentRule"):
-        species.append(r.attrs["variable"])
-    for r in rule_list.select("rateRule"):
-        species.append(r.attrs["variable"])
-    return species
+    return list(model.rules.keys())
 
 
 def get_species_name(model, species_id):
@@ -338,7 +287,7 @@ def get_species_name(model, species_id):
 
     Parameters
     ----------
-    model : bs4.BeautifulSoup object produced by parsing an SBML model
+    model : Model (intermediate representation of an SBML model)
         
     species_id : id of the species
         
@@ -348,9 +297,9 @@ def get_species_name(model, species_id):
     name of the species, if set (otherwise returns the id)
 
     """
-    s = model.select_one("listOfSpecies").find(id=species_id)
-    if "name" in list(s.attrs.keys()) and s.attrs["name"]:
-        return s.attrs["name"]
+    s = model.species[species_id]
+    if s.name:
+        return s.name
     else:
         return species_id
 
@@ -361,7 +310,7 @@ def get_reaction_name(model, reaction_id):
 
     Parameters
     ----------
-    model : bs4.BeautifulSoup object produced by parsing an SBML model
+    model : Model (intermediate representation of an SBML model)
         
     reaction_id : id of the reaction
         
@@ -371,8 +320,8 @@ def get_reaction_name(model, reaction_id):
     name of the reaction, if set (otherwise returns the id)
 
     """
-    r = model.select_one("listOfReactions").find(id=reaction_id)
-    if "name" in list(r.attrs.keys()) and r.attrs["name"]:
-        return r.attrs["name"]
+    reaction = model.reactions[reaction_id]
+    if reaction.name:
+        return reaction.name
     else:
         return reaction_id
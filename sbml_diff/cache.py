@@ -0,0 +1,300 @@
+import hashlib
+import os
+import pickle
+import tempfile
+import time
+from . import __version__
+from .compression import BUFFER_TYPES
+from .ir import IR_VERSION
+from .streaming import gc_paused
+
+try:
+    import sqlite3
+except ImportError:
+    sqlite3 = None
+
+# Default limit on the total size of the files in a cache directory, in bytes
+DEFAULT_CACHE_SIZE = 512 * 1024 * 1024
+
+CACHE_FILE_SUFFIX = ".pickle"
+
+# Name of the database, within a cache directory, in which the effects of species on expressions are stored
+CLASSIFICATION_CACHE_FILE = "classifications.sqlite"
+
+# Default limit on the number of results stored in a ClassificationCache
+DEFAULT_CLASSIFICATION_CACHE_ENTRIES = 200000
+
+
+class ModelCache:
+    """
+    A directory containing the extracted representation of previously parsed models.
+
+    Each entry holds the Model extracted from an SBML file (containing its species, reactions, kinetic laws, parameters,
+    rules, events and MIRIAM identifiers), so that a model that has been seen before can be loaded without parsing any
+    XML.
+
+    Entries are keyed by a hash of the model's content and the sbml-diff version, so they are never reused by a
+    different version. When the total size of the cache exceeds max_size, the least recently used entries are removed.
+    """
+
+    def __init__(self, directory, max_size=DEFAULT_CACHE_SIZE):
+        """
+
+        Parameters
+        ----------
+        directory : path of the cache directory (created if it does not exist)
+        max_size : maximum total size of the cache entries, in bytes
+
+        """
+        self.directory = directory
+        self.max_size = max_size
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def key(self, model_string, sections=None):
+        """
+        Compute the cache key for a model.
+
+        Parameters
+        ----------
+        model_string : an SBML model as a string, bytes, memoryview or mmap, or a file object (which is read in chunks,
+            then rewound)
+        sections : the sections of the model that are extracted (see ir.extract_model), or None for every section
+
+        Returns
+        -------
+        key : hex digest identifying the model's content, the extracted sections, the sbml-diff version and the version
+            of the extracted representation (ir.IR_VERSION)
+        model_string : the model, to be used in place of the argument (a file that cannot be rewound is replaced by its
+            content)
+
+        """
+        digest = hashlib.sha256(("sbml-diff %s ir %s\n" % (__version__, IR_VERSION)).encode("utf-8"))
+        if sections is not None:
+            digest.update(("sections %s\n" % ",".join(sorted(set(sections)))).encode("utf-8"))
+
+        if isinstance(model_string, BUFFER_TYPES) and not isinstance(model_string, bytes):
+            # hash the buffer (e.g. a memory-mapped file) in place
+            digest.update(model_string)
+            return digest.hexdigest(), model_string
+
+        if hasattr(model_string, "read"):
+            if hasattr(model_string, "seekable") and not model_string.seekable():
+                model_string = model_string.read()
+            else:
+                source = getattr(model_string, "buffer", model_string)
+                position = source.tell()
+                for chunk in iter(lambda: source.read(1 << 20), b""):
+                    digest.update(chunk)
+                source.seek(position)
+                return digest.hexdigest(), model_string
+
+        if not isinstance(model_string, bytes):
+            digest.update(model_string.encode("utf-8"))
+        else:
+            digest.update(model_string)
+        return digest.hexdigest(), model_string
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + CACHE_FILE_SUFFIX)
+
+    def get(self, key):
+        """
+        Load a cached model.
+
+        Parameters
+        ----------
+        key : cache key produced by key()
+
+        Returns
+        -------
+        the Model stored under the key, or None if there is no such entry
+
+        """
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                with gc_paused():
+                    entry = pickle.load(f)
+        except (IOError, OSError):
+            return None
+        except Exception:
+            # Discard entries that are truncated or otherwise unreadable
+            self._remove(path)
+            return None
+
+        # Record the use of this entry, for least recently used eviction
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        return entry
+
+    def put(self, key, model):
+        """
+        Store a model, then evict entries if the cache is too large.
+
+        Parameters
+        ----------
+        key : cache key produced by key()
+        model : the Model to store
+
+        """
+        # Write to a temporary file first, so that other processes never see a partially written entry
+        handle, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(handle, "wb") as f:
+                pickle.dump(model, f, pickle.HIGHEST_PROTOCOL)
+            os.rename(temp_path, self._path(key))
+        except Exception:
+            self._remove(temp_path)
+            raise
+
+        self.evict()
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the total size of the cache is at most max_size.
+        """
+        entries = []
+        total_size = 0
+        for file_name in os.listdir(self.directory):
+            if not file_name.endswith(CACHE_FILE_SUFFIX):
+                continue
+            path = os.path.join(self.directory, file_name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total_size += stat.st_size
+
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            self._remove(path)
+            total_size -= size
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+class ClassificationCache:
+    """
+    A SQLite database containing the previously determined effect of species on expressions (see
+    effect_direction.categorise_interaction).
+
+    Results are keyed by the signature of the expression (see rate_laws.canonical_signature), the position of the
+    species among its variables, the method used to classify the interaction, the initial values of the variables and
+    the sbml-diff version. As the signature does not depend on the names of the variables, a kinetic law that is used
+    by many models is only classified once, whatever its species and parameters are called.
+
+    New results, and the times at which results are used, are held in memory until flush() is called, when they are
+    written in a single transaction. The least recently used results are then removed, if there are more than
+    max_entries.
+    """
+
+    def __init__(self, path, max_entries=DEFAULT_CLASSIFICATION_CACHE_ENTRIES):
+        """
+
+        Parameters
+        ----------
+        path : path of the database file (created if it does not exist)
+        max_entries : maximum number of results stored
+
+        """
+        if sqlite3 is None:
+            raise ValueError("Caching classifications requires the sqlite3 module")
+
+        self.path = path
+        self.max_entries = max_entries
+        self.new_results = {}
+        self.used = {}
+
+        try:
+            self.connection = self._connect()
+        except sqlite3.DatabaseError:
+            # Discard a database that is corrupt or otherwise unreadable
+            ModelCache._remove(path)
+            self.connection = self._connect()
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=30)
+        connection.execute("CREATE TABLE IF NOT EXISTS classifications (key TEXT PRIMARY KEY, result TEXT, used REAL)")
+        connection.execute("CREATE INDEX IF NOT EXISTS classifications_used ON classifications (used)")
+        connection.commit()
+        return connection
+
+    @staticmethod
+    def _digest(key):
+        # Results are stored under a digest of the key and the sbml-diff version, so are never reused by a different
+        # version
+        return hashlib.sha256(repr((__version__,) + key).encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """
+        Look up a result.
+
+        Parameters
+        ----------
+        key : key produced by effect_direction.interaction_key()
+
+        Returns
+        -------
+        the result stored under the key, or None if there is no such entry
+
+        """
+        key = self._digest(key)
+        result = self.new_results.get(key)
+        if result is None:
+            row = self.connection.execute("SELECT result FROM classifications WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            result = row[0]
+
+        # Record the use of this entry, for least recently used eviction
+        self.used[key] = time.time()
+        return result
+
+    def put(self, key, result):
+        """
+        Store a result (which is written to the database by flush()).
+
+        Parameters
+        ----------
+        key : key produced by effect_direction.interaction_key()
+        result : string representing the sign of the interaction
+
+        """
+        key = self._digest(key)
+        self.new_results[key] = result
+        self.used[key] = time.time()
+
+    def flush(self):
+        """
+        Write new results, and the times at which results were used, to the database, then remove the least recently
+        used results if there are more than max_entries.
+        """
+        if not self.used:
+            return
+
+        with self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO classifications (key, result, used) VALUES (?, ?, ?)",
+                                        [(key, result, self.used[key]) for key, result in self.new_results.items()])
+            self.connection.executemany("UPDATE classifications SET used = ? WHERE key = ?",
+                                        [(used, key) for key, used in self.used.items()
+                                         if key not in self.new_results])
+
+            count = self.connection.execute("SELECT COUNT(*) FROM classifications").fetchone()[0]
+            if count > self.max_entries:
+                self.connection.execute("DELETE FROM classifications WHERE key IN "
+                                        "(SELECT key FROM classifications ORDER BY used LIMIT ?)",
+                                        (count - self.max_entries,))
+
+        self.new_results = {}
+        self.used = {}
@@ -0,0 +1,204 @@
+import bz2
+import gzip
+import io
+import mmap
+import os
+import posixpath
+import stat
+import zipfile
+from lxml import etree
+
+try:
+    import lzma
+except ImportError:
+    lzma = None
+
+# Leading bytes identifying each supported kind of compressed file
+MAGIC_NUMBERS = [
+    ("gzip", b"\x1f\x8b"),
+    ("bz2", b"BZh"),
+    ("xz", b"\xfd7zXZ\x00"),
+    ("zip", b"PK\x03\x04"),
+]
+
+# Objects containing a model that support the buffer protocol, so can be parsed without being copied
+BUFFER_TYPES = (bytes, bytearray, memoryview, mmap.mmap)
+
+# The format of SBML files listed in the manifest of a COMBINE archive (OMEX) starts with this
+SBML_FORMAT = "http://identifiers.org/combine.specifications/sbml"
+
+
+def compression_type(data):
+    """
+    Identify the kind of compression used for a model, from its first few bytes.
+
+    Parameters
+    ----------
+    data : bytes from the start of the file
+
+    Returns
+    -------
+    "gzip", "bz2", "xz" or "zip", or None if the data is not compressed
+
+    """
+    for name, magic in MAGIC_NUMBERS:
+        if data[:len(magic)] == magic:
+            return name
+    return None
+
+
+def open_model(source, mapped=False):
+    """
+    Open an SBML model that may be compressed using gzip, bz2 or xz, or be stored in a zip file or COMBINE archive.
+
+    The model is decompressed as it is read, so it is never written to a temporary file or held in memory in its
+    entirety. If a zip file contains more than one model, the one that is marked as the master file in the manifest of
+    a COMBINE archive is used (otherwise, the first SBML file listed in the manifest, or the first .xml or .sbml file).
+
+    Parameters
+    ----------
+    source : a filename, or a file object opened in either binary or text mode
+    mapped : if True, an uncompressed model stored in a regular file is memory-mapped, so it can be parsed without
+        being copied
+
+    Returns
+    -------
+    a binary file object from which the (uncompressed) model can be read, or an mmap.mmap object
+
+    """
+    if not hasattr(source, "read"):
+        source = open(source, "rb")
+    elif hasattr(source, "buffer"):
+        # read from the binary buffer underlying a file opened in text mode
+        source = source.buffer
+
+    source_name = getattr(source, "name", None)
+
+    if hasattr(source, "peek"):
+        compression = compression_type(source.peek(6)[:6])
+    elif source.seekable():
+        position = source.tell()
+        compression = compression_type(source.read(6))
+        source.seek(position)
+    else:
+        source = io.BufferedReader(source)
+        compression = compression_type(source.peek(6)[:6])
+
+    if compression is None:
+        return _map_file(source) if mapped else source
+    elif compression == "gzip":
+        model_file = gzip.GzipFile(fileobj=source, mode="rb")
+    elif compression == "bz2":
+        model_file = bz2.BZ2File(source)
+    elif compression == "xz":
+        if lzma is None:
+            raise ValueError("Reading xz-compressed models requires the lzma module")
+        model_file = lzma.LZMAFile(source)
+    else:
+        model_file = _open_archive_member(source)
+
+    # Record the name of the file on disk, so the model can be opened again in another process
+    model_file.source_name = source_name
+    return model_file
+
+
+def _map_file(source):
+    try:
+        if source.tell() != 0:
+            return source
+        status = os.fstat(source.fileno())
+        if not stat.S_ISREG(status.st_mode) or not status.st_size:
+            return source
+        return mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+    except (AttributeError, EnvironmentError, ValueError):
+        # not a real file (e.g. a pipe or an in-memory file), so read it normally
+        return source
+
+
+def _open_archive_member(source):
+    if not source.seekable():
+        # zip files can only be read by seeking to the directory at their end
+        source = io.BytesIO(source.read())
+
+    try:
+        archive = zipfile.ZipFile(source)
+    except zipfile.BadZipfile as e:
+        raise ValueError(str(e))
+
+    member = find_model_in_archive(archive)
+    if member is None:
+        raise ValueError("No SBML model found in archive %s" % getattr(source, "name", ""))
+    return archive.open(member)
+
+
+def find_model_in_archive(archive):
+    """
+    Find the SBML model in a zip file or COMBINE archive.
+
+    Parameters
+    ----------
+    archive : a zipfile.ZipFile
+
+    Returns
+    -------
+    the name of the archive member containing the model, or None if there is no model
+
+    """
+    names = archive.namelist()
+
+    if "manifest.xml" in names:
+        manifest = etree.fromstring(archive.read("manifest.xml"))
+
+        models = []
+        for content in manifest.iter("{*}content"):
+            if not content.get("format", "").startswith(SBML_FORMAT):
+                continue
+            location = posixpath.normpath(content.get("location", "")).lstrip("/")
+            if location not in names:
+                continue
+            if content.get("master") in ["true", "1"]:
+                return location
+            models.append(location)
+
+        if models:
+            return models[0]
+
+    for name in names:
+        if name != "manifest.xml" and posixpath.splitext(name)[1].lower() in [".xml", ".sbml"]:
+            return name
+    return None
+
+
+class BufferReader(io.RawIOBase):
+    """
+    A binary file object that reads from an object supporting the buffer protocol (such as a memoryview or mmap),
+    without copying it.
+    """
+
+    def __init__(self, data):
+        io.RawIOBase.__init__(self)
+        self.data = memoryview(data)
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, buffer):
+        chunk = self.data[self.position:self.position + len(buffer)]
+        buffer[:len(chunk)] = chunk
+        self.position += len(chunk)
+        return len(chunk)
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            offset += len(self.data)
+        self.position = max(0, offset)
+        return self.position
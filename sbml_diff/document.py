@@ -0,0 +1,176 @@
+from bs4 import BeautifulSoup
+from lxml import etree
+from .compression import BUFFER_TYPES
+from .streaming import load_model
+
+PARSERS = ["lxml", "bs4", "stream"]
+
+# Parser used when none is specified, both by the library and by sbml-diff.py
+DEFAULT_PARSER = "stream"
+
+
+def parse_model(model_string, parser=DEFAULT_PARSER, elements=None):
+    """
+    Parse an SBML model.
+
+    All kinds of document support the subset of the BeautifulSoup API used by sbml-diff: select_one(), select() and
+    find_all() for finding elements by name, and the name, attrs, string, children, contents and parent properties,
+    get_text(), replace_with() and extract() for individual elements.
+
+    Parameters
+    ----------
+    model_string : an SBML model as a string, bytes or another object supporting the buffer protocol (such as a
+        memoryview or mmap), or a binary file object from which the model can be read
+    parser : "lxml" to parse using lxml.etree (faster, and uses less memory), "bs4" to parse using BeautifulSoup, or
+        "stream" to incrementally extract only the parts of the model used by sbml-diff (see streaming.load_model); by
+        default, DEFAULT_PARSER
+    elements : if parser is "stream", the names of the elements to extract (by default, all those used by sbml-diff);
+        ignored by the other parsers, which always parse the whole document
+
+    Returns
+    -------
+    an LxmlDocument, bs4.BeautifulSoup or streaming.StreamedDocument object representing the model
+
+    """
+    if parser == "bs4":
+        if isinstance(model_string, BUFFER_TYPES) and not isinstance(model_string, bytes):
+            model_string = bytes(model_string)
+        return BeautifulSoup(model_string, 'xml')
+    elif parser == "lxml":
+        return LxmlDocument(model_string)
+    elif parser == "stream":
+        return load_model(model_string, elements)
+    raise ValueError("Unknown parser '%s' (must be one of %s)" % (parser, ", ".join(PARSERS)))
+
+
+class SBMLElement(etree.ElementBase):
+    """
+    An lxml element with properties and methods matching those of bs4.element.Tag.
+
+    Elements are matched by local name, so that (like BeautifulSoup) a search for "is" will also find "bqbiol:is".
+    """
+
+    def __bool__(self):
+        # lxml elements without children are otherwise false
+        return True
+
+    __nonzero__ = __bool__
+
+    def __eq__(self, other):
+        # Like bs4.element.Tag, elements are equal if they have the same name, attributes and contents
+        if not isinstance(other, SBMLElement):
+            return False
+        return etree.tostring(self, with_tail=False) == etree.tostring(other, with_tail=False)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(etree.tostring(self, with_tail=False))
+
+    @property
+    def name(self):
+        return self.tag.rpartition('}')[2]
+
+    @property
+    def namespace(self):
+        return etree.QName(self).namespace
+
+    @property
+    def attrs(self):
+        return self.attrib
+
+    @property
+    def parent(self):
+        return self.getparent()
+
+    @property
+    def children(self):
+        if self.text is not None:
+            yield self.text
+        for child in self:
+            yield child
+            if child.tail is not None:
+                yield child.tail
+
+    @property
+    def contents(self):
+        return list(self.children)
+
+    @property
+    def string(self):
+        return self.get_text()
+
+    @string.setter
+    def string(self, value):
+        for child in list(self):
+            self.remove(child)
+        self.text = value
+
+    def get_text(self):
+        return "".join(self.itertext())
+
+    def select_one(self, name):
+        return next(self.iterdescendants("{*}" + name), None)
+
+    def select(self, name):
+        return list(self.iterdescendants("{*}" + name))
+
+    def find_all(self, names):
+        if isinstance(names, str):
+            names = [names]
+        return list(self.iterdescendants(*["{*}" + name for name in names]))
+
+    def replace_with(self, replacement):
+        self.getparent().replace(self, replacement)
+        return self
+
+    def extract(self):
+        self.getparent().remove(self)
+        return self
+
+
+class LxmlDocument:
+    """
+    An SBML document parsed using lxml, with the same search methods as bs4.BeautifulSoup.
+
+    Like the document object produced by BeautifulSoup, searches include the root (sbml) element.
+    """
+    name = "[document]"
+    parent = None
+
+    def __init__(self, model_string):
+        parser = etree.XMLParser(recover=True, remove_comments=True, remove_pis=True, huge_tree=True,
+                                 encoding="utf-8" if isinstance(model_string, str) else None)
+        parser.set_element_class_lookup(etree.ElementDefaultClassLookup(element=SBMLElement))
+
+        if isinstance(model_string, str):
+            model_string = model_string.encode("utf-8")
+
+        try:
+            if isinstance(model_string, BUFFER_TYPES):
+                # parse directly from the buffer (e.g. a memory-mapped file), without copying it
+                self.root = etree.fromstring(model_string, parser)
+            elif hasattr(model_string, "read"):
+                # parse a file object as it is read, rather than reading it into a string first
+                self.root = etree.parse(model_string, parser).getroot()
+            else:
+                self.root = etree.fromstring(model_string, parser)
+        except etree.XMLSyntaxError:
+            self.root = None
+
+    def _iter(self, names):
+        if self.root is None:
+            return iter([])
+        return self.root.iter(*["{*}" + name for name in names])
+
+    def select_one(self, name):
+        return next(self._iter([name]), None)
+
+    def select(self, name):
+        return list(self._iter([name]))
+
+    def find_all(self, names):
+        if isinstance(names, str):
+            names = [names]
+        return list(self._iter(names))
@@ -1,71 +1,390 @@
-from bs4 import NavigableString, Tag
-from .rate_laws import convert_rate_law
-import math  # needed for check_sign_numerically()
+import math
+import multiprocessing
+import signal
+import sys
+from .interval_arithmetic import INFINITY, Interval
+from . import interval_arithmetic
+from .rate_laws import canonical_signature, compile_math, compile_rate_law, compile_sympy_expression, \
+    compile_vectorized_rate_law, evaluate_derivative, math_variables
 
+# Methods that categorise_interaction() can use to determine the effect of a species on an expression
+EFFECT_ENGINES = ["numeric", "sampled", "dual", "interval", "sympy"]
 
-def categorise_interaction(kinetic_law, species_id, initial_values, use_sympy=False):
+# Range of concentrations (as powers of 10) at which check_sign_sampled() evaluates an expression
+SAMPLED_CONCENTRATIONS = (-2, 2)
+
+# Largest number of ranges of concentrations for which check_sign_interval() evaluates the derivative of an expression
+MAX_INTERVAL_PIECES = 16
+
+# Values of every variable considered by check_sign_interval(): any positive number
+POSITIVE = Interval(sys.float_info.min, INFINITY)
+
+# Default time limit, in seconds, for determining the sign of one derivative using sympy (see classify_algebraically)
+DEFAULT_SYMPY_TIMEOUT = 10
+
+
+def categorise_interaction(rate_law, species_id, initial_values, use_sympy=False, sample_points=0, engine=None,
+                           cache=None, memo=None):
     """
-    Given a kineticLaw and the name of a species, determine whether the expression is a monotonic_increasing,
-    monotonic_decreasing, or constant with respect to the concentration of that species.
+    Given the math of a kineticLaw (or rule, or event assignment) and the name of a species, determine whether the
+    expression is a monotonic_increasing, monotonic_decreasing, or constant with respect to the concentration of that
+    species.
 
     Parameters
     ----------
-    kinetic_law : bs4.element.Tag corresponding to a kineticLaw
+    rate_law : MathExpr corresponding to a math element
         
     species_id : the species id
         
+    sample_points : if non-zero, compare the value of the expression at this many concentrations of the species (see
+        check_sign_sampled), rather than at two
+
+    engine : one of EFFECT_ENGINES: "numeric" (see check_sign_numerically), "sampled" (check_sign_sampled), "dual"
+        (check_sign_dual), "interval" (check_sign_interval) or "sympy" (check_sign_algebraically); by default, "sympy"
+        if use_sympy is set, "sampled" if sample_points is non-zero, and otherwise "numeric"
+
+    cache : a cache.ClassificationCache in which results are looked up, and stored, or None
+
+    memo : an InteractionMemo holding the results already determined during this run, or None
 
     Returns
     -------
     string representing the sign of the interaction
 
     """
-    for math_expr in kinetic_law.select_one("math"):
-        if isinstance(math_expr, NavigableString):
+    for math_expr in rate_law.children:
+        if isinstance(math_expr, str):
             continue
 
+        if engine is None:
+            engine = "sympy" if use_sympy else "sampled" if sample_points else "numeric"
+
+        key = None
+        if cache is not None or memo is not None:
+            key = interaction_key(math_expr, species_id, engine, initial_values, sample_points)
+
+        if key is not None:
+            result = memo.get(key) if memo is not None else None
+            if result is not None:
+                return result
+            result = cache.get(key) if cache is not None else None
+            if result is not None:
+                if memo is not None:
+                    memo.cache_hits += 1
+                    memo.put(key, result)
+                return result
+
         # identify all parameters and concentrations in the rate law
-        symbols = []
+        symbols = set(math_variables(math_expr))
 
-        if isinstance(math_expr, Tag) and math_expr.name == "ci":
-            symbols.append(math_expr.text.strip())
+        if engine == "sympy":
+            if memo is not None:
+                result = check_sign_algebraically(math_expr, symbols, species_id, initial_values, memo.sympy_timeout,
+                                                  memo.sympy_counts)
+            else:
+                result = check_sign_algebraically(math_expr, symbols, species_id, initial_values)
+        elif engine == "sampled":
+            result = check_sign_sampled(math_expr, symbols, species_id, initial_values, sample_points or 1000)
+        elif engine == "dual":
+            result = check_sign_dual(math_expr, symbols, species_id, initial_values, sample_points or 100)
+        elif engine == "interval":
+            result = check_sign_interval(math_expr, symbols, species_id, initial_values)
         else:
-            for ci in math_expr.findAll("ci"):
-                symbols.append(ci.text.strip())
-        symbols = set(symbols)
+            result = check_sign_numerically(math_expr, symbols, species_id, initial_values)
+
+        if key is not None:
+            if memo is not None:
+                memo.classified += 1
+                memo.put(key, result)
+            if cache is not None:
+                cache.put(key, result)
+        return result
 
-        if use_sympy:
-            return check_sign_algebraically(math_expr, symbols, species_id, initial_values)
+
+def interaction_key(expression, species_id, engine, initial_values, sample_points=0):
+    """
+    Identify the effect of a species on an expression, as determined by categorise_interaction(), so that it can be
+    looked up rather than determined again.
+
+    The expression is identified by its signature (see rate_laws.canonical_signature), so the key does not depend on
+    the names of the variables; the species is identified by its position among them, and the relevant initial values
+    are those of the variables.
+
+    Parameters
+    ----------
+    expression : element corresponding to the contents of a math element
+
+    species_id : the species id
+
+    engine : one of EFFECT_ENGINES
+
+    initial_values : dict mapping each species/parameter id to its initial value
+
+    sample_points : the sample_points argument of categorise_interaction()
+
+    Returns
+    -------
+    a tuple, or None if the species does not occur in the expression
+
+    """
+    signature, variables = canonical_signature(expression)
+    if species_id not in variables:
+        return None
+    values = tuple(initial_values.get(variable) for variable in variables)
+    return signature, variables.index(species_id), engine, sample_points, values
+
+
+class InteractionMemo:
+    """
+    The effect of each species on each expression determined during a single comparison, shared by every caller of
+    categorise_interaction() (which may otherwise classify the same interaction many times, such as once for each
+    product of a reaction, or each occurrence of a species in a kinetic law).
+
+    The number of lookups that found a result (hits) and that did not (misses) are counted. A miss is answered either
+    by the classification cache, if there is one (counted as cache_hits), or by classifying the interaction (counted as
+    classified).
+
+    Interactions classified using sympy are given at most sympy_timeout seconds each (see check_sign_algebraically),
+    and are counted in sympy_counts (as by classify_algebraically).
+    """
+
+    def __init__(self, sympy_timeout=DEFAULT_SYMPY_TIMEOUT):
+        self.results = {}
+        self.hits = 0
+        self.misses = 0
+        self.cache_hits = 0
+        self.classified = 0
+        self.sympy_timeout = sympy_timeout
+        self.sympy_counts = {"symbolically": 0, "numerically": 0, "timed out": 0}
+
+    def get(self, key):
+        """
+        Look up a result.
+
+        Parameters
+        ----------
+        key : key produced by interaction_key()
+
+        Returns
+        -------
+        the result stored under the key, or None if there is no such result
+
+        """
+        result = self.results.get(key)
+        if result is None:
+            self.misses += 1
         else:
-            return check_sign_numerically(math_expr, symbols, species_id, initial_values)
+            self.hits += 1
+        return result
 
+    def put(self, key, result):
+        """
+        Store a result.
 
-def check_sign_algebraically(expr, param_names, species_id, initial_values):
+        Parameters
+        ----------
+        key : key produced by interaction_key()
+        result : string representing the sign of the interaction
 
-    import sympy
-    from sympy import Symbol
+        """
+        self.results[key] = result
 
-    # create variables for each param and species
-    for parameter_name in param_names:
-        exec("%s = Symbol('%s', positive=True)" % (parameter_name, parameter_name))
 
-    # create variables for time and avogadro's constant: N_A
-    exec("t = Symbol('t', positive=True)")
-    exec("N_A = Symbol('N_A', positive=True)")
+def check_sign_algebraically(expr, param_names, species_id, initial_values, timeout=DEFAULT_SYMPY_TIMEOUT,
+                             counts=None):
+    """
+    Given a MathML expression and the name of a species, determine whether the expression is monotonic_increasing or
+    monotonic_decreasing with respect to the concentration of that species, by simplifying its derivative using sympy.
 
-    exec("query_var = %s" % species_id)
+    Every parameter and concentration is assumed to be positive. The expression is converted into sympy directly from
+    its compiled form (see rate_laws.compile_sympy_expression), and the result for each species is stored with the
+    compiled expression, so it is shared by every expression that differs only in the order of the arguments of
+    commutative operators (see rate_laws.canonical_id).
 
-    converted_rate_law = convert_rate_law(expr, output_type="sympy")
-    if converted_rate_law == "piecewise":
-        return "?"
+    Interactions not already classified by classify_algebraically() are classified here, with the same time limit. If
+    the result cannot be determined (because the expression could not be converted, or simplifying its derivative took
+    too long), check_sign_numerically() is used instead.
+
+    Parameters
+    ----------
+    expr : element corresponding to the contents of a math element
+
+    param_names : list of the names of all parameters
 
-    exec("rate = %s" % converted_rate_law)
-    if sympy.simplify(rate.diff(query_var)).is_positive:
+    species_id : the species id
+
+    initial_values : dict mapping each species/parameter id to its initial value (used only if the sign is determined
+        numerically)
+
+    timeout : time limit in seconds for simplifying the derivative, or None for no limit (see classify_algebraically)
+
+    counts : dict in which the interactions classified here are counted, as by classify_algebraically(), or None
+
+    Returns
+    -------
+    string representing the sign of the interaction
+
+    """
+    compiled = compile_math(expr)
+    canonical = compiled.representative or compiled
+    if canonical.signs is None:
+        canonical.signs = {}
+
+    if species_id not in canonical.signs:
+        rate = compile_sympy_expression(canonical)
+        if rate is None:
+            canonical.signs[species_id] = None
+            outcome = "numerically"
+        else:
+            canonical.signs[species_id] = _timed_derivative_sign((rate, species_id, timeout))
+            outcome = "timed out" if canonical.signs[species_id] is None else "symbolically"
+        if counts is not None:
+            counts[outcome] += 1
+
+    if canonical.signs[species_id] is None:
+        return check_sign_numerically(expr, param_names, species_id, initial_values)
+    return canonical.signs[species_id]
+
+
+def derivative_sign(rate, species_id):
+    """
+    Determine the sign of the derivative of a sympy expression with respect to a species.
+
+    Parameters
+    ----------
+    rate : sympy expression (see rate_laws.compile_sympy_expression)
+
+    species_id : the species id
+
+    Returns
+    -------
+    string representing the sign of the interaction
+
+    """
+    import sympy
+
+    derivative = sympy.simplify(rate.diff(sympy.Symbol(species_id, positive=True)))
+    if derivative.is_positive:
         return "monotonic_increasing"
-    elif sympy.simplify(rate.diff(query_var)).is_negative:
+    elif derivative.is_negative:
         return "monotonic_decreasing"
+    return "?"
+
+
+def classify_algebraically(expressions, jobs=1, timeout=DEFAULT_SYMPY_TIMEOUT, classified=None):
+    """
+    Determine, using sympy, the effect of every variable on each of a list of MathML expressions, so that
+    check_sign_algebraically() does not need to do so as the expressions are compared.
+
+    The derivatives are simplified in a pool of worker processes (or in this process, if jobs is 1), and each is given
+    at most timeout seconds. Interactions that cannot be classified in time, or whose expression cannot be converted to
+    sympy, are instead classified numerically by check_sign_algebraically(). Each interaction is classified once, even
+    if it occurs in several expressions or models.
+
+    Parameters
+    ----------
+    expressions : iterable of MathExpr for math elements (e.g. the kineticLaws of several models)
+
+    jobs : number of processes to use
+
+    timeout : time limit in seconds for each derivative, or None for no limit (the limit is only applied on platforms
+        that support SIGALRM)
+
+    classified : function that is passed the contents of a math element and a species id, and returns True if the
+        effect of that species is already known (e.g. because it has been cached), so it need not be determined
+
+    Returns
+    -------
+    dict giving the number of interactions classified "symbolically", "numerically" (as the expression could not be
+        converted) and that "timed out" (so were classified numerically)
+
+    """
+    counts = {"symbolically": 0, "numerically": 0, "timed out": 0}
+    tasks = []
+    task_signs = []
+
+    for math in expressions:
+        math_expr = next((child for child in math.children if not isinstance(child, str)), None)
+        if math_expr is None:
+            continue
+
+        compiled = compile_math(math_expr)
+        canonical = compiled.representative or compiled
+        if canonical.signs is None:
+            canonical.signs = {}
+
+        for species_id in set(math_variables(math_expr)):
+            if species_id in canonical.signs:
+                continue
+            if classified is not None and classified(math_expr, species_id):
+                continue
+
+            # until it is classified, the interaction is marked as one to be classified numerically
+            canonical.signs[species_id] = None
+
+            rate = compile_sympy_expression(canonical)
+            if rate is None:
+                counts["numerically"] += 1
+            else:
+                tasks.append((rate, species_id, timeout))
+                task_signs.append((canonical.signs, species_id))
+
+    if jobs > 1 and len(tasks) > 1:
+        pool = multiprocessing.Pool(min(jobs, len(tasks)))
+        try:
+            results = pool.map(_timed_derivative_sign, tasks, chunksize=max(1, len(tasks) // (4 * jobs)))
+        finally:
+            pool.close()
+            pool.join()
     else:
-        return "?"
+        results = [_timed_derivative_sign(task) for task in tasks]
+
+    for (signs, species_id), result in zip(task_signs, results):
+        signs[species_id] = result
+        if result is None:
+            counts["timed out"] += 1
+        else:
+            counts["symbolically"] += 1
+
+    return counts
+
+
+class _Timeout(BaseException):
+    # Derived from BaseException, so that it is not caught by sympy
+    pass
+
+
+def _raise_timeout(signum, frame):
+    raise _Timeout()
+
+
+def _timed_derivative_sign(task):
+    # Return the sign of a derivative (see derivative_sign), or None if this takes longer than the time limit
+    rate, species_id, timeout = task
+
+    limited = False
+    if timeout and hasattr(signal, "setitimer"):
+        try:
+            previous_handler = signal.signal(signal.SIGALRM, _raise_timeout)
+            limited = True
+        except ValueError:
+            # signals can only be handled in the main thread, so the time limit cannot be applied
+            pass
+
+    try:
+        try:
+            if limited:
+                signal.setitimer(signal.ITIMER_REAL, timeout)
+            return derivative_sign(rate, species_id)
+        finally:
+            if limited:
+                signal.setitimer(signal.ITIMER_REAL, 0)
+    except _Timeout:
+        return None
+    finally:
+        if limited:
+            signal.signal(signal.SIGALRM, previous_handler)
+
 
 def check_sign_numerically(expr, param_names, species_id, initial_values):
     """
@@ -73,8 +392,10 @@ def check_sign_numerically(expr, param_names, species_id, initial_values):
     expression is a monotonic_increasing, monotonic_decreasing, or constant with respect to the concentration of that
     species.
 
-    This is done by setting all parameters and the concentrations of other species to 1, then comparing the value of the
-    expression when the concentration of interest is 1 or 0.
+    This is done by setting all parameters and the concentrations of other species to their initial values (or 1 if
+    these are not known), then comparing the value of the expression when the concentration of interest is 1 or 0.01.
+    The expression is compiled into a Python function once (see compile_rate_law), which is then called with each set
+    of values.
     This approach will fail to report that a kineticLaw is mixed (rather than monotonic) if:
     - the sign of its gradient depends on value of one of the parameters (eg x^a/x^b)
     - the sign of its gradient depends on the concentration of the corresponding species
@@ -82,7 +403,7 @@ def check_sign_numerically(expr, param_names, species_id, initial_values):
 
     Parameters
     ----------
-    expr : bs4.element.Tag object corresponding to the contents of a math element
+    expr : element corresponding to the contents of a math element
         
     param_names : list of the names of all parameters
         
@@ -94,16 +415,32 @@ def check_sign_numerically(expr, param_names, species_id, initial_values):
 
     """
 
-    expr1 = convert_rate_law(expr, initial_values, non_default_variables=[species_id], non_default_values='1', output_type="executable")
-    expr2 = convert_rate_law(expr, initial_values, non_default_variables=[species_id], non_default_values='0.01', output_type="executable")
-
-    if not expr1 or not expr2:
+    function, variables = compile_rate_law(expr)
+    if not function:
         return '?'
 
-    param_names.remove(species_id)
+    # Values of the variables other than species_id are its initial value (if known) or 1
+    values = []
+    for variable in variables:
+        if variable in initial_values:
+            value = _parse_number(initial_values[variable])
+            if value is None:
+                return "?"
+            values.append(value)
+        else:
+            values.append(1.0)
 
     try:
-        rate_change = eval(expr1) - eval(expr2)
+        if species_id in variables:
+            query_index = variables.index(species_id)
+            values[query_index] = 1
+            rate1 = function(values)
+            values[query_index] = 0.01
+            rate_change = rate1 - function(values)
+        else:
+            # the species does not affect the value of the expression (e.g. it is the delay argument of delay())
+            function(values)
+            rate_change = 0
     except (ZeroDivisionError, ValueError, OverflowError):
         return "?"
 
@@ -113,3 +450,244 @@ def check_sign_numerically(expr, param_names, species_id, initial_values):
         return "constant"
     else:
         return "monotonic_decreasing"
+
+
+def check_sign_sampled(expr, param_names, species_id, initial_values, n_points=1000):
+    """
+    Like check_sign_numerically(), but compares the value of the expression at n_points concentrations of the species
+    (spaced logarithmically between 0.01 and 100), so that expressions that increase for some concentrations and
+    decrease for others are reported as "?".
+
+    All points are evaluated in a single call to a function compiled using NumPy (see compile_vectorized_rate_law). If
+    NumPy is not installed, check_sign_numerically() is used instead.
+
+    Parameters
+    ----------
+    expr : element corresponding to the contents of a math element
+
+    param_names : list of the names of all parameters
+
+    species_id : list of the species we are interested in
+
+    n_points : number of concentrations at which to evaluate the expression
+
+    Returns
+    -------
+    string representing the sign of the interaction
+
+    """
+    try:
+        import numpy
+    except ImportError:
+        return check_sign_numerically(expr, param_names, species_id, initial_values)
+
+    function, variables = compile_vectorized_rate_law(expr)
+    if not function:
+        return '?'
+
+    values = numpy.ones((n_points, len(variables)))
+    for i, variable in enumerate(variables):
+        if variable in initial_values:
+            value = _parse_number(initial_values[variable])
+            if value is None:
+                return "?"
+            values[:, i] = value
+
+    if species_id not in variables:
+        return "constant"
+    values[:, variables.index(species_id)] = numpy.logspace(SAMPLED_CONCENTRATIONS[0], SAMPLED_CONCENTRATIONS[1],
+                                                            n_points)
+
+    rates = function(values)
+    if not numpy.isfinite(rates).all():
+        return "?"
+
+    rate_changes = numpy.diff(rates)
+    if (rate_changes == 0).all():
+        return "constant"
+    elif (rate_changes >= 0).all():
+        return "monotonic_increasing"
+    elif (rate_changes <= 0).all():
+        return "monotonic_decreasing"
+    return "?"
+
+
+def check_sign_dual(expr, param_names, species_id, initial_values, n_points=100):
+    """
+    Like check_sign_sampled(), but rather than comparing values of the expression, evaluates its derivative with
+    respect to the concentration of the species at n_points concentrations (spaced logarithmically between 0.01 and
+    100), using automatic differentiation (see rate_laws.evaluate_derivative).
+
+    The derivative at each point is exact, so (unlike comparing values at sampled points) a change in sign between
+    the points is only missed if it occurs over a range narrower than the spacing of the points. If NumPy is not
+    installed, check_sign_numerically() is used instead.
+
+    Parameters
+    ----------
+    expr : element corresponding to the contents of a math element
+
+    param_names : list of the names of all parameters
+
+    species_id : the species id
+
+    n_points : number of concentrations at which to evaluate the derivative
+
+    Returns
+    -------
+    string representing the sign of the interaction
+
+    """
+    try:
+        import numpy
+    except ImportError:
+        return check_sign_numerically(expr, param_names, species_id, initial_values)
+
+    if species_id not in param_names:
+        return "constant"
+
+    # Values of the variables other than species_id are its initial value (if known) or 1
+    values = {}
+    for variable in param_names:
+        if variable in initial_values:
+            value = _parse_number(initial_values[variable])
+            if value is None:
+                return "?"
+            values[variable] = float(value)
+    values[species_id] = numpy.logspace(SAMPLED_CONCENTRATIONS[0], SAMPLED_CONCENTRATIONS[1], n_points)
+
+    _, derivatives = evaluate_derivative(expr, species_id, values)
+    if derivatives is None:
+        return "?"
+
+    derivatives = numpy.broadcast_to(derivatives, (n_points,))
+    if not numpy.isfinite(derivatives).all():
+        return "?"
+
+    if (derivatives == 0).all():
+        return "constant"
+    elif (derivatives >= 0).all():
+        return "monotonic_increasing"
+    elif (derivatives <= 0).all():
+        return "monotonic_decreasing"
+    return "?"
+
+
+def check_sign_interval(expr, param_names, species_id, initial_values, max_pieces=MAX_INTERVAL_PIECES):
+    """
+    Given a MathML expression and the name of a species, prove that the expression is monotonic_increasing or
+    monotonic_decreasing with respect to the concentration of that species, using interval arithmetic.
+
+    The derivative of the expression is evaluated by automatic differentiation (see rate_laws.evaluate_derivative),
+    with intervals rather than numbers as the values of the variables (see interval_arithmetic). The result is an
+    interval containing every value of the derivative, so if it does not contain both positive and negative numbers,
+    the sign of the derivative is known everywhere in the ranges of values considered:
+
+    - first, every parameter and concentration may take any positive value (as assumed by check_sign_algebraically);
+      this is enough for most mass-action rate laws
+    - otherwise, the variables other than species_id take their initial values (or 1 if these are not known), and the
+      concentration of the species is between 0.01 and 100 (as in check_sign_sampled); this range is repeatedly
+      divided in two, until the sign of the derivative is known for each part (such as for a Hill function)
+
+    If the sign still cannot be determined after evaluating the derivative for max_pieces ranges, or the expression
+    cannot be differentiated, check_sign_dual() is used instead.
+
+    Parameters
+    ----------
+    expr : element corresponding to the contents of a math element
+
+    param_names : list of the names of all parameters
+
+    species_id : the species id
+
+    max_pieces : largest number of ranges of concentrations for which to evaluate the derivative
+
+    Returns
+    -------
+    string representing the sign of the interaction
+
+    """
+    if species_id not in param_names:
+        return "constant"
+
+    compiled = compile_math(expr)
+
+    # Values of the variables other than species_id are its initial value (if known) or 1
+    values = {}
+    for variable in param_names:
+        value = 1.0
+        if variable in initial_values:
+            value = _parse_number(initial_values[variable])
+            if value is None:
+                return "?"
+        values[variable] = Interval(float(value))
+
+    # The initial values are only within the positive ranges if they are positive
+    if all(values[variable].lo > 0 for variable in param_names if variable != species_id):
+        derivative = _derivative_interval(compiled, species_id, dict((variable, POSITIVE) for variable in param_names))
+        if derivative is None:
+            return check_sign_dual(expr, param_names, species_id, initial_values)
+        sign = _interval_sign(derivative)
+        if sign is not None:
+            return sign
+
+    signs = set()
+    pieces = [(10.0 ** SAMPLED_CONCENTRATIONS[0], 10.0 ** SAMPLED_CONCENTRATIONS[1])]
+    evaluated = 0
+    while pieces:
+        if evaluated == max_pieces:
+            return check_sign_dual(expr, param_names, species_id, initial_values)
+
+        # the widest remaining range is evaluated first, so a change in sign is found quickly
+        lo, hi = pieces.pop(0)
+        values[species_id] = Interval(lo, hi)
+        derivative = _derivative_interval(compiled, species_id, values)
+        evaluated += 1
+        if derivative is None:
+            return check_sign_dual(expr, param_names, species_id, initial_values)
+
+        sign = _interval_sign(derivative)
+        if sign is None:
+            # divide the range logarithmically, as in check_sign_sampled()
+            middle = math.sqrt(lo * hi)
+            pieces.extend([(lo, middle), (middle, hi)])
+            continue
+
+        signs.add(sign)
+        if "monotonic_increasing" in signs and "monotonic_decreasing" in signs:
+            return "?"
+
+    signs.discard("constant")
+    if signs:
+        return signs.pop()
+    return "constant"
+
+
+def _derivative_interval(compiled, species_id, values):
+    # Return an Interval containing the derivative for the given ranges of values, or None if it cannot be evaluated
+    _, derivative = evaluate_derivative(compiled, species_id, values, arithmetic=interval_arithmetic)
+    if derivative is None:
+        return None
+    return interval_arithmetic.as_interval(derivative)
+
+
+def _interval_sign(derivative):
+    # Return the sign of every number in an interval containing a derivative, or None if this is not known
+    if derivative.lo == 0 and derivative.hi == 0:
+        return "constant"
+    elif derivative.lo >= 0:
+        return "monotonic_increasing"
+    elif derivative.hi <= 0:
+        return "monotonic_decreasing"
+    return None
+
+
+def _parse_number(value):
+    # initial values are written as Python literals would be, so integers remain integers
+    try:
+        return int(value)
+    except ValueError:
+        pass
+    try:
+        return float(value)
+    except ValueError:
+        return None
@@ -1,9 +1,13 @@
+from .DiffObject import all_models, count_models, model_bit
+
+
 class GenerateDot:
     """This class actually generates the DOT output.
     
     It has no dependency on BeautifulSoup, and works with strings, rather than BeautifulSoup objects.
 
-    The print_ functions accept an argument model_set, which specifies which models contain the corresponding feature.
+    The print_ functions accept an argument model_set, which specifies which models contain the corresponding feature
+    (as an integer in which bit i is set if model i contains it; see DiffObject.model_bit).
     """
 
     def __init__(self, colors, num_models, reaction_label="", selected_model="", show_stoichiometry=False, rankdir="TB",
@@ -21,6 +25,7 @@ class GenerateDot:
         """
         self.colors = colors
         self.num_models = num_models
+        self.all_models = all_models(num_models)
 
         # If too few colors specified, extend using categorical 12-step scheme from
         # http://geog.uoregon.edu/datagraphics/color_scales.htm#Categorical%20Color%20Schemes
@@ -81,13 +86,13 @@ class GenerateDot:
                 if r.compare_attribute("is_transcription") == True:
                     product_status = {}
                     for product in reaction.transcription_product_arrows:
-                        if product not in list(product_status.keys()):
-                            product_status[product] = set()
+                        if product not in product_status:
+                            product_status[product] = 0
 
                         product_arrows = reaction.transcription_product_arrows[product]
-                        for r1 in list(product_arrows.record.keys()):
+                        for r1 in product_arrows.record:
                             model_set = product_arrows.record[r1]
-                        product_status[product] = product_status[product].union(model_set)
+                        product_status[product] |= model_set
 
                     self.print_transcription_reaction_node(r.get_models(), reaction.reaction_id, r.compare_attribute("rate_law"), r.compare_attribute("reaction_name"), r.compare_attribute("converted_rate_law"), product_status)
                 else:
@@ -135,7 +140,7 @@ class GenerateDot:
                 self.print_regulatory_arrow(model_set, r["arrow_source"], r["arrow_target"], r["arrow_direction"])
 
             for r in compartment.rules:
-                rate_law = r.rate_laws.compare()
+                rate_law = r.rate_laws.compare_attribute("converted_rate_law")
                 self.print_rule_node(r.rate_laws.get_models(), r.rule_id, rate_law)
 
                 for arrow in r.algebraic_arrows.record:
@@ -174,7 +179,7 @@ class GenerateDot:
             if r["param"] in params_to_draw:
                 self.print_event_trigger_species_arrows(r["param"], r["event_hash"], model_set)
 
-        trigger = event.trigger_math.compare()
+        trigger = event.trigger_math.compare_attribute("math_expr")
 
         if len(event.assignments) < 2:
             self.print_event_node(event.event["event_hash"], event.event["event_name"], trigger, event.event["model_set"])
@@ -207,7 +212,7 @@ class GenerateDot:
                 s = event.assignments[target_id]
                 rule_id = event.event["event_hash"] + "_" + target_id
 
-                self.print_rule_node(s.math_expr.get_models(), rule_id, s.math_expr.compare())
+                self.print_rule_node(s.math_expr.get_models(), rule_id, s.math_expr.compare_attribute("math_expr"))
                 self.print_event_target_arrow(s.math_expr.get_models(), rule_id, target_id)
 
                 for modifier in s.affect_value_arrows.record:
@@ -232,13 +237,13 @@ class GenerateDot:
 
     def assign_color(self, model_set, ignore_difference=False):
         """
-        Given a list of models containing some feature, determine what color that feature should be drawn (black if only
+        Given the set of models containing some feature, determine what color that feature should be drawn (black if only
         one model is being considered, otherwise grey if present in all models, colored if in a single model, and black
         if in multiple models).
 
         Parameters
         ----------
-        model_set : list of model numbers containing the feature
+        model_set : model set containing the feature
         ignore_difference : indicates that this function call does not imply the existence of differences between models
 
         Returns
@@ -246,20 +251,21 @@ class GenerateDot:
         string specifying color
 
         """
-        if self.num_models != len(model_set) and not ignore_difference:
+        num_present = count_models(model_set)
+        if self.num_models != num_present and not ignore_difference:
             self.differences_found = True
 
         if self.num_models == 1:
             return "black"
         # one
-        elif len(model_set) == 1 and self.num_models > 1:
-            model_index = list(model_set)[0]
+        elif num_present == 1 and self.num_models > 1:
+            model_index = model_set.bit_length() - 1
             return self.colors[model_index]
         # all
-        elif len(model_set) == self.num_models:
+        elif num_present == self.num_models:
             return "grey"
         # some
-        elif 0 < len(model_set) < self.num_models:
+        elif 0 < num_present < self.num_models:
             return "black"
 
     def check_style(self, model_set, base_style=''):
@@ -269,7 +275,7 @@ class GenerateDot:
 
         Parameters
         ----------
-        model_set : list of model numbers containing the feature
+        model_set : model set containing the feature
             
         base_style : other style attributes that must be applied (e.g. dashed, or a fillcolor)
              (Default value = '')
@@ -282,8 +288,8 @@ class GenerateDot:
         style = ', style="%s"' % base_style
 
         base_style = "," + base_style
-        if self.selected_model == "" or self.selected_model in model_set:
-            if len(model_set) < self.num_models:
+        if self.selected_model == "" or model_set & model_bit(self.selected_model):
+            if model_set != self.all_models:
                 style = ', style="bold%s"' % base_style
         else:
             style = ', style="invis%s"' % base_style
@@ -295,7 +301,7 @@ class GenerateDot:
 
         Parameters
         ----------
-        model_set : list of model numbers containing the feature
+        model_set : model set containing the feature
             
         reaction_id : id of the reaction
             
@@ -328,7 +334,7 @@ class GenerateDot:
 
         Parameters
         ----------
-        model_set : list of model numbers containing the feature
+        model_set : model set containing the feature
             
         reaction_id : id of the reaction
             
@@ -403,7 +409,7 @@ class GenerateDot:
 
         Parameters
         ----------
-        model_set : list of model numbers containing the feature
+        model_set : model set containing the feature
 
         reaction_id : id of the reaction
 
@@ -432,7 +438,7 @@ class GenerateDot:
 
         Parameters
         ----------
-        model_set : list of model numbers containing the feature
+        model_set : model set containing the feature
             
         reaction_id : id of the reaction
             
@@ -442,9 +448,9 @@ class GenerateDot:
             
         converted_law : human-readable string representation of the kineticLaw
 
-        fast_model_set : list of indexes for models in which this reaction is fast
+        fast_model_set : model set for models in which this reaction is fast
 
-        irreversible_model_set : list of indexes for models in which this reaction is irreversible
+        irreversible_model_set : model set for models in which this reaction is irreversible
 
 
         """
@@ -481,7 +487,7 @@ class GenerateDot:
         """ Print footer needed for valid DOT file  """
         file_strings = []
         for i in range(0, len(self.model_names)):
-            file_strings.append("<font color='%s'>%s</font>" % (self.assign_color([i], ignore_difference=True), self.model_names[i]))
+            file_strings.append("<font color='%s'>%s</font>" % (self.assign_color(model_bit(i), ignore_difference=True), self.model_names[i]))
 
         print('label=<Files: %s>;' % ', '.join(file_strings))
         print("}")
@@ -510,7 +516,7 @@ class GenerateDot:
 
         Parameters
         ----------
-        model_set : list of model numbers containing the feature
+        model_set : model set containing the feature
             
         species_id : id of a species
             
@@ -536,7 +542,7 @@ class GenerateDot:
 
         Parameters
         ----------
-        model_set : list of model numbers containing the feature
+        model_set : model set containing the feature
             
         arrow_main : the DOT edge_stmt for the edge (eg. 'A -> B')
             
@@ -554,7 +560,7 @@ class GenerateDot:
 
         Parameters
         ----------
-        model_set : list of model numbers containing the feature
+        model_set : model set containing the feature
             
         rule_id : id of the rule
             
@@ -582,7 +588,7 @@ class GenerateDot:
 
         Parameters
         ----------
-        model_set : list of model numbers containing the feature
+        model_set : model set containing the feature
 
         target : id of the species affected by the rule
         """
@@ -596,7 +602,7 @@ class GenerateDot:
 
         Parameters
         ----------
-        model_set : list of model numbers containing the feature
+        model_set : model set containing the feature
 
         target : id of the species affected by the rule
         """
@@ -610,7 +616,7 @@ class GenerateDot:
 
         Parameters
         ----------
-        model_set : list of model numbers containing the feature
+        model_set : model set containing the feature
             
         rule_id : id of the rule
             
@@ -646,7 +652,7 @@ class GenerateDot:
 
         Parameters
         ----------
-        model_set : list of model numbers containing the feature
+        model_set : model set containing the feature
             
         modifier : id of species affecting the target
             
@@ -656,7 +662,7 @@ class GenerateDot:
         "decrease-degredation", "increase-production")
         """
 
-        if len(model_set) == 0:
+        if not model_set:
             return
 
         base_style = ''
@@ -717,8 +723,8 @@ class GenerateDot:
         Parameters
         ----------
         old_label : the label for the reaction (name or id, perhaps with rate expression)
-        irreversible_model_set : list of indexes for models in which this reaction is irreversible
-        fast_model_set : list of indexes for models in which this reaction is fast
+        irreversible_model_set : model set for models in which this reaction is irreversible
+        fast_model_set : model set for models in which this reaction is fast
 
         Returns
         -------
@@ -726,12 +732,12 @@ class GenerateDot:
         """
 
         reversible_string = ''
-        if len(irreversible_model_set) > 0:
+        if irreversible_model_set:
             reversible_color = self.assign_color(irreversible_model_set)
             reversible_string = "<font color='%s'>IR</font>" % reversible_color
 
         fast_string = ''
-        if len(fast_model_set) > 0:
+        if fast_model_set:
             fast_color = self.assign_color(fast_model_set)
             fast_string = "<font color='%s'>F</font>" % fast_color
 
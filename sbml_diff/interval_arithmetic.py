@@ -0,0 +1,297 @@
+import math
+
+INFINITY = float("Inf")
+
+# abs() and any() are redefined below (in place of the NumPy functions), so the built-in abs() is kept under this name
+_abs = abs
+
+# Relative amount by which a computed bound is moved outwards, so that it also bounds the exact result despite rounding
+ROUNDING = 2.0 ** -52
+
+
+class Interval(object):
+    """
+    A closed interval [lo, hi] of real numbers, either bound of which may be infinite.
+
+    The result of each arithmetic operation on intervals contains the result of that operation applied to every pair
+    of numbers in its operands, so evaluating an expression with intervals as the values of its variables gives an
+    interval containing every value the expression takes when the variables are anywhere in those intervals. Numbers
+    are treated as intervals containing a single value.
+
+    Together with the functions in this module, which take the place of the NumPy functions of the same name, intervals
+    can be used as the values in rate_laws.evaluate_derivative (see effect_direction.check_sign_interval).
+    """
+    __slots__ = ["lo", "hi"]
+
+    def __init__(self, lo, hi=None):
+        if hi is None:
+            hi = lo
+        if lo != lo or hi != hi:
+            # NaN: the operation is undefined for some values, so nothing is known about the result
+            lo, hi = -INFINITY, INFINITY
+        self.lo = lo
+        self.hi = hi
+
+    def __repr__(self):
+        return "Interval(%r, %r)" % (self.lo, self.hi)
+
+    def __eq__(self, other):
+        other = as_interval(other)
+        return self.lo == other.lo and self.hi == other.hi
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __neg__(self):
+        return Interval(-self.hi, -self.lo)
+
+    def __pos__(self):
+        return self
+
+    def __add__(self, other):
+        other = as_interval(other)
+        return _rounded(self.lo + other.lo, self.hi + other.hi)
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        return self + -as_interval(other)
+
+    def __rsub__(self, other):
+        return as_interval(other) + -self
+
+    def __mul__(self, other):
+        other = as_interval(other)
+        products = [_product(self.lo, other.lo), _product(self.lo, other.hi), _product(self.hi, other.lo),
+                    _product(self.hi, other.hi)]
+        return _rounded(min(products), max(products))
+
+    __rmul__ = __mul__
+
+    def __truediv__(self, other):
+        return self * reciprocal(other)
+
+    def __rtruediv__(self, other):
+        return as_interval(other) * reciprocal(self)
+
+    __div__ = __truediv__
+    __rdiv__ = __rtruediv__
+
+    def __pow__(self, other):
+        return power(self, other)
+
+    def __rpow__(self, other):
+        return power(other, self)
+
+    def contains_zero(self):
+        return self.lo <= 0 <= self.hi
+
+
+def as_interval(value):
+    """
+    Convert a number to an Interval containing only that number (intervals are returned unchanged).
+    """
+    if isinstance(value, Interval):
+        return value
+    value = float(value)
+    return Interval(value, value)
+
+
+def _down(value):
+    if 0 < _abs(value) < INFINITY:
+        return value - _abs(value) * ROUNDING
+    return value
+
+
+def _up(value):
+    if 0 < _abs(value) < INFINITY:
+        return value + _abs(value) * ROUNDING
+    return value
+
+
+def _rounded(lo, hi):
+    return Interval(_down(lo), _up(hi))
+
+
+def _product(a, b):
+    # 0 * inf is 0 here, as infinite bounds stand for arbitrarily large (but finite) values
+    if a == 0 or b == 0:
+        return 0.0
+    return a * b
+
+
+def _monotonic(function, value, increasing=True):
+    # Apply a monotonic function to the bounds of an interval
+    value = as_interval(value)
+    lo, hi = _call(function, value.lo), _call(function, value.hi)
+    if not increasing:
+        lo, hi = hi, lo
+    return _rounded(lo, hi)
+
+
+def _call(function, value):
+    try:
+        return function(value)
+    except OverflowError:
+        return INFINITY if value > 0 else -INFINITY
+    except ValueError:
+        return float("NaN")
+
+
+def reciprocal(value):
+    """
+    The interval containing 1/x for every x in an interval (which is unbounded if the interval contains 0).
+    """
+    value = as_interval(value)
+    if value.contains_zero():
+        return Interval(-INFINITY, INFINITY)
+    return _rounded(1.0 / value.hi, 1.0 / value.lo)
+
+
+def power(base, exponent):
+    """
+    The interval containing x**y for every x in base and y in exponent.
+
+    Integer powers are defined for any base; other powers are only defined for non-negative bases.
+    """
+    base, exponent = as_interval(base), as_interval(exponent)
+
+    if exponent.lo == exponent.hi and _abs(exponent.lo) < INFINITY and exponent.lo == int(exponent.lo):
+        n = int(exponent.lo)
+        if n == 0:
+            return Interval(1.0)
+        elif n < 0:
+            return reciprocal(power(base, -n))
+
+        lo, hi = _integer_power(base.lo, n), _integer_power(base.hi, n)
+        if n % 2:
+            return _rounded(lo, hi)
+        elif base.lo >= 0:
+            return _rounded(lo, hi)
+        elif base.hi <= 0:
+            return _rounded(hi, lo)
+        return _rounded(0.0, max(lo, hi))
+
+    if base.lo < 0:
+        return Interval(-INFINITY, INFINITY)
+    return exp(exponent * log(base))
+
+
+def _integer_power(value, n):
+    try:
+        return value ** n
+    except OverflowError:
+        return INFINITY if value > 0 or n % 2 == 0 else -INFINITY
+
+
+def exp(value):
+    return _monotonic(math.exp, value)
+
+
+def log(value):
+    value = as_interval(value)
+    if value.hi <= 0:
+        return Interval(-INFINITY, INFINITY)
+    lo = math.log(value.lo) if value.lo > 0 else -INFINITY
+    return _rounded(lo, _call(math.log, value.hi))
+
+
+def log10(value):
+    return log(value) / math.log(10)
+
+
+def sqrt(value):
+    value = as_interval(value)
+    if value.hi < 0:
+        return Interval(-INFINITY, INFINITY)
+    return _monotonic(math.sqrt, Interval(max(value.lo, 0.0), value.hi))
+
+
+def abs(value):
+    value = as_interval(value)
+    if value.lo >= 0:
+        return value
+    elif value.hi <= 0:
+        return -value
+    return Interval(0.0, max(-value.lo, value.hi))
+
+
+def sign(value):
+    value = as_interval(value)
+    return Interval(_sign(value.lo), _sign(value.hi))
+
+
+def _sign(value):
+    return 1.0 if value > 0 else -1.0 if value < 0 else 0.0
+
+
+def floor(value):
+    return _monotonic(math.floor, value)
+
+
+def ceil(value):
+    return _monotonic(math.ceil, value)
+
+
+def sin(value):
+    return Interval(-1.0, 1.0)
+
+
+def cos(value):
+    return Interval(-1.0, 1.0)
+
+
+def tan(value):
+    return Interval(-INFINITY, INFINITY)
+
+
+def sinh(value):
+    return _monotonic(math.sinh, value)
+
+
+def cosh(value):
+    value = as_interval(value)
+    lo, hi = _call(math.cosh, value.lo), _call(math.cosh, value.hi)
+    if value.contains_zero():
+        return _rounded(1.0, max(lo, hi))
+    return _rounded(min(lo, hi), max(lo, hi))
+
+
+def tanh(value):
+    return _monotonic(math.tanh, value)
+
+
+def arcsin(value):
+    return _monotonic(math.asin, _clip(value))
+
+
+def arccos(value):
+    return _monotonic(math.acos, _clip(value), increasing=False)
+
+
+def arctan(value):
+    return _monotonic(math.atan, value)
+
+
+def _clip(value):
+    # Restrict an interval to [-1, 1], the domain of arcsin and arccos
+    value = as_interval(value)
+    if value.hi < -1 or value.lo > 1:
+        return Interval(-INFINITY, INFINITY)
+    return Interval(max(value.lo, -1.0), min(value.hi, 1.0))
+
+
+def any(value):
+    """
+    Whether a condition holds (in place of numpy.any(), conditions on intervals being single Boolean values).
+    """
+    return bool(value)
+
+
+def where(condition, value, otherwise):
+    """
+    Choose between two values depending on a condition (in place of numpy.where()).
+    """
+    return value if condition else otherwise
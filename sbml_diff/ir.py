@@ -0,0 +1,440 @@
+import multiprocessing
+import os
+from collections import OrderedDict
+from functools import partial
+from .compression import BUFFER_TYPES, BufferReader, compression_type, open_model
+from .document import DEFAULT_PARSER, parse_model
+from .miriam import get_identifiers
+from .model_index import ModelIndex, section_elements
+from .rate_laws import canonical_id
+from .streaming import Node, gc_paused, intern
+
+# Version of the layout of the extracted models, which is part of the key of each ModelCache entry. Increase this
+# whenever the classes in this module (or anything pickled with them) change, so that entries written by earlier code
+# are not reused.
+IR_VERSION = 4
+
+
+class MathExpr(Node):
+    """
+    A MathML expression (usually a math element), copied out of the parsed document.
+
+    This has the same properties and methods as the other element types (see streaming.Node), so can be passed to
+    convert_rate_law() and categorise_interaction(), but holds no reference to the rest of the document.
+
+    Each element also stores its compiled form (see rate_laws.compile_math), so it is only compiled once. The outermost
+    element may also record the user-defined functions to be inlined into the compiled form (see
+    rate_laws.inline_all_functions), and two expressions are equal if their compiled forms have the same
+    rate_laws.canonical_id.
+    """
+    __slots__ = ["functions"]
+
+    def __eq__(self, other):
+        if not isinstance(other, MathExpr):
+            return False
+        return canonical_id(self) == canonical_id(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(canonical_id(self))
+
+    @classmethod
+    def from_element(cls, element):
+        """
+        Copy an element (of any of the types produced by parse_model), and everything it contains.
+
+        Parameters
+        ----------
+        element : the element to copy, or None
+
+        Returns
+        -------
+        a MathExpr, or None if element is None
+
+        """
+        if element is None:
+            return None
+
+        attrs = None
+        if element.attrs:
+            attrs = dict((intern(str(key)), intern(str(value))) for key, value in element.attrs.items())
+        expr = cls(intern(element.name), element.prefix, element.namespace, attrs)
+
+        for child in element.children:
+            if isinstance(child, str):
+                expr.append(intern(str(child)))
+            else:
+                expr.append(cls.from_element(child))
+        return expr
+
+
+class Compartment:
+    __slots__ = ["id", "name"]
+
+    def __init__(self, element):
+        self.id = element.attrs["id"]
+        self.name = element.attrs.get("name")
+
+
+class Species:
+    __slots__ = ["id", "name", "compartment", "boundary_condition", "initial_concentration", "identifiers"]
+
+    def __init__(self, element):
+        self.id = element.attrs["id"]
+        self.name = element.attrs.get("name")
+        self.compartment = element.attrs["compartment"]
+        self.boundary_condition = element.attrs.get("boundaryCondition", "")
+        self.initial_concentration = element.attrs.get("initialConcentration")
+        self.identifiers = get_identifiers(element)
+
+
+class Parameter:
+    __slots__ = ["id", "name", "value"]
+
+    def __init__(self, element):
+        self.id = element.attrs["id"]
+        self.name = element.attrs.get("name")
+        self.value = element.attrs.get("value")
+
+
+class SpeciesRef:
+    __slots__ = ["species", "stoichiometry"]
+
+    def __init__(self, element):
+        self.species = element.attrs["species"]
+        self.stoichiometry = element.attrs.get("stoichiometry", "1")
+
+
+class Reaction:
+    """
+    A reaction. Its compartment is that of its reactants (or, if it has none, its products), or "NONE" if these are in
+    different compartments.
+    """
+    __slots__ = ["id", "name", "reactants", "products", "modifiers", "compartment", "rate_law", "is_fast",
+                 "is_irreversible", "sbo_term", "identifiers"]
+
+    def __init__(self, element, species_compartment):
+        self.id = element.attrs["id"]
+        self.name = element.attrs.get("name")
+        self.is_fast = element.attrs.get("fast") in ['1', 'true']
+        self.is_irreversible = element.attrs.get("reversible") in ['0', 'false']
+        self.sbo_term = element.attrs.get("sboTerm")
+        self.identifiers = get_identifiers(element)
+
+        self.reactants = _species_references(element, "listOfReactants", "speciesReference")
+        self.products = _species_references(element, "listOfProducts", "speciesReference")
+        self.modifiers = [ref.species for ref in
+                          _species_references(element, "listOfModifiers", "modifierSpeciesReference")]
+
+        self.compartment = ""
+        for ref in self.reactants + self.products:
+            compartment = species_compartment.get(ref.species, "NONE")
+            if not self.compartment:
+                self.compartment = compartment
+            if self.compartment != compartment:
+                self.compartment = "NONE"
+
+        self.rate_law = None
+        kinetic_law = element.select_one("kineticLaw")
+        if kinetic_law:
+            self.rate_law = MathExpr.from_element(kinetic_law.select_one("math"))
+
+    @property
+    def reactant_ids(self):
+        return [ref.species for ref in self.reactants]
+
+    @property
+    def product_ids(self):
+        return [ref.species for ref in self.products]
+
+
+class Rule:
+    """
+    An assignmentRule, rateRule or algebraicRule (indicated by kind). Algebraic rules have no variable.
+    """
+    __slots__ = ["kind", "variable", "metaid", "math"]
+
+    def __init__(self, element):
+        self.kind = element.name
+        self.variable = element.attrs.get("variable")
+        self.metaid = element.attrs.get("metaid")
+        self.math = MathExpr.from_element(element.select_one("math"))
+
+
+class EventAssignment:
+    __slots__ = ["variable", "math"]
+
+    def __init__(self, element):
+        self.variable = element.attrs["variable"]
+        self.math = MathExpr.from_element(element.select_one("math"))
+
+
+class Event:
+    """
+    An event. Its trigger is the MathExpr of the trigger element (or None, if it has no trigger).
+    """
+    __slots__ = ["id", "name", "trigger", "assignments"]
+
+    def __init__(self, element):
+        self.id = element.attrs["id"]
+        self.name = element.attrs.get("name")
+
+        self.trigger = None
+        trigger = element.select_one("trigger")
+        if trigger:
+            self.trigger = MathExpr.from_element(trigger.select_one("math"))
+
+        self.assignments = [EventAssignment(assignment) for assignment in element.select("eventAssignment")]
+
+
+class FunctionDefinition:
+    __slots__ = ["id", "name", "math"]
+
+    def __init__(self, element):
+        self.id = element.attrs["id"]
+        self.name = element.attrs.get("name")
+        self.math = MathExpr.from_element(element.select_one("math"))
+
+
+class Model:
+    """
+    Intermediate representation of a single SBML model, containing only what sbml-diff compares.
+
+    This is extracted from the parsed document (using its ModelIndex) once, after which the document can be released.
+    The model has the same lookup tables as a ModelIndex, but these map ids to the Species, Reaction, Parameter,
+    Compartment, Rule, Event and FunctionDefinition records defined in this module.
+    """
+    __slots__ = ["namespace", "has_list_of_reactions", "has_list_of_species", "species", "reactions", "parameters",
+                 "compartments", "rules", "algebraic_rules", "events", "function_definitions",
+                 "species_in_compartment", "initial_values"]
+
+    def __init__(self, index):
+        """
+
+        Parameters
+        ----------
+        index : ModelIndex for a parsed SBML model
+
+        """
+        document = index.model
+
+        sbml = document.select_one("sbml")
+        self.namespace = sbml.namespace if sbml else None
+        self.has_list_of_reactions = bool(document.select_one("listOfReactions"))
+        self.has_list_of_species = bool(document.select_one("listOfSpecies"))
+
+        self.species = OrderedDict((species_id, Species(element)) for species_id, element in index.species.items())
+        self.reactions = OrderedDict((reaction_id, Reaction(element, index.species_compartment))
+                                     for reaction_id, element in index.reactions.items())
+        self.parameters = OrderedDict((param_id, Parameter(element)) for param_id, element in index.parameters.items())
+        self.compartments = OrderedDict((compartment_id, Compartment(element))
+                                        for compartment_id, element in index.compartments.items())
+        self.rules = OrderedDict((variable, Rule(element)) for variable, element in index.rules.items())
+        self.algebraic_rules = [Rule(element) for element in index.algebraic_rules]
+        self.events = OrderedDict((event_id, Event(element)) for event_id, element in index.events.items())
+        self.function_definitions = OrderedDict((function_id, FunctionDefinition(element))
+                                                for function_id, element in index.function_definitions.items())
+
+        self.species_in_compartment = dict((compartment, list(species_ids))
+                                           for compartment, species_ids in index.species_in_compartment.items())
+        self.initial_values = dict(index.initial_values)
+
+    def find(self, element_id):
+        """
+        Find the species, reaction, parameter, compartment, event or function definition with a given id.
+
+        Parameters
+        ----------
+        element_id : the id of the element
+
+        Returns
+        -------
+        the record, or None if no element has this id
+
+        """
+        for table in [self.species, self.parameters, self.compartments, self.reactions, self.events,
+                      self.function_definitions]:
+            if element_id in table:
+                return table[element_id]
+        return None
+
+    def math_expressions(self):
+        """
+        Iterate over every MathExpr in the model (kinetic laws, rules, event triggers and assignments, and function
+        definitions).
+        """
+        for function in self.function_definitions.values():
+            if function.math:
+                yield function.math
+        for rule in list(self.rules.values()) + self.algebraic_rules:
+            if rule.math:
+                yield rule.math
+        for reaction in self.reactions.values():
+            if reaction.rate_law:
+                yield reaction.rate_law
+        for event in self.events.values():
+            if event.trigger:
+                yield event.trigger
+            for assignment in event.assignments:
+                if assignment.math:
+                    yield assignment.math
+
+    def rename_species(self, old_id, new_id):
+        """
+        Change the id of a species, and update all references to it.
+        """
+        self.species = OrderedDict((new_id if species_id == old_id else species_id, species)
+                                   for species_id, species in self.species.items())
+        self.species[new_id].id = new_id
+
+        for species_ids in self.species_in_compartment.values():
+            for i, species_id in enumerate(species_ids):
+                if species_id == old_id:
+                    species_ids[i] = new_id
+
+        if old_id in self.initial_values:
+            self.initial_values[new_id] = self.initial_values.pop(old_id)
+
+        for math in self.math_expressions():
+            for ci in math.select("ci"):
+                if ci.string.strip() == old_id:
+                    ci.string = new_id
+
+        for reaction in self.reactions.values():
+            for ref in reaction.reactants + reaction.products:
+                if ref.species == old_id:
+                    ref.species = new_id
+            reaction.modifiers = [new_id if species_id == old_id else species_id for species_id in reaction.modifiers]
+
+    def rename_reaction(self, old_id, new_id):
+        """
+        Change the id of a reaction.
+        """
+        self.reactions = OrderedDict((new_id if reaction_id == old_id else reaction_id, reaction)
+                                     for reaction_id, reaction in self.reactions.items())
+        self.reactions[new_id].id = new_id
+
+
+def _species_references(reaction, list_name, element_name):
+    references = reaction.select_one(list_name)
+    if not references:
+        return []
+    return [SpeciesRef(element) for element in references.select(element_name)]
+
+
+def extract_model(model_string, parser=DEFAULT_PARSER, sections=None):
+    """
+    Parse an SBML model, and extract its intermediate representation.
+
+    Parameters
+    ----------
+    model_string : an SBML model (see parse_model)
+    parser : the parser to use (see parse_model)
+    sections : list of the sections of the model to extract (see model_index.SECTIONS), or None to extract every
+        section; the tables of the Model for other sections are left empty
+
+    Returns
+    -------
+    a Model
+
+    """
+    elements = section_elements(sections)
+    with gc_paused():
+        return Model(ModelIndex(parse_model(model_string, parser, elements), elements))
+
+
+def _extract_model_from_source(source, parser, sections):
+    model_string, is_file_name = source
+    if is_file_name:
+        with open(model_string, "rb") as f:
+            return extract_model(open_model(f, mapped=True), parser, sections)
+    return extract_model(model_string, parser, sections)
+
+
+def extract_models(model_strings, parser=DEFAULT_PARSER, jobs=1, cache=None, sections=None):
+    """
+    Parse a list of SBML models, and extract the intermediate representation of each.
+
+    If jobs is greater than 1, the models are parsed in a pool of worker processes, each of which returns a Model to
+    the parent process by pickling it.
+
+    If a cache is given, models that it already contains are loaded from it without being parsed, and other models are
+    added to it once parsed.
+
+    Models that are compressed, or stored in a zip file or COMBINE archive, are decompressed as they are parsed (see
+    compression.open_model).
+
+    Parameters
+    ----------
+    model_strings : a list, in which each element is an SBML model as a string, bytes or another object supporting
+        the buffer protocol (such as a memoryview or mmap), or a file object
+    parser : the parser to use (see parse_model)
+    jobs : the number of processes to use
+    cache : a ModelCache, or None
+    sections : list of the sections of each model to extract (see extract_model), or None to extract every section
+
+    Returns
+    -------
+    list containing a Model for each model
+
+    """
+    model_strings = [_open_compressed(model_string) for model_string in model_strings]
+    models = [None] * len(model_strings)
+    keys = [None] * len(model_strings)
+
+    if cache is not None:
+        for i, model_string in enumerate(model_strings):
+            keys[i], model_strings[i] = cache.key(model_string, sections)
+            models[i] = cache.get(keys[i])
+
+    uncached = [i for i, model in enumerate(models) if model is None]
+    extracted = _extract_uncached_models([model_strings[i] for i in uncached], parser, jobs, sections)
+
+    for i, model in zip(uncached, extracted):
+        models[i] = model
+        if cache is not None:
+            cache.put(keys[i], model)
+
+    return models
+
+
+def _open_compressed(model_string):
+    if isinstance(model_string, BUFFER_TYPES):
+        if compression_type(bytes(model_string[:6])):
+            return open_model(BufferReader(model_string))
+        return model_string
+    if hasattr(model_string, "read"):
+        return open_model(model_string)
+    return model_string
+
+
+def _extract_uncached_models(model_strings, parser, jobs, sections):
+    if jobs > 1 and len(model_strings) > 1:
+
+        # Open files cannot be sent to another process, so are instead reopened by name (or read, if not a real file)
+        sources = []
+        for model_string in model_strings:
+            if isinstance(model_string, BUFFER_TYPES) and not isinstance(model_string, bytes):
+                # memoryviews and memory-mapped files cannot be pickled
+                sources.append((bytes(model_string), False))
+            elif hasattr(model_string, "read"):
+                file_name = getattr(model_string, "source_name", getattr(model_string, "name", None))
+                if isinstance(file_name, str) and os.path.isfile(file_name):
+                    sources.append((file_name, True))
+                else:
+                    sources.append((model_string.read(), False))
+            else:
+                sources.append((model_string, False))
+
+        pool = multiprocessing.Pool(min(jobs, len(model_strings)))
+        try:
+            # the results are unpickled in this process as they arrive
+            with gc_paused():
+                return pool.map(partial(_extract_model_from_source, parser=parser, sections=sections), sources)
+        finally:
+            pool.close()
+            pool.join()
+
+    return [extract_model(model_string, parser, sections) for model_string in model_strings]
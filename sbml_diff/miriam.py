@@ -1,23 +1,27 @@
 import sys
 from collections import OrderedDict
 
+# Key used for the rdf:resource attribute by BeautifulSoup, and by lxml
+RESOURCE_ATTRIBUTES = ["rdf:resource", "{http://www.w3.org/1999/02/22-rdf-syntax-ns#}resource", "resource"]
+
 
 def get_identifiers(obj):
     """
-    Given a BeautifulSoup object, find all of the annotations of type "is"
+    Given an element, find all of the annotations of type "is"
     (rather than e.g. "isDerivedFrom", or "isHomologTo")
     """
     identifiers = set()
 
-    if not obj.find("annotation"):
+    annotation = obj.select_one("annotation")
+    if not annotation:
         return identifiers
 
-    for annotation in obj.find("annotation").find_all("is"):
+    for annotation in annotation.find_all("is"):
         for i in annotation.find_all("li"):
-            if "resource" not in i.attrs:
-                continue
-            resource = i.attrs["resource"]
-            identifiers.add(resource)
+            for attribute in RESOURCE_ATTRIBUTES:
+                if attribute in i.attrs:
+                    identifiers.add(i.attrs[attribute])
+                    break
     return identifiers
 
 
@@ -28,27 +32,32 @@ def align_element(models, element_type):
 
     # Construct a list of identifiers for every id in the species
     for model in models:
-        for tag in model.select(element_type):
-            identifiers = get_identifiers(tag)
-            tag_id = tag["id"]
+        if element_type == "species":
+            records = model.species.values()
+        else:
+            records = model.reactions.values()
+
+        for record in records:
+            identifiers = record.identifiers
+            record_id = record.id
 
             if not identifiers:
                 continue
 
-            if tag_id in list(all_identifiers.keys()) and all_identifiers[tag_id] != identifiers:
+            if record_id in list(all_identifiers.keys()) and all_identifiers[record_id] != identifiers:
                 sys.stderr.write("Cannot match using MIRIAM identifiers: %s id %s has two or more sets of annotations\n"
-                                 % (element_type, tag_id))
-                print("Set one: \n", get_identifiers(all_identifiers[tag_id]))
+                                 % (element_type, record_id))
+                print("Set one: \n", all_identifiers[record_id])
                 print("Set two: \n", identifiers)
                 sys.exit()
 
             identifier_values = list(all_identifiers.values())
             if identifiers in identifier_values:
                 rename_to = list(all_identifiers.keys())[identifier_values.index(identifiers)]
-                if rename_to != tag_id:
-                    elements.append((model, tag_id, rename_to))
+                if rename_to != record_id:
+                    elements.append((model, record_id, rename_to))
 
-            all_identifiers[tag_id] = identifiers
+            all_identifiers[record_id] = identifiers
 
     if len(list(all_identifiers.keys())) == 0:
         sys.stderr.write("Cannot fully match using MIRIAM identifiers: no %s in any model has any identifier\n" % element_type)
@@ -92,27 +101,9 @@ def align_models(models):
     """
     species_to_rename = align_element(models, "species")
     for model, old_id, new_id in species_to_rename:
-        # replace species ids in species definitions
-        for species in model.find_all('species'):
-            if species["id"] == old_id:
-                species["id"] = new_id
-
-        # replace species names in formula
-        for ci in model.find_all("ci"):
-            if ci.string.strip() == old_id:
-                ci.string.replace_with(new_id)
-
-        # replace speciesReference (reactant/product lists)
-        for ref in model.find_all('speciesReference'):
-            if ref["species"] == old_id:
-                ref["species"] = new_id
-        # replace modifierSpeciesReference (modifierSpecies lists)
-        for ref in model.find_all('modifierSpeciesReference'):
-            if ref["species"] == old_id:
-                ref["species"] = new_id
+        # replace species ids in species definitions, formulae, and reactant/product/modifier lists
+        model.rename_species(old_id, new_id)
 
     reactions_to_rename = align_element(models, "reaction")
     for model, old_id, new_id in reactions_to_rename:
-        for species in model.find_all('reaction'):
-            if species["id"] == old_id:
-                species["id"] = new_id
+        model.rename_reaction(old_id, new_id)
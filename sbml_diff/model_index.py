@@ -0,0 +1,197 @@
+import hashlib
+from collections import OrderedDict
+from .rate_laws import canonical_digest
+
+INDEXED_ELEMENTS = ["species", "reaction", "parameter", "localParameter", "compartment", "assignmentRule", "rateRule",
+                    "algebraicRule", "event", "functionDefinition"]
+
+# The elements that make up each section of a model. Loading only some sections avoids building records (and, for the
+# stream parser, converting elements) that a particular kind of output never uses.
+SECTIONS = {
+    "compartments": ["compartment"],
+    "species": ["species"],
+    "reactions": ["reaction"],
+    "parameters": ["parameter", "localParameter"],
+    "rules": ["assignmentRule", "rateRule", "algebraicRule"],
+    "events": ["event"],
+    "function_definitions": ["functionDefinition"],
+}
+
+
+def content_id(element):
+    """
+    Compute an id for an element that has none (such as an event without an id attribute), from its content.
+
+    Elements with the same names, attributes and text (ignoring whitespace between elements) have the same id, whichever
+    parser produced them, in every process (unlike hash(), which varies between processes for strings), so that ids
+    stored in a ModelCache entry match those of a model that is parsed again. Each math element is represented by its
+    canonical form (see rate_laws.canonical_digest), so elements whose expressions differ only in the order of the
+    arguments of commutative operators, which are compared as equal, also have the same id.
+
+    Parameters
+    ----------
+    element : element of a parsed document (see document.parse_model)
+
+    Returns
+    -------
+    hex digest of the element's content
+    """
+    digest = hashlib.sha1()
+
+    def add(node):
+        if isinstance(node, str):
+            text = node.strip()
+            if text:
+                digest.update(("text %s\n" % text).encode("utf-8"))
+            return
+
+        if node.name == "math":
+            digest.update(("math %s\n" % canonical_digest(node)).encode("utf-8"))
+            return
+
+        # Namespace declarations are attributes only for some parsers
+        attrs = sorted(item for item in node.attrs.items() if not item[0].startswith("xmlns"))
+        digest.update(("start %s %r\n" % (node.name, attrs)).encode("utf-8"))
+        for child in node.children:
+            add(child)
+        digest.update(b"end\n")
+
+    add(element)
+    return digest.hexdigest()
+
+
+def section_elements(sections=None):
+    """
+    Find the names of the elements that make up some sections of a model.
+
+    Parameters
+    ----------
+    sections : list of keys of SECTIONS, or None for every section
+
+    Returns
+    -------
+    list of element names (a subset of INDEXED_ELEMENTS)
+
+    """
+    if sections is None:
+        return INDEXED_ELEMENTS
+
+    for section in sections:
+        if section not in SECTIONS:
+            raise ValueError("Unknown section '%s' (must be one of %s)" % (section, ", ".join(sorted(SECTIONS))))
+
+    return [name for name in INDEXED_ELEMENTS if any(name in SECTIONS[section] for section in sections)]
+
+
+class ModelIndex:
+    """
+    Lookup tables for a single parsed SBML model.
+
+    The index is built in a single pass over the document, so that species, reactions, parameters, compartments, rules,
+    events and function definitions can be found by id without searching the tree.
+
+    Elements are found wherever they occur in the document (rather than only as children of the expected listOf
+    element), since files in which these are wrongly nested can still be processed.
+    """
+
+    def __init__(self, model, elements=INDEXED_ELEMENTS):
+        """
+
+        Parameters
+        ----------
+        model : document produced by parsing an SBML model with parse_model()
+        elements : names of the elements to index (see section_elements); tables for other elements are left empty
+
+        """
+        self.model = model
+
+        self.species = OrderedDict()
+        self.reactions = OrderedDict()
+        self.parameters = OrderedDict()
+        self.compartments = OrderedDict()
+        self.rules = OrderedDict()
+        self.algebraic_rules = []
+        self.events = OrderedDict()
+        self.function_definitions = OrderedDict()
+
+        self.species_compartment = {}
+        self.species_in_compartment = {}
+        self.initial_values = {}
+        self.reaction_names = {}
+
+        for element in model.find_all(elements):
+            # ignore elements from other namespaces (e.g. in annotations)
+            if element.prefix:
+                continue
+
+            if element.name == "species":
+                self._add_species(element)
+            elif element.name == "reaction":
+                self._add_reaction(element)
+            elif element.name in ["parameter", "localParameter"]:
+                self._add_parameter(element)
+            elif element.name == "compartment":
+                if "id" in element.attrs:
+                    self.compartments[element.attrs["id"]] = element
+            elif element.name in ["assignmentRule", "rateRule"]:
+                self.rules[element.attrs["variable"]] = element
+            elif element.name == "algebraicRule":
+                self.algebraic_rules.append(element)
+            elif element.name == "event":
+                if "id" not in element.attrs:
+                    element.attrs["id"] = content_id(element)
+                self.events[element.attrs["id"]] = element
+            elif element.name == "functionDefinition":
+                self.function_definitions[element.attrs["id"]] = element
+
+    def _add_species(self, species):
+        species_id = species.attrs["id"]
+        compartment = species.attrs["compartment"]
+
+        self.species[species_id] = species
+        self.species_compartment[species_id] = compartment
+        self.species_in_compartment.setdefault(compartment, []).append(species_id)
+
+        if "initialConcentration" in species.attrs:
+            self.initial_values[species_id] = species.attrs["initialConcentration"]
+
+    def _add_reaction(self, reaction):
+        reaction_id = reaction.attrs["id"]
+        self.reactions[reaction_id] = reaction
+
+        if "name" in reaction.attrs and reaction.attrs["name"]:
+            self.reaction_names[reaction_id] = reaction.attrs["name"]
+        else:
+            self.reaction_names[reaction_id] = reaction_id
+
+    def _add_parameter(self, param):
+        if "id" not in param.attrs:
+            return
+        param_id = param.attrs["id"]
+
+        # Parameters local to a kineticLaw only contribute an initial value
+        if not param.parent.parent or param.parent.parent.name != "kineticLaw":
+            self.parameters[param_id] = param
+
+        if "value" in param.attrs:
+            self.initial_values[param_id] = param.attrs["value"]
+
+    def find(self, element_id):
+        """
+        Find the species, reaction, parameter, compartment, event or function definition with a given id.
+
+        Parameters
+        ----------
+        element_id : the id of the element
+
+        Returns
+        -------
+        the element, or None if no element has this id
+
+        """
+        for table in [self.species, self.parameters, self.compartments, self.reactions, self.events,
+                      self.function_definitions]:
+            if element_id in table:
+                return table[element_id]
+        return None
+
@@ -0,0 +1,269 @@
+from .DiffObject import FrozenDict
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Number of rows for which space is initially allocated in a PresenceMatrix
+INITIAL_ROWS = 64
+
+
+class PresenceMatrix(object):
+    """
+    Which models contain each of many features of the same kind (e.g. every reactant arrow in a comparison).
+
+    Each distinct version of a feature is a row, and each model a column. Presence is stored as a bit-packed NumPy
+    array, with bit j of byte b of a row set if model 8b + j contains it, so that the bytes of a row are the
+    little-endian representation of its model set (see DiffObject.model_bit).
+
+    Every row of a matrix has the same attributes. Their values are interned, and each row is identified by the codes
+    of its values (its key), so that the attributes of all rows form columns of codes (see column()).
+
+    Queries over every feature of a kind at once (features present in all models, or unique to one model, and the
+    similarity of each pair of models) are evaluated on the whole array.
+    """
+
+    def __init__(self, num_models):
+        if numpy is None:
+            raise ValueError("The columnar backend requires the numpy module")
+
+        self.num_models = num_models
+        self.bits = numpy.zeros((INITIAL_ROWS, (num_models + 7) // 8), dtype=numpy.uint8)
+
+        # Names of the attributes of each row, and the key of each row
+        self.attribute_names = None
+        self.attribute_index = {}
+        self.keys = []
+
+        # The value corresponding to each code, and the code corresponding to each value (values that are equal, such
+        # as True and 1, share a code, just as DiffElement treats records containing them as the same version)
+        self.values = []
+        self.codes = {}
+
+    def key(self, data):
+        """
+        The key (tuple of value codes) of the row with the given attributes, which need not have been added yet.
+        """
+        if self.attribute_names is None:
+            self.attribute_names = tuple(data.keys())
+            self.attribute_index = dict((name, i) for i, name in enumerate(self.attribute_names))
+        return tuple([self.intern(data[name]) for name in self.attribute_names])
+
+    def find_key(self, data):
+        """
+        The key of the row with the given attributes, or None if no row can have them (because some value has not been
+        seen, or the attributes are not those of this matrix). Unlike key(), this does not change the matrix.
+        """
+        if self.attribute_names is None or len(data) != len(self.attribute_names):
+            return None
+
+        key = []
+        for name in self.attribute_names:
+            if name not in data:
+                return None
+            code = self.code(data[name])
+            if code is None:
+                return None
+            key.append(code)
+        return tuple(key)
+
+    def intern(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def code(self, value):
+        """The code of a value, or None if no row has that value"""
+        return self.codes.get(value)
+
+    def add_row(self, key):
+        """
+        Add a row, initially present in no models, and return its index.
+        """
+        row = len(self.keys)
+        if row == len(self.bits):
+            self.bits = numpy.concatenate([self.bits, numpy.zeros_like(self.bits)])
+        self.keys.append(key)
+        return row
+
+    def data(self, key):
+        """The attributes of a row, as a FrozenDict"""
+        values = self.values
+        return FrozenDict(zip(self.attribute_names, [values[code] for code in key]))
+
+    def column(self, attribute_name):
+        """Array of the code of an attribute's value in each row"""
+        i = self.attribute_index[attribute_name]
+        return numpy.array([key[i] for key in self.keys], dtype=numpy.int64)
+
+    def add(self, row, model_num):
+        self.bits[row, model_num >> 3] |= 1 << (model_num & 7)
+
+    def model_set(self, rows):
+        """
+        The model set (an integer bitmask) of models containing any of the given rows.
+        """
+        if len(rows) == 1:
+            packed = self.bits[rows[0]]
+        else:
+            packed = numpy.bitwise_or.reduce(self.bits[rows], axis=0)
+        return int.from_bytes(packed.tobytes(), "little")
+
+    def presence(self):
+        """
+        Boolean array in which entry [i, j] indicates whether model j contains row i.
+        """
+        return numpy.unpackbits(self.bits[:len(self.keys)], axis=1, count=self.num_models,
+                                bitorder="little").astype(bool)
+
+    def present_in_all(self):
+        """
+        Boolean array indicating, for each row, whether it is present in every model.
+        """
+        return self.presence().all(axis=1)
+
+    def unique_to(self, model_num):
+        """
+        Boolean array indicating, for each row, whether it is present in the given model and no other.
+        """
+        presence = self.presence()
+        return presence[:, model_num] & (presence.sum(axis=1) == 1)
+
+    def shared_counts(self):
+        """
+        Array in which entry [i, j] is the number of rows present in both model i and model j (so entry [i, i] is the
+        number of rows present in model i).
+        """
+        presence = self.presence().astype(numpy.int64)
+        return presence.T.dot(presence)
+
+
+def similarity(matrices, num_models):
+    """
+    Compute the similarity of each pair of models, from the rows of some presence matrices present in each.
+
+    Parameters
+    ----------
+    matrices : list of PresenceMatrix objects, each with num_models columns
+    num_models : number of models being compared
+
+    Returns
+    -------
+    array in which entry [i, j] is the Jaccard index of the sets of rows present in models i and j (the number of rows
+    present in both, divided by the number present in either)
+    """
+    shared = numpy.zeros((num_models, num_models), dtype=numpy.int64)
+    for matrix in matrices:
+        shared += matrix.shared_counts()
+
+    present = shared.diagonal()
+    either = present[:, None] + present[None, :] - shared
+    return shared / either.clip(min=1)
+
+
+class ColumnarDiffElement(object):
+    """
+    A DiffElement whose versions are rows of a PresenceMatrix shared with every other element of the same kind.
+
+    It has the same interface as DiffElement, including record, a mapping from the data for each version to the model
+    set (an integer bitmask) of models containing it.
+    """
+    __slots__ = ["matrix", "rows"]
+
+    def __init__(self, matrix):
+        self.matrix = matrix
+
+        # Row of the matrix for each version of this element, by key
+        self.rows = {}
+
+    @property
+    def record(self):
+        return ModelSetView(self)
+
+    def add(self, data_tuple, model_num):
+        key = self.matrix.key(data_tuple)
+        row = self.rows.get(key)
+        if row is None:
+            row = self.rows[key] = self.matrix.add_row(key)
+        self.matrix.add(row, model_num)
+
+    def get_models(self):
+        if not self.rows:
+            return 0
+        return self.matrix.model_set(list(self.rows.values()))
+
+    def get_data(self):
+        return [self.matrix.data(key) for key in self.rows]
+
+    def all_equal(self):
+        return len(self.rows) == 1
+
+    def compare(self):
+        if self.all_equal():
+            return self.get_models()
+        else:
+            return "different"
+
+    def compare_attribute(self, attribute_name, different="different"):
+        if not self.rows:
+            return False
+
+        i = self.matrix.attribute_index[attribute_name]
+        keys = iter(self.rows)
+        code = next(keys)[i]
+        for key in keys:
+            if code != key[i]:
+                return different
+
+        return self.matrix.values[code]
+
+    def find_models(self, attribute_name, value):
+        i = self.matrix.attribute_index.get(attribute_name)
+        code = self.matrix.code(value)
+        if i is None or code is None:
+            return 0
+
+        rows = [row for key, row in self.rows.items() if key[i] == code]
+        if not rows:
+            return 0
+        return self.matrix.model_set(rows)
+
+
+class ModelSetView(object):
+    """
+    Read-only mapping from the data for each version of a ColumnarDiffElement (as a FrozenDict) to its model set.
+    """
+    __slots__ = ["element"]
+
+    def __init__(self, element):
+        self.element = element
+
+    def __getitem__(self, data_tuple):
+        element = self.element
+        row = element.rows.get(element.matrix.find_key(data_tuple))
+        if row is None:
+            raise KeyError(data_tuple)
+        return element.matrix.model_set([row])
+
+    def __contains__(self, data_tuple):
+        return self.element.matrix.find_key(data_tuple) in self.element.rows
+
+    def __iter__(self):
+        return iter(self.element.get_data())
+
+    def __len__(self):
+        return len(self.element.rows)
+
+    def keys(self):
+        return self.element.get_data()
+
+    def values(self):
+        matrix = self.element.matrix
+        return [matrix.model_set([row]) for row in self.element.rows.values()]
+
+    def items(self):
+        matrix = self.element.matrix
+        return [(matrix.data(key), matrix.model_set([row])) for key, row in self.element.rows.items()]
@@ -1,15 +1,22 @@
-from bs4 import BeautifulSoup, NavigableString
-import copy
+import hashlib
+import itertools
+import math
 import sys
+import weakref
+from collections import OrderedDict
+from .streaming import Node
 
 
 def convert_rate_law(math, initial_values=False, non_default_variables=False, non_default_values=1, output_type=""):
     """
     A wrapper for convert_rate_law_inner that returns only the converted expression.
 
+    The expression is compiled once (see compile_math), and the result of converting it without replacing any
+    variables is remembered, so converting the same expression again does not revisit the MathML tree.
+
     Parameters
     ----------
-    math : BeautifulSoup object representing a rateLaw (a bs4.element.Tag)
+    math : element representing a rateLaw (a MathExpr, bs4.element.Tag or SBMLElement)
 
     non_default_variables : if specified, the name of any species whose id is not in this list is replaced by 1.0
          (Default value = False)
@@ -28,13 +35,363 @@ def convert_rate_law(math, initial_values=False, non_default_variables=False, no
     if not math:
         return ""
 
-    if math.select_one('piecewise') or math.name == 'piecewise':
+    compiled = compile_math(math)
+
+    if compiled.is_piecewise:
         sys.stderr.write("Encountered a piecewise function\n")
         if output_type in ["executable", "sympy"]:
             return "piecewise"
         return ""
 
-    return convert_rate_law_inner(math, initial_values, non_default_variables, non_default_values, output_type)[1]
+    return render_math(compiled, initial_values, non_default_variables, non_default_values, output_type)[1]
+
+
+class MathNode(object):
+    """
+    A node of the compiled form of a MathML expression (see compile_math).
+
+    For an apply element, operator is the name of the operator and args are the compiled arguments; for other
+    elements, args are the compiled child elements. text holds the stripped name of a ci element, the
+    (human-readable, executable) pair of strings for a cn element, the definitionURL of a csymbol element, or the id of
+    the function called by an apply element whose definition is not known.
+
+    Nodes are immutable and hash-consed (see make_math_node), so identical subexpressions are represented by the same
+    object, and share the strings and functions generated from them. Nodes that differ only in the order of the
+    arguments of commutative operators have the same canonical_id; representative refers to the first such node (or is
+    None for that node itself), so the id remains in use while any of them exists.
+    """
+    __slots__ = ["name", "operator", "text", "args", "is_piecewise", "renderings", "function", "vectorized",
+                 "variables", "canonical_id", "representative", "signature", "sympy", "signs", "__weakref__"]
+
+    def __init__(self, name, operator=None, text=None, args=()):
+        self.name = name
+        self.operator = operator
+        self.text = text
+        self.args = args
+        self.is_piecewise = name == "piecewise" or any(arg.is_piecewise for arg in args)
+        self.renderings = None
+        self.function = None
+        self.vectorized = None
+        self.variables = None
+        self.canonical_id = None
+        self.representative = None
+        self.signature = None
+        self.sympy = None
+        self.signs = None  # set by effect_direction.check_sign_algebraically()
+
+
+# Operators whose arguments can be reordered without changing the value of an expression
+COMMUTATIVE_OPERATORS = ["plus", "times", "and", "or"]
+
+# Every MathNode that is in use, keyed by its content (see make_math_node)
+_math_nodes = weakref.WeakValueDictionary()
+
+# The first MathNode in use with each canonical form, keyed by its content with the arguments replaced by their
+# canonical_id (sorted, for commutative operators)
+_canonical_nodes = weakref.WeakValueDictionary()
+_canonical_ids = itertools.count(1)
+
+
+def make_math_node(name, operator=None, text=None, args=()):
+    """
+    Get the MathNode with the given content, creating it only if no identical node exists.
+
+    As the arguments are themselves unique, two nodes are identical exactly when they have the same name, operator and
+    text, and the same argument objects. A new node is also given the canonical_id of any node that differs from it
+    only in the order of the arguments of commutative operators, or otherwise a new id.
+
+    Parameters
+    ----------
+    name : name of the MathML element
+    operator : for an apply element, the name of the operator
+    text : the text of the element (see MathNode)
+    args : tuple of MathNode objects
+
+    Returns
+    -------
+    a MathNode
+
+    """
+    key = (name, operator, text, args)
+    node = _math_nodes.get(key)
+    if node is None:
+        node = MathNode(name, operator, text, args)
+        _math_nodes[key] = node
+
+        arg_ids = tuple(arg.canonical_id for arg in args)
+        if name == "apply" and operator in COMMUTATIVE_OPERATORS:
+            arg_ids = tuple(sorted(arg_ids))
+        canonical_key = (name, operator, text, arg_ids)
+        representative = _canonical_nodes.get(canonical_key)
+        if representative is None:
+            node.canonical_id = next(_canonical_ids)
+            _canonical_nodes[canonical_key] = node
+        else:
+            node.canonical_id = representative.canonical_id
+            node.representative = representative
+    return node
+
+
+def compile_math(expression, functions=None):
+    """
+    Compile a MathML expression into a tree of MathNode objects.
+
+    For a MathExpr (or other streaming.Node), the compiled form of the expression (and of each element it contains) is
+    stored on the element, and is discarded if the element or anything it contains is later modified.
+
+    Calls to user-defined functions are replaced by the compiled body of the function (see inline_all_functions), with
+    the compiled arguments substituted by reference, so neither the function body nor the arguments are copied.
+
+    Parameters
+    ----------
+    expression : element representing a MathML expression (a MathExpr, bs4.element.Tag or SBMLElement)
+    functions : dict whose keys are function ids, and values are dicts representing each function (see
+        inline_all_functions); by default, the functions recorded on the math element containing the expression
+
+    Returns
+    -------
+    a MathNode
+
+    """
+    is_node = isinstance(expression, Node)
+    if is_node and expression.compiled is not None:
+        return expression.compiled
+
+    if functions is None:
+        functions = _defined_functions(expression)
+
+    children = [child for child in expression.children if not isinstance(child, str)]
+
+    if expression.name == "cn":
+        term = ""
+        code = ""
+        if "type" in list(expression.attrs.keys()):
+            parts = list(expression.children)
+            if expression.attrs["type"] == "e-notation":
+                term = "%s * 10^(%s)" % (parts[0], parts[2])
+                code = "%s * 10**(%s)" % (parts[0], parts[2])
+            elif expression.attrs["type"] in ["real", "integer"]:
+                term = code = str(parts[0])
+            elif expression.attrs["type"] == "rational":
+                term = code = "%s/%s" % (parts[0], parts[2])
+        else:
+            term = code = expression.string.strip()
+        compiled = make_math_node("cn", text=(term, code),
+                                  args=tuple(compile_math(child, functions) for child in children))
+
+    elif expression.name == "ci":
+        compiled = make_math_node("ci", text=expression.string.strip())
+
+    elif expression.name == "csymbol":
+        compiled = make_math_node("csymbol", text=expression.attrs.get('definitionURL', ""))
+
+    elif expression.name == "apply":
+        operator = None
+        function_id = None
+        if children:
+            operator = children[0].name
+            if operator == "csymbol" and children[0].string.strip() == "delay":
+                operator = "delay"
+            elif operator == "ci":
+                function_id = children[0].string.strip()
+        args = tuple(compile_math(child, functions) for child in children[1:])
+
+        if function_id in functions:
+            compiled = inline_function_call(functions[function_id], args)
+        else:
+            compiled = make_math_node("apply", operator=operator, text=function_id, args=args)
+
+    else:
+        compiled = make_math_node(expression.name, args=tuple(compile_math(child, functions) for child in children))
+
+    if is_node:
+        expression.compiled = compiled
+    return compiled
+
+
+def _defined_functions(expression):
+    # The functions that can be inlined into an expression are recorded on the outermost element containing it
+    root = expression
+    while getattr(root, "parent", None) is not None:
+        root = root.parent
+    return getattr(root, "functions", None) or {}
+
+
+def canonical_id(expression):
+    """
+    Get an integer identifying a MathML expression, after function calls are inlined (see compile_math).
+
+    Expressions that are structurally identical, or differ only in the order of the arguments of commutative operators
+    (such as plus and times), have the same id, so expressions can be compared by comparing their ids. Ids are only
+    meaningful within a single process.
+
+    Parameters
+    ----------
+    expression : element representing a MathML expression
+
+    Returns
+    -------
+    an int
+
+    """
+    return compile_math(expression).canonical_id
+
+
+def canonical_signature(expression):
+    """
+    Get a string identifying a MathML expression up to the names of its variables, which (unlike canonical_id) is the
+    same in every process, so can be used as a key for results stored on disk.
+
+    The variables are numbered in the order in which they first occur, after the arguments of commutative operators
+    are sorted. Arguments are sorted by their structure, with each variable replaced by its role in the whole
+    expression (the positions at which it occurs) rather than its name, so that expressions that differ only in the
+    names of their variables, or the order of the arguments of commutative operators, have the same signature, with
+    corresponding variables listed in the same positions. The signature of each compiled expression is computed once.
+
+    Parameters
+    ----------
+    expression : element representing a MathML expression, or a MathNode
+
+    Returns
+    -------
+    signature : hex digest identifying the expression
+
+    variables : tuple of the distinct variable ids, in the order in which they are numbered
+
+    """
+    return _signature(expression if isinstance(expression, MathNode) else compile_math(expression))
+
+
+def canonical_digest(expression):
+    """
+    Get a string identifying a MathML expression, after function calls are inlined (see compile_math).
+
+    Like canonical_id, this is the same for expressions that differ only in the order of the arguments of commutative
+    operators, and differs for expressions with different variables; like canonical_signature, it is the same in every
+    process, so can be used to derive ids that are stored on disk.
+
+    Parameters
+    ----------
+    expression : element representing a MathML expression, or a MathNode
+
+    Returns
+    -------
+    hex digest identifying the expression
+
+    """
+    return _canonical_digest(expression if isinstance(expression, MathNode) else compile_math(expression), {})
+
+
+def _canonical_digest(node, digests):
+    digest = digests.get(node)
+    if digest is None:
+        args = [_canonical_digest(arg, digests) for arg in node.args]
+        if _is_commutative(node):
+            args.sort()
+        digest = digests[node] = _digest("\n".join([repr((node.name, node.operator, node.text))] + args))
+    return digest
+
+
+def _signature(node):
+    if node.signature is not None:
+        return node.signature
+
+    roles = {}
+    _variable_paths(node, "", roles)
+    for variable, paths in roles.items():
+        roles[variable] = _digest("\n".join(sorted(paths)))
+
+    parts = []
+    numbers = {}
+    _serialize(node, roles, {}, numbers, parts)
+    node.signature = _digest("\n".join(parts)), tuple(sorted(numbers, key=numbers.get))
+    return node.signature
+
+
+def _digest(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def _description(node):
+    # The content of a node other than its arguments (and the name of a variable)
+    return repr((node.name, node.operator, None if node.name == "ci" else node.text))
+
+
+def _is_commutative(node):
+    return node.name == "apply" and node.operator in COMMUTATIVE_OPERATORS
+
+
+def _variable_paths(node, path, paths):
+    # Record the path from the root to each occurrence of each variable, in which the position of an argument of a
+    # commutative operator is not distinguished
+    if node.name == "ci":
+        paths.setdefault(node.text, []).append(path)
+        return
+
+    commutative = _is_commutative(node)
+    for i, arg in enumerate(node.args):
+        _variable_paths(arg, _digest("%s %s %s" % (path, _description(node), "*" if commutative else i)), paths)
+
+
+def _coloured(node, roles, colours):
+    # Digest of a node in which each variable is replaced by its role (the digest of the paths at which it occurs)
+    colour = colours.get(node)
+    if colour is None:
+        if node.name == "ci":
+            colour = roles[node.text]
+        else:
+            args = [_coloured(arg, roles, colours) for arg in node.args]
+            if _is_commutative(node):
+                args.sort()
+            colour = _digest("\n".join([_description(node)] + args))
+        colours[node] = colour
+    return colour
+
+
+def _serialize(node, roles, colours, numbers, parts):
+    # Describe a node and its arguments in prefix order, numbering variables in the order in which they first occur
+    if node.name == "ci":
+        parts.append("ci %s" % numbers.setdefault(node.text, len(numbers)))
+        return
+
+    parts.append("%s %s" % (_description(node), len(node.args)))
+    args = node.args
+    if _is_commutative(node):
+        args = sorted(args, key=lambda arg: _coloured(arg, roles, colours))
+    for arg in args:
+        _serialize(arg, roles, colours, numbers, parts)
+
+
+def math_variables(expression):
+    """
+    List the variables (species, parameters and compartments) used in a MathML expression.
+
+    Like the ci elements of the expression, these are listed in document order, and may contain duplicates; however,
+    calls to user-defined functions are inlined first (see compile_math), so function ids and the names of function
+    arguments are not included. The list is computed once for each compiled expression.
+
+    Parameters
+    ----------
+    expression : element representing a MathML expression
+
+    Returns
+    -------
+    tuple of variable ids
+
+    """
+    compiled = compile_math(expression)
+
+    if compiled.variables is None:
+        variables = []
+        stack = [compiled]
+        while stack:
+            node = stack.pop()
+            if node.name == "ci" or (node.name == "apply" and node.text is not None):
+                variables.append(node.text)
+            stack.extend(reversed(node.args))
+        compiled.variables = tuple(variables)
+
+    return compiled.variables
 
 
 def add_parens(term_elementary, terms):
@@ -70,67 +427,469 @@ def convert_function(output_type, function_name):
                          "root": "sympy.root",
                          "t": "t", "N_A": "N_A"}
 
+    numpy_replacement = {'exp': 'numpy.exp', 'ln': 'numpy.log', 'log': 'numpy.log10', 'ceiling': 'numpy.ceil',
+                         'floor': 'numpy.floor', 'factorial': 'factorial', 'pi': 'numpy.pi', 'e': 'numpy.e',
+                         'infinity': 'numpy.inf', "sqrt": "numpy.sqrt", "abs": "numpy.abs", "cos": "numpy.cos",
+                         "sin": "numpy.sin", "tan": "numpy.tan", "sinh": "numpy.sinh", "cosh": "numpy.cosh",
+                         "tanh": "numpy.tanh", "arcsin": "numpy.arcsin", "arccos": "numpy.arccos",
+                         "arctan": "numpy.arctan", "t": "1", "N_A": "1"}
+
     if not output_type:
         return function_name
     elif output_type == "executable":
         return executable_replacement[function_name]
     elif output_type == "sympy":
         return sympy_replacement[function_name]
+    elif output_type == "numpy":
+        return numpy_replacement[function_name]
+
+
+def compile_rate_law(expression):
+    """
+    Compile a MathML expression into a Python function, which evaluates the expression for given values of the
+    variables (species, parameters, compartments) that it contains.
+
+    The function is created using compile(), and stored with the compiled expression (see compile_math), so repeatedly
+    evaluating an expression with different values does not involve generating or parsing any code.
+
+    Parameters
+    ----------
+    expression : element representing a MathML expression
+
+    Returns
+    -------
+    function : a function taking a list containing the value of each variable, and returning the value of the
+        expression (or None if the expression cannot be evaluated, e.g. because it is piecewise)
+
+    variables : list of the ids of the variables, in the order in which the function expects their values
+
+    """
+    compiled = compile_math(expression)
+
+    if compiled.function is None:
+        function = None
+        variables = OrderedDict()
+
+        if compiled.is_piecewise:
+            sys.stderr.write("Encountered a piecewise function\n")
+        else:
+            converted = render_math(compiled, {}, output_type="executable", variables=variables)
+            if converted and converted[1]:
+                try:
+                    code = compile("lambda values: %s" % converted[1], "<math>", "eval")
+                    function = eval(code, {"math": math})
+                except SyntaxError:
+                    function = None
+
+        compiled.function = function, list(variables.keys())
+
+    return compiled.function
+
+
+def compile_vectorized_rate_law(expression):
+    """
+    Compile a MathML expression into a function that evaluates it at many points at once using NumPy.
+
+    This requires NumPy. Like compile_rate_law(), the function is only created once for each expression.
+
+    Parameters
+    ----------
+    expression : element representing a MathML expression
+
+    Returns
+    -------
+    function : a function taking an array with one row per point and one column per variable, and returning an array
+        containing the value of the expression at each point (or None if the expression cannot be evaluated, e.g.
+        because it is piecewise)
+
+    variables : list of the ids of the variables, in the order of the columns expected by the function
+
+    """
+    import numpy
+
+    compiled = compile_math(expression)
+
+    if compiled.vectorized is None:
+        function = None
+        variables = OrderedDict()
+
+        if compiled.is_piecewise:
+            sys.stderr.write("Encountered a piecewise function\n")
+        else:
+            converted = render_math(compiled, {}, output_type="numpy", variables=variables)
+            if converted and converted[1]:
+                try:
+                    code = compile("lambda values: %s" % converted[1], "<math>", "eval")
+                    factorial = numpy.vectorize(lambda x: math.gamma(x + 1), otypes=[float])
+                    evaluate = eval(code, {"numpy": numpy, "factorial": factorial})
+                    function = _vectorized(evaluate)
+                except SyntaxError:
+                    function = None
+
+        compiled.vectorized = function, list(variables.keys())
+
+    return compiled.vectorized
+
+
+def _vectorized(evaluate):
+    import numpy
+
+    def function(values):
+        values = numpy.asarray(values, dtype=float)
+        # Division by zero etc. produce inf or nan, rather than warnings
+        with numpy.errstate(all="ignore"):
+            result = evaluate(values)
+        # an expression that does not depend on any variable evaluates to a single value
+        return numpy.broadcast_to(numpy.asarray(result, dtype=float), values.shape[:1])
+
+    return function
+
+
+def compile_sympy_expression(expression):
+    """
+    Convert a MathML expression into a sympy expression, in which every variable is a positive Symbol.
+
+    This requires sympy. The sympy expression is built directly from the compiled expression (see compile_math), and is
+    stored with it, so is only created once for each distinct subexpression.
+
+    Parameters
+    ----------
+    expression : element representing a MathML expression, or a MathNode
+
+    Returns
+    -------
+    a sympy expression, or None if the expression cannot be converted (e.g. because it is piecewise)
+
+    """
+    compiled = expression if isinstance(expression, MathNode) else compile_math(expression)
+
+    if compiled.sympy is None:
+        compiled.sympy = _sympy_node(compiled)
+        if compiled.sympy is None:
+            compiled.sympy = False
+
+    if compiled.sympy is False:
+        return None
+    return compiled.sympy
+
+
+def _sympy_node(node):
+    import sympy
+
+    if node.name == "cn":
+        return sympy.sympify(node.text[1])
+    elif node.name == "ci":
+        return sympy.Symbol(node.text, positive=True)
+    elif node.name == "pi":
+        return sympy.pi
+    elif node.name == "exponentiale":
+        return sympy.E
+    elif node.name == "infinity":
+        return sympy.oo
+    elif node.name == "csymbol":
+        if "time" in node.text:
+            return sympy.Symbol("t", positive=True)
+        if "avogadro" in node.text:
+            return sympy.Symbol("N_A", positive=True)
+        return None
+
+    args = [compile_sympy_expression(arg) for arg in node.args]
+    if any(arg is None for arg in args):
+        return None
+
+    if node.name in ["math", "logbase", "degree"]:
+        return args[0] if len(args) == 1 else None
+    if node.name != "apply" or not args:
+        return None
+
+    operator = node.operator
+    functions = {"exp": sympy.exp, "ln": sympy.log, "floor": sympy.floor, "ceiling": sympy.ceiling,
+                 "factorial": sympy.factorial, "abs": sympy.Abs, "cos": sympy.cos, "sin": sympy.sin, "tan": sympy.tan,
+                 "sinh": sympy.sinh, "cosh": sympy.cosh, "tanh": sympy.tanh, "arcsin": sympy.asin,
+                 "arccos": sympy.acos, "arctan": sympy.atan}
+
+    if operator == "plus":
+        return sympy.Add(*args)
+    elif operator == "minus":
+        if len(args) == 1:
+            return -args[0]
+        return args[0] - sympy.Add(*args[1:])
+    elif operator == "times":
+        return sympy.Mul(*args)
+    elif operator == "divide" and len(args) == 2:
+        return args[0] / args[1]
+    elif operator == "power" and len(args) == 2:
+        return args[0] ** args[1]
+    elif operator == "delay":
+        return args[0]
+    elif operator in functions and len(args) == 1:
+        return functions[operator](args[0])
+    elif operator == "log":
+        # a logbase element precedes the argument
+        if len(args) == 1:
+            return sympy.log(args[0], 10)
+        return sympy.log(args[1], args[0])
+    elif operator == "root":
+        # a degree element precedes the argument
+        if len(args) == 1:
+            return sympy.sqrt(args[0])
+        return sympy.root(args[1], args[0])
+    return None
+
+
+def evaluate_derivative(expression, species_id, values, arithmetic=None):
+    """
+    Evaluate a MathML expression, and its derivative with respect to the concentration of a species, using forward-mode
+    automatic differentiation.
+
+    The compiled expression (see compile_math) is evaluated using dual numbers: each subexpression is evaluated to a
+    pair (value, derivative), and the derivative of each operator is computed from those of its arguments by the chain
+    rule, so the derivative is exact rather than estimated from differences. By default, this requires NumPy, and values
+    may be arrays, so the expression is evaluated at many points at once.
+
+    Parameters
+    ----------
+    expression : element representing a MathML expression, or a MathNode
+
+    species_id : the id of the species
+
+    values : dict mapping variable ids to their values (variables not in the dict have the value 1)
+
+    arithmetic : module providing the functions used to evaluate the expression (exp, log, power, etc.), in place of
+        NumPy; for example, interval_arithmetic, with Interval objects as values, gives intervals containing every value
+        and derivative of the expression for values in the given intervals
+
+    Returns
+    -------
+    value : the value of the expression (or None if it cannot be differentiated, e.g. because it is piecewise)
+
+    derivative : the derivative of the expression with respect to species_id
+
+    """
+    compiled = expression if isinstance(expression, MathNode) else compile_math(expression)
+
+    if arithmetic is not None:
+        result = _dual_node(compiled, species_id, values, {}, arithmetic)
+    else:
+        import numpy
+        with numpy.errstate(all="ignore"):
+            result = _dual_node(compiled, species_id, values, {}, numpy)
+    if result is None:
+        return None, None
+    return result
+
+
+def _dual_node(node, species_id, values, evaluated, arithmetic):
+    # Return the (value, derivative) pair for a compiled expression, or None if it cannot be differentiated
+    if node in evaluated:
+        return evaluated[node]
+
+    result = None
+    if node.name == "cn":
+        try:
+            result = float(node.text[1]), 0.0
+        except ValueError:
+            # e-notation and rational numbers are written as arithmetic expressions (a number that is empty, malformed
+            # or a rational with denominator 0 cannot be differentiated)
+            try:
+                result = float(eval(compile(node.text[1], "<math>", "eval"), {})), 0.0
+            except (SyntaxError, NameError, TypeError, ValueError, ZeroDivisionError, OverflowError):
+                result = None
+    elif node.name == "ci":
+        result = values.get(node.text, 1.0), 1.0 if node.text == species_id else 0.0
+    elif node.name == "pi":
+        result = math.pi, 0.0
+    elif node.name == "exponentiale":
+        result = math.e, 0.0
+    elif node.name == "infinity":
+        result = float("Inf"), 0.0
+    elif node.name == "csymbol":
+        # time and Avogadro's constant are 1, as in expressions generated with output_type "executable"
+        if "time" in node.text or "avogadro" in node.text:
+            result = 1.0, 0.0
+    else:
+        args = []
+        for arg in node.args:
+            args.append(_dual_node(arg, species_id, values, evaluated, arithmetic))
+            if args[-1] is None:
+                break
+        else:
+            if node.name in ["math", "logbase", "degree"]:
+                if len(args) == 1:
+                    result = args[0]
+            elif node.name == "apply" and args:
+                result = _dual_apply(node.operator, args, arithmetic)
+
+    evaluated[node] = result
+    return result
+
+
+def _dual_apply(operator, args, arithmetic):
+    # Apply an operator to (value, derivative) pairs
+    value, derivative = args[0]
+
+    if operator == "plus":
+        return sum(arg[0] for arg in args), sum(arg[1] for arg in args)
+    elif operator == "minus":
+        if len(args) == 1:
+            return -value, -derivative
+        return value - sum(arg[0] for arg in args[1:]), derivative - sum(arg[1] for arg in args[1:])
+    elif operator == "times":
+        for other_value, other_derivative in args[1:]:
+            value, derivative = value * other_value, derivative * other_value + value * other_derivative
+        return value, derivative
+    elif operator == "divide" and len(args) == 2:
+        (a, da), (b, db) = args
+        return a / b, (da * b - a * db) / (b * b)
+    elif operator == "power" and len(args) == 2:
+        return _dual_power(args[0], args[1], arithmetic)
+    elif operator == "root":
+        # a degree element precedes the argument
+        if len(args) == 1:
+            root = arithmetic.sqrt(value)
+            return root, derivative / (2 * root)
+        (n, dn), base = args
+        return _dual_power(base, (1.0 / n, -dn / (n * n)), arithmetic)
+    elif operator == "log":
+        # a logbase element precedes the argument
+        if len(args) == 1:
+            return arithmetic.log10(value), derivative / (value * math.log(10))
+        (b, db), (a, da) = args
+        log_a, log_b = arithmetic.log(a), arithmetic.log(b)
+        return log_a / log_b, (da / a * log_b - log_a * db / b) / (log_b * log_b)
+    elif operator == "delay":
+        return args[0]
+    elif len(args) != 1:
+        return None
+
+    if operator == "exp":
+        exp = arithmetic.exp(value)
+        return exp, exp * derivative
+    elif operator == "ln":
+        return arithmetic.log(value), derivative / value
+    elif operator == "abs":
+        return arithmetic.abs(value), arithmetic.sign(value) * derivative
+    elif operator in ["floor", "ceiling"]:
+        # piecewise constant
+        return getattr(arithmetic, "floor" if operator == "floor" else "ceil")(value), 0.0 * derivative
+    elif operator == "sin":
+        return arithmetic.sin(value), arithmetic.cos(value) * derivative
+    elif operator == "cos":
+        return arithmetic.cos(value), -arithmetic.sin(value) * derivative
+    elif operator == "tan":
+        return arithmetic.tan(value), derivative / arithmetic.cos(value) ** 2
+    elif operator == "sinh":
+        return arithmetic.sinh(value), arithmetic.cosh(value) * derivative
+    elif operator == "cosh":
+        return arithmetic.cosh(value), arithmetic.sinh(value) * derivative
+    elif operator == "tanh":
+        tanh = arithmetic.tanh(value)
+        return tanh, (1 - tanh * tanh) * derivative
+    elif operator == "arcsin":
+        return arithmetic.arcsin(value), derivative / arithmetic.sqrt(1 - value * value)
+    elif operator == "arccos":
+        return arithmetic.arccos(value), -derivative / arithmetic.sqrt(1 - value * value)
+    elif operator == "arctan":
+        return arithmetic.arctan(value), derivative / (1 + value * value)
+    return None
+
+
+def _dual_power(base, exponent, arithmetic):
+    (a, da), (b, db) = base, exponent
+    value = arithmetic.power(a, b)
+    derivative = b * arithmetic.power(a, b - 1) * da
+    # the exponent usually does not depend on the species, in which case log(a) (undefined if a <= 0) is not needed
+    if arithmetic.any(db != 0):
+        derivative = derivative + arithmetic.where(db != 0, value * arithmetic.log(a) * db, 0.0)
+    return value, derivative
 
 
 def convert_rate_law_inner(expression, initial_values, non_default_variables=False, non_default_values=1, output_type=""):
     """
-    Recursively convert a MathML expression to a string.
+    Convert a MathML expression to a string.
     Limitations: we do not handle piecewise functions or user-defined functions.
 
     Parameters
     ----------
-    expression :
+    expression : element representing a MathML expression
         
     non_default_variables : if specified, the name of any species whose id is not in this list is replaced by 1.0
          (Default value = False)
 
-    executable : if True, return a less human-readable string that can be eval'ed in Python (e.g. containing Math.e
-        instead of e) (Default value = False)
+    output_type : the kind of string to generate (see convert_rate_law)
 
     Returns
     -------
+    elementary : Boolean indicating whether the expression is a single term (so never needs parentheses)
+
     string representation of the kineticLaw
 
     """
+    return render_math(compile_math(expression), initial_values, non_default_variables, non_default_values,
+                       output_type)
 
-    elementary = False
 
-    generate_code = (output_type in ["executable", "sympy"])
+def render_math(node, initial_values, non_default_variables=False, non_default_values=1, output_type="", variables=None):
+    """
+    Recursively convert a compiled MathML expression (see compile_math) to a string.
 
-    if expression.name == "cn":
+    Unless variables are being replaced by values, the result is stored on the node for each output_type.
 
-        if "type" in list(expression.attrs.keys()):
-            children = []
-            term = ""
-            for child in expression.children:
-                children.append(child)
+    Parameters
+    ----------
+    node : a MathNode
 
-            if expression.attrs["type"] == "e-notation":
-                term = "%s * 10^(%s)" % (children[0], children[2])
-                if generate_code:
-                    term = "%s * 10**(%s)" % (children[0], children[2])
-            elif expression.attrs["type"] in ["real", "integer"]:
-                term = children[0]
-            elif expression.attrs["type"] == "rational":
-                term = "%s/%s" % (children[0], children[2])
-        else:
-            term = expression.string.strip()
+    non_default_variables : if specified, the name of any species whose id is not in this list is replaced by 1.0
+         (Default value = False)
 
-        elementary = True
+    output_type : "" for a human-readable string, "executable" for a string that can be eval'ed in Python (e.g.
+        containing math.e instead of e), "sympy" for a string that uses sympy functions, or "numpy" for a string
+        that uses NumPy functions, so applies elementwise to arrays
 
+    variables : if specified, an OrderedDict to which the id of each variable is added; the variable is replaced by
+        the corresponding element of a list named values (see compile_rate_law), or for "numpy" output by the
+        corresponding column of an array named values (see compile_vectorized_rate_law)
+
+    Returns
+    -------
+    elementary : Boolean indicating whether the expression is a single term (so never needs parentheses)
+
+    string representation of the kineticLaw
+
+    """
+    if non_default_variables or variables is not None:
+        return _render_node(node, initial_values, non_default_variables, non_default_values, output_type, variables)
+
+    if node.renderings is None:
+        node.renderings = {}
+    if output_type not in node.renderings:
+        node.renderings[output_type] = _render_node(node, initial_values, non_default_variables, non_default_values,
+                                                    output_type)
+    return node.renderings[output_type]
+
+
+def _render_node(node, initial_values, non_default_variables, non_default_values, output_type, variables=None):
+    elementary = False
+
+    generate_code = (output_type in ["executable", "sympy", "numpy"])
+
+    if node.name == "cn":
+        elementary = True
+        term, code = node.text
+        if generate_code:
+            return elementary, code
         return elementary, term
 
-    elif expression.name == "ci":
+    elif node.name == "ci":
         elementary = True
-        term = expression.string.strip()
+        term = node.text
 
-        if non_default_variables:
+        if variables is not None:
+            if output_type == "numpy":
+                term = "values[:, %s]" % variables.setdefault(term, len(variables))
+            else:
+                term = "values[%s]" % variables.setdefault(term, len(variables))
+        elif non_default_variables:
             if term in non_default_variables:
                 term = non_default_values
             elif term in list(initial_values.keys()):
@@ -140,42 +899,31 @@ def convert_rate_law_inner(expression, initial_values, non_default_variables=Fal
 
         return elementary, term
 
-    if expression.name in ["pi", "infinity"]:
-        return True, convert_function(output_type, expression.name)
-    if expression.name == "exponentiale":
+    if node.name in ["pi", "infinity"]:
+        return True, convert_function(output_type, node.name)
+    if node.name == "exponentiale":
         return True, convert_function(output_type, "e")
 
-    # math may contain either an <apply> or a <cn>
-    if expression.name == "math":
-        for child in expression.children:
-            if not isinstance(child, NavigableString):
-                return convert_rate_law_inner(child, initial_values, non_default_variables, non_default_values, output_type)
+    # math may contain either an <apply> or a <cn>; logbase and degree (used with log and root) contain one argument
+    if node.name in ["math", "logbase", "degree"]:
+        for arg in node.args:
+            return render_math(arg, initial_values, non_default_variables, non_default_values, output_type, variables)
 
-    if expression.name == "csymbol":
-        if "time" in expression.attrs['definitionURL']:
+    if node.name == "csymbol":
+        if "time" in node.text:
             return True, convert_function(output_type, "t")
 
-        if "avogadro" in expression.attrs['definitionURL']:
+        if "avogadro" in node.text:
             return True, convert_function(output_type, "N_A")
 
     # First child is operator; next are arguments
-    if expression.name == "apply":
-        operator = None
-        args = []
-        for child in expression.children:
-            if not operator:
-                operator = child.name
-                if child.name == "csymbol" and child.string.strip() == "delay":
-                    operator = "delay"
-            else:
-                if isinstance(child, NavigableString):
-                    continue
-                args.append(child)
+    if node.name == "apply":
+        operator = node.operator
 
         children_converted = []
         children_elementary = []
-        for arg in args:
-            child_elementary, child_converted = convert_rate_law_inner(arg, initial_values, non_default_variables, non_default_values, output_type)
+        for arg in node.args:
+            child_elementary, child_converted = render_math(arg, initial_values, non_default_variables, non_default_values, output_type, variables)
             children_converted.append(child_converted)
             children_elementary.append(child_elementary)
 
@@ -213,12 +961,16 @@ def convert_rate_law_inner(expression, initial_values, non_default_variables=Fal
             return elementary, "%s <= %s " % (children_converted[0], children_converted[1])
         elif operator == "or":
             children_converted = add_parens(children_elementary, children_converted)
+            if output_type == "numpy":
+                return elementary, "numpy.logical_or(%s, %s)" % (children_converted[0], children_converted[1])
             return elementary, "%s or %s " % (children_converted[0], children_converted[1])
         elif operator == "and":
             children_converted = add_parens(children_elementary, children_converted)
+            if output_type == "numpy":
+                return elementary, "numpy.logical_and(%s, %s)" % (children_converted[0], children_converted[1])
             return elementary, "%s and %s " % (children_converted[0], children_converted[1])
         elif operator == "delay":
-            if output_type in ["executable", "sympy"]:
+            if output_type in ["executable", "sympy", "numpy"]:
                 return elementary, children_converted[0]
             return elementary, "delay(%s, %s)" % (children_converted[0], children_converted[1])
         elif operator in ["exp", "ln", "floor", "ceiling", "factorial", "abs", "cos", "sin", "tan", "sinh", "cosh",
@@ -233,6 +985,8 @@ def convert_rate_law_inner(expression, initial_values, non_default_variables=Fal
                     return elementary, "math.log(%s, %s)" % (children_converted[1], children_converted[0])
                 elif output_type == "sympy":
                     return elementary, "sympy.log(%s, %s)" % (children_converted[1], children_converted[0])
+                elif output_type == "numpy":
+                    return elementary, "numpy.log(%s) / numpy.log(%s)" % (children_converted[1], children_converted[0])
 
                 return elementary, "%s_%s(%s)" % ("log", children_converted[0], children_converted[1])
 
@@ -246,23 +1000,10 @@ def convert_rate_law_inner(expression, initial_values, non_default_variables=Fal
             if len(children_converted) == 2:
                 if output_type == "executable":
                     return elementary, "pow(%s, 1/%s)" % (children_converted[1], children_converted[0])
+                elif output_type == "numpy":
+                    return elementary, "numpy.power(%s, 1.0/%s)" % (children_converted[1], children_converted[0])
                 return elementary, "%s(%s, %s)" % (convert_function(output_type, "root"), children_converted[0], children_converted[1])
 
-    elif expression.name == "logbase":
-
-        for child in expression.children:
-            if isinstance(child, NavigableString):
-                continue
-
-            child_elementary, child_converted = convert_rate_law_inner(child, initial_values, non_default_variables, non_default_values, output_type)
-            return child_elementary, child_converted
-
-    if expression.name == "degree":
-        # degree tag used with root
-        for child in expression.children:
-            if not isinstance(child, NavigableString):
-                return convert_rate_law_inner(child, initial_values, non_default_variables, non_default_values, output_type)
-
 
 def inline_all_functions(model):
     """
@@ -271,9 +1012,13 @@ def inline_all_functions(model):
     This is a safe to perform: the SBML L3V1 Core Specification states:
     "With the restrictions as they are, function definitions could, if desired, be implemented as textual substitutions"
 
+    The substitution is made in the compiled form of each expression (see compile_math), rather than in the MathML,
+    which is left unchanged. Function definitions are first compiled themselves, in an order such that each function is
+    compiled after the functions it uses, so that every function body is compiled only once.
+
     Parameters
     ----------
-    model : bs4.BeautifulSoup object produced by parsing an SBML model
+    model : Model (intermediate representation of an SBML model)
 
     Returns
     -------
@@ -283,85 +1028,144 @@ def inline_all_functions(model):
     # Get function definitions
     function_definition = {}
 
-    function_definitions = model.select_one('listOfFunctionDefinitions')
-
-    if not function_definitions:
+    if not model.function_definitions:
         return model
 
-    for function in function_definitions.select("functionDefinition"):
+    for function in model.function_definitions.values():
 
-        function_id = function.attrs["id"]
-        math = copy.copy(function.select_one("math").select_one("lambda"))
+        function_id = function.id
+        math = function.math.select_one("lambda")
 
-        # get list of arguments to this function
+        # get list of arguments to this function, and the body of the function (which follows them)
         args = []
-        for bvar in math.select('bvar'):
-            args.append(bvar.select_one('ci').text.strip())
-
-        # now remove the bvars the get the body of the function
-        for bvar in math.select("bvar"):
-            bvar.replace_with('')
-
         inner = ""
         for child in math.contents:
-            if not isinstance(child, NavigableString):
+            if isinstance(child, str):
+                continue
+            if child.name == "bvar":
+                args.append(child.select_one('ci').get_text().strip())
+            else:
                 inner = child
                 break
 
         function_definition[function_id] = {"math": inner, "arguments": args}
 
-    # Replace function calls with inlined definitions
-    replaced = True
-    while replaced:
-        replaced = False
-
-        for math in model.select("math"):
-            for apply_element in math.select('apply'):
-                # get list of tag children
-                children = []
-                for child in apply_element.contents:
-                    if not isinstance(child, NavigableString):
-                        children.append(child)
-
-                name = children[0].text.strip()
-                if name in list(function_definition.keys()):
-                    inlined = inline_function_call(function_definition[name], children[1:])
-                    apply_element.replace_with(inlined)
-                    replaced = True
-                    break
+    # Compile the function definitions, inlining the functions that each uses
+    functions = {}
+    for function_id in order_function_definitions(function_definition):
+        body = function_definition[function_id]["math"]
+        if body:
+            functions[function_id] = {"math": compile_math(body, functions),
+                                      "arguments": function_definition[function_id]["arguments"]}
+
+    # Recompile every other expression, replacing function calls with inlined definitions
+    definitions = set(id(function.math) for function in model.function_definitions.values())
+    for math in model.math_expressions():
+        if id(math) in definitions:
+            continue
+        math.functions = functions
+        math.compiled = None
+        for element in math.descendants():
+            element.compiled = None
+        compile_math(math)
     return model
 
 
-def inline_function_call(func, arguments):
+def _called_function(apply_element, function_definition):
+    # Return the id of the user-defined function called by an apply element
+    for child in apply_element.contents:
+        if not isinstance(child, str):
+            name = child.get_text().strip()
+            if name in function_definition:
+                return name
+            break
+    return None
+
+
+def order_function_definitions(function_definition):
     """
+    Sort user-defined functions so that each function follows the functions that it uses.
 
     Parameters
     ----------
-    func : dict representing user defined function
-    arguments : BeautifulSoup object representing the expressions used as arguments to the function
+    function_definition : dict whose keys are function ids, and values are dicts representing each function (see
+        inline_all_functions)
 
     Returns
     -------
-    BeautifulSoup object representing the supplied expressions substituted into the function definition
+    list of function ids
+
+    """
+    uses = {}
+    for function_id, function in function_definition.items():
+        uses[function_id] = []
+        if function["math"]:
+            for apply_element in [function["math"]] + function["math"].select("apply"):
+                name = _called_function(apply_element, function_definition)
+                if name and name not in uses[function_id]:
+                    uses[function_id].append(name)
+
+    ordered = []
+    finished = set()
+    for function_id in function_definition:
+        if function_id in finished:
+            continue
+
+        # depth-first search, using an explicit stack of (function id, iterator over the functions it uses)
+        path = [function_id]
+        stack = [(function_id, iter(uses[function_id]))]
+        while stack:
+            current, used = stack[-1]
+            for used_id in used:
+                if used_id in path:
+                    cycle = path[path.index(used_id):] + [used_id]
+                    raise RuntimeError("Function definitions are recursive: %s" % " -> ".join(cycle))
+                if used_id not in finished:
+                    path.append(used_id)
+                    stack.append((used_id, iter(uses[used_id])))
+                    break
+            else:
+                stack.pop()
+                path.pop()
+                finished.add(current)
+                ordered.append(current)
+
+    return ordered
+
+
+def inline_function_call(func, arguments):
     """
-    math = func["math"]
-    args = func["arguments"]
+    Substitute the arguments of a call to a user-defined function into the compiled body of the function.
 
-    math = copy.copy(math)
+    Subexpressions that do not contain any of the function's arguments are shared with the function body, and the
+    arguments are shared with the call, rather than copied.
 
-    # for each arg, get list of ci elements
-    cis = {}
-    for ci in math.select("ci"):
-        variable_name = ci.text.strip()
-        if variable_name in args:
-            if variable_name not in list(cis.keys()):
-                cis[variable_name] = []
-            cis[variable_name].append(ci)
+    Parameters
+    ----------
+    func : dict representing user defined function, whose "math" is a compiled MathNode
+    arguments : MathNode objects representing the expressions used as arguments to the function
 
-    # now replace each element in this list
-    for i in range(len(args)):
-        if args[i] in list(cis.keys()):
-            for ci in cis[args[i]]:
-                ci.replace_with(copy.copy(arguments[i]))
+    Returns
+    -------
+    MathNode representing the supplied expressions substituted into the function definition
+    """
+    replacements = dict(zip(func["arguments"], arguments))
+    substituted = {}
+
+    def substitute(node):
+        if node.name == "ci":
+            return replacements.get(node.text, node)
+        if not node.args:
+            return node
+
+        result = substituted.get(node)
+        if result is None:
+            args = tuple(substitute(arg) for arg in node.args)
+            if all(new is old for new, old in zip(args, node.args)):
+                result = node
+            else:
+                result = make_math_node(node.name, node.operator, node.text, args)
+            substituted[node] = result
+        return result
 
-    return math
+    return substitute(func["math"])
@@ -1,30 +1,64 @@
-from bs4 import BeautifulSoup
 from .accessor_functions import *
 from .generate_dot import *
-from .DiffObject import DiffObject
+from .DiffObject import DiffObject, DIFF_BACKENDS, model_bit, model_indexes
+from .ir import extract_models
+import os
+from .cache import ClassificationCache, CLASSIFICATION_CACHE_FILE, DEFAULT_CACHE_SIZE, ModelCache, sqlite3
+from .effect_direction import classify_algebraically, DEFAULT_SYMPY_TIMEOUT, EFFECT_ENGINES, interaction_key, \
+    InteractionMemo
+from .document import DEFAULT_PARSER, PARSERS
 from .rate_laws import *
 from .miriam import align_models
 from tabulate import tabulate
 import sys
 import re
 
+# The sections of a model (see model_index.SECTIONS) used to produce each kind of output that does not need the whole
+# model
+OUTPUT_SECTIONS = {
+    "kinetics": ["reactions"],
+    "params": ["parameters"],
+    "abstract": ["compartments", "species", "reactions", "parameters"],
+}
+
+# Models with more reactions than this use automatic differentiation to find the direction of interactions by default,
+# as comparing two values of each expression is too coarse, and sympy too slow
+LARGE_MODEL_REACTIONS = 1000
+
 
 class SBMLDiff:
 
-    def __init__(self, model_strings, model_names, generate_dot, align=False, cartoon=False, show_params=True, hide_rules=False, use_sympy=""):
+    def __init__(self, model_strings, model_names, generate_dot, align=False, cartoon=False, show_params=True, hide_rules=False, use_sympy="", parser=DEFAULT_PARSER, jobs=1,
+                 cache_dir=None, cache_size=DEFAULT_CACHE_SIZE, sections=None, sympy_timeout=DEFAULT_SYMPY_TIMEOUT,
+                 effect_engine=None, diff_backend="dict"):
         """
 
         Parameters
         ----------
-        model_strings : a list, in which each element is an SBML model as a string
+        model_strings : a list, in which each element is an SBML model as a string, bytes, memoryview or mmap, or a
+            file object (models may be compressed using gzip, bz2 or xz, or stored in a zip file or COMBINE archive)
         model_names : names of each model (used as headings for the columns in table)
         generate_dot : instance of the GenerateDot class
         align : Boolean indicating whether to try to match using MIRIAM annotations as well as reaction/species id
         cartoon : Boolean indicating whether to draw transcription as a SBOLv promoter/CSD glyph, and hide degredation
+        parser : "lxml", "bs4" or "stream", specifying how models are parsed (see parse_model); by default,
+            DEFAULT_PARSER
+        jobs : number of processes to use to parse the models, and to classify interactions using sympy
+        cache_dir : directory in which to cache parsed models, and the direction of interactions (see
+            ClassificationCache), or None
+        cache_size : maximum total size of the cache directory, in bytes
+        sections : list of the sections of each model to load (see model_index.SECTIONS and OUTPUT_SECTIONS), or None
+            to load every section (which is required by diff_models())
+        sympy_timeout : if use_sympy is set, the time limit in seconds for classifying each interaction using sympy,
+            after which it is classified numerically (see classify_algebraically)
+        effect_engine : method used to determine the direction of each interaction (one of
+            effect_direction.EFFECT_ENGINES); by default, "sympy" if use_sympy is set, "dual" if any model has more than
+            LARGE_MODEL_REACTIONS reactions, and otherwise "numeric"
+        diff_backend : how the models containing each feature are stored (one of DiffObject.DIFF_BACKENDS)
 
         Returns
         -------
-        models : list of models (each a bs4.BeautifulSoup object produced by parsing an SBML model)
+        models : list of models (each a Model, the intermediate representation of an SBML model)
 
         """
 
@@ -36,67 +70,38 @@ class SBMLDiff:
         self.show_params = show_params
         self.hide_rules = hide_rules
         self.use_sympy = use_sympy
+        self.parser = parser
+        self.jobs = jobs
+        self.sections = sections
+        self.sympy_timeout = sympy_timeout
+
+        self.cache = None
+        self.classification_cache = None
+        if cache_dir:
+            self.cache = ModelCache(cache_dir, cache_size)
+            if sqlite3 is not None:
+                self.classification_cache = ClassificationCache(os.path.join(cache_dir, CLASSIFICATION_CACHE_FILE))
+
+        # String representing each distinct expression (see convert_math)
+        self.converted_math = {}
+
+        # Direction of each interaction, shared by every comparison that needs it
+        self.interaction_memo = InteractionMemo(sympy_timeout)
+
+        # Extract the parts of each model that are compared, so the parsed documents can be released
+        self.models = extract_models(self.model_strings, self.parser, self.jobs, self.cache, self.sections)
+
+        if effect_engine is None:
+            if use_sympy:
+                effect_engine = "sympy"
+            elif any(len(model.reactions) > LARGE_MODEL_REACTIONS for model in self.models):
+                effect_engine = "dual"
+            else:
+                effect_engine = "numeric"
+        self.effect_engine = effect_engine
+        self.use_sympy = effect_engine == "sympy"
 
-        self.diff_object = DiffObject()
-
-        self.models = [BeautifulSoup(x, 'xml') for x in self.model_strings]
-
-        # Avoid need to search for reactions by id
-        self.reactions = []
-        for model in self.models:
-            mr = {}
-            reaction_list = model.select_one("listOfReactions")
-            if reaction_list:
-                for reaction in reaction_list.select("reaction"):
-                    reaction_id = reaction.attrs["id"]
-                    mr[reaction_id] = reaction
-            self.reactions.append(mr)
-
-        # avoid need to keep finding reactant compartments
-        self.species_compartment = []
-        self.initial_value = []
-        for model in self.models:
-            tmp = {}
-            tmp_concentrations = {}
-
-            species_list = model.select_one("listOfSpecies")
-            if species_list:
-                for species in species_list.select("species"):
-                    species_id = species.attrs["id"]
-                    compartment = species.attrs["compartment"]
-                    tmp[species_id] = compartment
-
-                    if "initialConcentration" in species.attrs:
-                        tmp_concentrations[species_id] = species.attrs["initialConcentration"]
-
-            self.species_compartment.append(tmp)
-            self.initial_value.append(tmp_concentrations)
-
-        # get initial parameter values
-        self.initial_parameters = []
-        for model_num, model in enumerate(self.models):
-            for param in model.select("parameter"):
-                if "id" not in list(param.attrs.keys()):
-                    continue
-                param_id = param.attrs["id"]
-                if "value" in param.attrs:
-                    self.initial_value[model_num][param_id] = param.attrs["value"]
-
-        # avoid need to search for reaction name
-        self.reaction_name = []
-        for model in self.models:
-            tmp = {}
-
-            reaction_list = model.select_one("listOfReactions")
-            if reaction_list:
-                for r in reaction_list.select("reaction"):
-                    reaction_id = r.attrs["id"]
-                    if "name" in list(r.attrs.keys()) and r.attrs["name"]:
-                        tmp[reaction_id] = r.attrs["name"]
-                    else:
-                        tmp[reaction_id] = reaction_id
-
-            self.reaction_name.append(tmp)
+        self.diff_object = DiffObject(len(self.models), diff_backend)
 
         if self.cartoon:
             self.elided_list = []
@@ -105,6 +110,30 @@ class SBMLDiff:
             self.find_downstream_species()
 
         self.modified_params = {}
+        self.regulatory_arrows = None
+
+    def convert_math(self, math):
+        """
+        Convert a MathML expression to a string, using the same string for all expressions that are equal up to the
+        order of the arguments of plus and times (see rate_laws.canonical_id), so equal expressions in different models
+        are not reported as different.
+
+        Parameters
+        ----------
+        math : MathExpr, or None
+
+        Returns
+        -------
+        string representation of the expression
+
+        """
+        if not math:
+            return convert_rate_law(math)
+
+        key = canonical_id(math)
+        if key not in self.converted_math:
+            self.converted_math[key] = convert_rate_law(math)
+        return self.converted_math[key]
 
     def check_model_supported(self):
         """
@@ -113,13 +142,13 @@ class SBMLDiff:
         """
         for model in self.models:
 
-            if model.select_one('listOfReactions') and not model.select_one('listOfSpecies'):
+            if model.has_list_of_reactions and not model.has_list_of_species:
                 raise RuntimeError("Every model that includes a listOfReactions must include a listOfSpecies.")
 
-            if not model.select_one('sbml') or 'xmlns' not in list(model.select_one('sbml').attrs.keys()):
+            if not model.namespace:
                 raise RuntimeError("Every file must be an sbml model")
 
-            if "level1" in model.select_one('sbml').attrs['xmlns']:
+            if "level1" in model.namespace:
                 raise RuntimeError("Every model must be in SBML level 2 or higher, since sbml-diff relies on id attributes")
 
     def print_rate_law_table(self, output_format="simple"):
@@ -141,21 +170,20 @@ class SBMLDiff:
         rows = []
         for reaction_id in reactions:
             rates = [reaction_id]
+            rate_law_ids = []
             for model_num, model in enumerate(self.models):
                 found_kinetic_law = False
-                r = model.select_one("listOfReactions").find(id=reaction_id)
-                if r:
-                    kinetic_law = r.select_one("kineticLaw")
-                    if kinetic_law:
-                        math_tag = kinetic_law.select_one("math")
-                        rates.append(convert_rate_law(math_tag))
-                        found_kinetic_law = True
+                r = model.reactions.get(reaction_id)
+                if r and r.rate_law is not None:
+                    rates.append(convert_rate_law(r.rate_law))
+                    rate_law_ids.append(canonical_id(r.rate_law))
+                    found_kinetic_law = True
 
                 if not found_kinetic_law:
                     rates.append("-")
+                    rate_law_ids.append(None)
 
-                r = rates[1:]
-                if r.count(r[0]) != len(r):
+                if rate_law_ids.count(rate_law_ids[0]) != len(rate_law_ids):
                     self.generate_dot.differences_found = True
 
             rows.append(rates)
@@ -171,23 +199,21 @@ class SBMLDiff:
         output_format : a table format supported by tabulate (e.g. simple, html)
         """
 
-        models = [BeautifulSoup(x, 'xml') for x in self.model_strings]
-
         param_value = {}
-        for model_num, model in enumerate(models):
+        for model_num, model in enumerate(self.models):
             param_ids, param_values = get_params(model)
 
             for param_id in param_ids:
 
-                if param_id not in list(param_value.keys()):
+                if param_id not in param_value:
                     param_value[param_id] = {}
                 param_value[param_id][model_num] = param_values[param_id]
 
         rows = []
         for param_id in list(param_value.keys()):
             row = [param_id]
-            for model_num, model in enumerate(models):
-                if model_num in list(param_value[param_id].keys()):
+            for model_num, model in enumerate(self.models):
+                if model_num in param_value[param_id]:
                     row.append(param_value[param_id][model_num])
                 else:
                     row.append("-")
@@ -211,20 +237,13 @@ class SBMLDiff:
         event_objects = {}
 
         for model_num, model in enumerate(self.models):
-            event_list = model.select_one("listOfEvents")
-            if not event_list:
-                continue
-
-            for event in event_list.select('event'):
+            for event_id in model.events:
+                event = model.events[event_id]
 
-                if 'id' not in list(event.attrs.keys()):
-                    event.attrs["id"] = str(hash(event))
-                event_id = event.attrs["id"]
+                if event_id not in event_status:
+                    event_status[event_id] = 0
 
-                if event_id not in list(event_status.keys()):
-                    event_status[event_id] = []
-
-                event_status[event_id].append(model_num)
+                event_status[event_id] |= model_bit(model_num)
                 event_objects[event_id] = event
 
         for event_id in list(event_objects.keys()):
@@ -237,59 +256,54 @@ class SBMLDiff:
         # process trigger statement
         event_name = ""
 
-        for model_num in model_set:
-            species_ids = list(self.species_compartment[model_num].keys())
-            event = self.models[model_num].select_one('#' + event_id)
+        for model_num in model_indexes(model_set):
+            model = self.models[model_num]
+            species_ids = model.species
+            event = model.events[event_id]
 
             # process model name
-            if not event_name and "name" in list(event.attrs.keys()):
-                event_name = event.attrs["name"]
+            if not event_name and event.name is not None:
+                event_name = event.name
 
             # process trigger statements
-            trigger = event.select_one("trigger")
+            trigger = event.trigger
             if trigger:
-                for ci in trigger.select("ci"):
-                    entity = ci.text.strip()
+                for entity in math_variables(trigger):
                     if entity in species_ids:
                         diff_event.add_trigger_species(entity, event_id, model_num)
                     else:
                         diff_event.add_param(entity, event_id, model_num)
 
-                trigger_expr = trigger.select_one("math")
-                if not trigger_expr:
-                    trigger_expr = ""
-                trigger_expr = convert_rate_law(trigger_expr)
+                trigger_expr = self.convert_math(trigger)
                 diff_event.add_trigger(trigger_expr, model_num)
 
-            event_assignments = event.select("eventAssignment")
-            if event_assignments:
-                for event in event_assignments:
-                    if isinstance(event, NavigableString):
-                        continue
+            for assignment in event.assignments:
 
-                    # math
-                    math = event.select_one("math")
-                    if not math:
-                        math = ""
-                    converted_math = convert_rate_law(math)
+                # math
+                math = assignment.math
+                converted_math = self.convert_math(math)
 
-                    # arrow to species set
-                    variable_id = event.attrs["variable"]
-                    if variable_id in species_ids:
-                        diff_event.add_set_species(variable_id, converted_math, model_num)
+                # arrow to species set
+                variable_id = assignment.variable
+                if variable_id in species_ids:
+                    diff_event.add_set_species(variable_id, converted_math, model_num)
 
-                    elif self.show_params:
-                        diff_event.add_set_species(variable_id, converted_math, model_num)
+                elif self.show_params:
+                    diff_event.add_set_species(variable_id, converted_math, model_num)
 
-                    # arrow from species affecting expression
-                    for ci in math.select("ci"):
-                        species = ci.text.strip()
-                        arrow_direction = categorise_interaction(math.parent, species, self.initial_value[model_num], use_sympy=self.use_sympy)
+                if not math:
+                    continue
 
-                        if species in species_ids:
-                            diff_event.add_event_affect_value_arrow(variable_id, species, event_id, arrow_direction, model_num)
-                        else:
-                            diff_event.add_assignment_param_arrow(variable_id, species, event_id, arrow_direction, model_num)
+                # arrow from species affecting expression
+                for species in math_variables(math):
+                    arrow_direction = categorise_interaction(math, species, model.initial_values,
+                                                             engine=self.effect_engine, cache=self.classification_cache,
+                                                             memo=self.interaction_memo)
+
+                    if species in species_ids:
+                        diff_event.add_event_affect_value_arrow(variable_id, species, event_id, arrow_direction, model_num)
+                    else:
+                        diff_event.add_assignment_param_arrow(variable_id, species, event_id, arrow_direction, model_num)
 
         # record event node
         diff_event.set_event(event_id, event_name, model_set)
@@ -302,36 +316,26 @@ class SBMLDiff:
         rule_diffs = {}
 
         for model_num, model in enumerate(self.models):
-
-            rule_list = model.select_one("listOfRules")
-            if not rule_list:
-                continue
-
-            for rule in rule_list.select("algebraicRule"):
+            for rule in model.algebraic_rules:
 
                 # find species occurring in this rule
-                species_ids = []
-                species_list = model.select_one("listOfSpecies")
                 species_in_rule = []
                 params_in_rule = []
 
-                if species_list:
-                    for s in species_list.select("species"):
-                        species_ids.append(s.attrs["id"])
-
-                for ci in rule.select("ci"):
-                    species_id = ci.string.strip()
-                    if species_id in species_ids:
-                        species_in_rule.append(species_id)
-                    else:
-                        params_in_rule.append(species_id)
+                rate_law = rule.math
+                if rate_law:
+                    for species_id in math_variables(rate_law):
+                        if species_id in model.species:
+                            species_in_rule.append(species_id)
+                        else:
+                            params_in_rule.append(species_id)
 
                 # Choose an id  to represent this rule
-                if "metaid" in list(rule.attrs.keys()):
-                    rule_id = rule.attrs["metaid"]
+                if rule.metaid is not None:
+                    rule_id = rule.metaid
                 else:
                     rule_id = "assignmentRule" + "_".join(species_in_rule)
-                if rule_id not in list(rule_diffs.keys()):
+                if rule_id not in rule_diffs:
                     rule_diffs[rule_id] = self.diff_object.compartments["NONE"].add_rule(rule_id)
 
                 for species_id in species_in_rule:
@@ -340,10 +344,7 @@ class SBMLDiff:
                 for param_id in params_in_rule:
                     rule_diffs[rule_id].add_parameter_rule(model_num, rule_id, param_id, 'none')
 
-                rate_law = rule.select_one("math")
-                if not rate_law:
-                    rate_law = ""
-                converted_rate_law = convert_rate_law(rate_law)
+                converted_rate_law = self.convert_math(rate_law)
                 rule_diffs[rule_id].add_rate_law(model_num, converted_rate_law)
 
     def diff_rules(self):
@@ -355,11 +356,10 @@ class SBMLDiff:
             these_rule_targets = get_variables_set_by_rules(model)
 
             for rule_target in these_rule_targets:
-                species_list = model.select_one('listOfSpecies')
-                if not species_list or rule_target not in list(self.species_compartment[model_num].keys()):
-                    if rule_target not in list(self.modified_params.keys()):
-                        self.modified_params[rule_target] = set()
-                    self.modified_params[rule_target].add(model_num)
+                if rule_target not in model.species:
+                    if rule_target not in self.modified_params:
+                        self.modified_params[rule_target] = 0
+                    self.modified_params[rule_target] |= model_bit(model_num)
 
                 rule_targets.add(rule_target)
 
@@ -383,30 +383,30 @@ class SBMLDiff:
 
         diff_rules = {}
         for model_num, model in enumerate(self.models):
-            _, compartment, rate_law = get_rule_details(model, target_id, self.species_compartment[model_num])
+            _, compartment, rate_law = get_rule_details(model, target_id)
 
             self.diff_object.check_compartment_exists(compartment)
-            if compartment not in list(diff_rules.keys()):
+            if compartment not in diff_rules:
                 diff_rules[compartment] = self.diff_object.compartments[compartment].add_rule(target_id)
 
             if not rate_law:
                 rate_law = ""
 
-            converted_rate_law = convert_rate_law(rate_law)
+            converted_rate_law = self.convert_math(rate_law)
             diff_rules[compartment].add_rate_law(model_num, converted_rate_law)
 
-            entities = rate_law.select("ci")
-            for entity in entities:
-                entity = entity.string.strip()
-                arrow_direction = categorise_interaction(rate_law.parent, entity, self.initial_value[model_num], use_sympy=self.use_sympy)
+            for entity in math_variables(rate_law):
+                arrow_direction = categorise_interaction(rate_law, entity, model.initial_values,
+                                                         engine=self.effect_engine, cache=self.classification_cache,
+                                                         memo=self.interaction_memo)
 
-                if entity in list(self.species_compartment[model_num].keys()):
+                if entity in model.species:
                     diff_rules[compartment].add_modifier_arrow(model_num, target_id, entity, arrow_direction)
                 else:
                     diff_rules[compartment].add_parameter_rule(model_num, target_id, entity, arrow_direction)
 
             # targets
-            if self.show_params or (target_id in list(self.species_compartment[model_num].keys())):
+            if self.show_params or (target_id in model.species):
                 diff_rules[compartment].add_target_arrow(model_num, target_id)
 
     def diff_reactions(self):
@@ -437,11 +437,13 @@ class SBMLDiff:
         is_transcription = False
 
         for model_num, model in enumerate(self.models):
-            if reaction_id not in list(self.reactions[model_num].keys()):
+            if reaction_id not in model.reactions:
                 continue
-            reaction = self.reactions[model_num][reaction_id]
+            reaction = model.reactions[reaction_id]
 
-            reactants, products, compartment, rate_law, rs, ps = get_reaction_details(model, reaction, self.species_compartment[model_num])
+            reactants = reaction.reactant_ids
+            products = reaction.product_ids
+            rate_law = reaction.rate_law
 
             # Skip processing reaction if it should not be drawn for this model
             show_reaction = True
@@ -462,58 +464,50 @@ class SBMLDiff:
             if not show_reaction:
                 continue
 
-            if self.cartoon and "sboTerm" in list(reaction.attrs.keys()) and \
-                    reaction.attrs['sboTerm'] in ["SBO:0000183", "SBO:0000589"]:
+            if self.cartoon and reaction.sbo_term in ["SBO:0000183", "SBO:0000589"]:
                 is_transcription = True
 
             # only perform comparison between models in which this reaction actually occurs
-            if not reactants and not products and not compartment and not rate_law and not rs and not ps:
+            if not reactants and not products and not reaction.compartment and not rate_law:
                 continue
 
-            is_fast = False
-            if "fast" in list(reaction.attrs.keys()) and reaction.attrs["fast"] in ['1', 'true']:
-                is_fast = True
-            is_irreversible = False
-            if "reversible" in list(reaction.attrs.keys()) and reaction.attrs["reversible"] in ['0', 'false']:
-                is_irreversible = True
+            converted_rate_law = self.convert_math(rate_law)
+            reaction_name = get_reaction_name(model, reaction_id)
 
-            converted_rate_law = convert_rate_law(rate_law)
-            reaction_name = self.reaction_name[model_num][reaction_id]
-
-            self.diff_object.check_compartment_exists(compartment)
-            diff_compartment = self.diff_object.compartments[compartment]
+            self.diff_object.check_compartment_exists(reaction.compartment)
+            diff_compartment = self.diff_object.compartments[reaction.compartment]
             diff_reaction = diff_compartment.add_reaction(reaction_id, rate_law, reaction_name,
-                                                          converted_rate_law, is_fast, is_irreversible,
+                                                          converted_rate_law, reaction.is_fast, reaction.is_irreversible,
                                                           is_transcription, model_num)
 
             # reactant arrows
-            for ind, stoich in enumerate(rs):
-                diff_reaction.add_reactant_arrow(reaction_id, reactants[ind], stoich, model_num)
+            for reactant in reaction.reactants:
+                diff_reaction.add_reactant_arrow(reaction_id, reactant.species, reactant.stoichiometry, model_num)
 
             # product arrows
-            for ind, stoich in enumerate(ps):
+            for product_ref in reaction.products:
 
                 # if producing something that's been elided, adjust arrows to point ot downstream species
-                product = products[ind]
+                product = product_ref.species
                 if self.cartoon and product in self.elided_list[model_num]:
                     product = self.downstream_species[model_num][product]
 
                 if is_transcription:
-                    diff_reaction.add_transcription_product_arrow(reaction_id, product, stoich, model_num)
+                    diff_reaction.add_transcription_product_arrow(reaction_id, product, product_ref.stoichiometry, model_num)
                 else:
-                    diff_reaction.add_product_arrow(reaction_id, product, stoich, model_num)
+                    diff_reaction.add_product_arrow(reaction_id, product, product_ref.stoichiometry, model_num)
 
             # parameter arrows
             if rate_law:
-                entities = rate_law.select("ci")
-                for entity in entities:
-                    param = entity.string.strip()
+                for param in math_variables(rate_law):
 
                     # check a param rather than species
-                    if param in list(self.species_compartment[model_num].keys()):
+                    if param in model.species:
                         continue
 
-                    arrow_direction = categorise_interaction(rate_law.parent, param, self.initial_value[model_num], use_sympy=self.use_sympy)
+                    arrow_direction = categorise_interaction(rate_law, param, model.initial_values,
+                                                             engine=self.effect_engine, cache=self.classification_cache,
+                                                             memo=self.interaction_memo)
                     diff_reaction.add_parameter_arrow(reaction_id, param, arrow_direction, model_num)
 
     def find_downstream_species(self):
@@ -537,57 +531,40 @@ class SBMLDiff:
             # first, form a list of species that cannot safely be elided, because they are a reactant or modifier in a
             # reaction other than degredation or translation
             non_intermediates = []
-            for reaction in model.select('reaction'):
+            for reaction in model.reactions.values():
 
                 # skip degredation or translation reactions
-                if "sboTerm" in list(reaction.attrs.keys()) and reaction.attrs["sboTerm"] in ["SBO:0000184", "SBO:0000179"]:
+                if reaction.sbo_term in ["SBO:0000184", "SBO:0000179"]:
                     continue
 
-                reactant_list = reaction.select_one("listOfReactants")
-                if reactant_list:
-                    for reactant in reactant_list.select("speciesReference"):
-                        non_intermediates.append(reactant.attrs["species"])
-
-                modifier_list = reaction.select_one("listOfModifiers")
-                if modifier_list:
-                    for r in modifier_list.select("modifierSpeciesReference"):
-                        non_intermediates.append(r["species"])
+                non_intermediates.extend(reaction.reactant_ids)
+                non_intermediates.extend(reaction.modifiers)
 
             # Now loop through reactions, identifying those that should be elided
-            for reaction in model.select('reaction'):
+            for reaction in model.reactions.values():
 
-                if "sboTerm" not in list(reaction.attrs.keys()) or reaction.attrs["sboTerm"] != "SBO:0000184":
+                if reaction.sbo_term != "SBO:0000184":
                     continue
 
                 # if reaction has different kineticLaw in different models, don't elide it
-                rate_laws = ""
+                rate_law_id = None
+                different = False
                 for m in self.models:
-                    r = m.select_one("listOfReactions").find(id=reaction["id"])
-                    if not r:
+                    r = m.reactions.get(reaction.id)
+                    if not r or not convert_rate_law(r.rate_law):
                         continue
 
-                    rate_law = r.select_one("kineticLaw").select_one("math")
-                    if rate_law and not rate_laws:
-                        rate_laws = rate_law
-                    elif rate_laws and rate_law and rate_laws != rate_law:
-                        rate_laws = "different"
+                    if rate_law_id is None:
+                        rate_law_id = canonical_id(r.rate_law)
+                    elif rate_law_id != canonical_id(r.rate_law):
+                        different = True
                         break
 
-                if rate_laws == "different":
+                if different:
                     continue
 
-                reactants_and_modifier_species = []
-
                 # Check exactly one modifier/reactant
-                modifier_list = reaction.select_one("listOfModifiers")
-                if modifier_list:
-                    for r in modifier_list.select("modifierSpeciesReference"):
-                        reactants_and_modifier_species.append(r["species"])
-
-                reactant_list = reaction.select_one("listOfReactants")
-                if reactant_list:
-                    for r in reactant_list.select("speciesReference"):
-                        reactants_and_modifier_species.append(r["species"])
+                reactants_and_modifier_species = reaction.modifiers + reaction.reactant_ids
 
                 if len(reactants_and_modifier_species) != 1:
                     continue
@@ -599,12 +576,9 @@ class SBMLDiff:
 
                 # check exactly one product (other than reactant, in case reaction is modelled as mRNA -> mRNA + protein)
                 product_species = []
-                product_list = reaction.select_one("listOfProducts")
-                if product_list:
-                    for p in product_list.select("speciesReference"):
-                        product_id = p["species"]
-                        if product_id != species_to_elide:
-                            product_species.append(product_id)
+                for product_id in reaction.product_ids:
+                    if product_id != species_to_elide:
+                        product_species.append(product_id)
 
                 if len(product_species) != 1:
                     continue
@@ -628,10 +602,7 @@ class SBMLDiff:
         for model_num, model in enumerate(self.models):
             for species in get_species(model, compartment_id):
 
-                s = model.select_one("listOfSpecies").find(id=species)
-                is_boundary = ""
-                if "boundaryCondition" in list(s.attrs.keys()):
-                    is_boundary = s.attrs["boundaryCondition"]
+                is_boundary = model.species[species].boundary_condition
 
                 species_name = get_species_name(model, species)
 
@@ -642,19 +613,87 @@ class SBMLDiff:
                 diff_compartment.add_species(species, is_boundary, species_name, elided, model_num)
 
         # Process regulatory interactions
+        if self.regulatory_arrows is None:
+            self.find_regulatory_arrows()
+
+        for model_num, model in enumerate(self.models):
+            for arrow in self.regulatory_arrows[model_num].get(compartment_id, []):
+                diff_compartment.add_regulatory_arrow(arrow[0], arrow[1], arrow[2], model_num)
+
+    def classify_interactions(self):
+        """
+        If the sympy effect engine is used, classify every interaction in the models using sympy, in parallel if there are several
+        jobs, counting how each interaction was classified (see report_sympy_classifications).
+        """
+        if not self.use_sympy:
+            return
+
+        expressions = []
+        initial_values = {}
+        for model in self.models:
+            model_expressions = []
+            for reaction in model.reactions.values():
+                if reaction.rate_law:
+                    model_expressions.append(reaction.rate_law)
+            for rule in list(model.rules.values()) + model.algebraic_rules:
+                if rule.math:
+                    model_expressions.append(rule.math)
+            for event in model.events.values():
+                for assignment in event.assignments:
+                    if assignment.math:
+                        model_expressions.append(assignment.math)
+
+            for math in model_expressions:
+                for math_expr in math.children:
+                    if not isinstance(math_expr, str):
+                        initial_values[id(math_expr)] = model.initial_values
+            expressions.extend(model_expressions)
+
+        classified = None
+        if self.classification_cache is not None:
+            # interactions whose direction is cached do not need to be classified again
+            def classified(math_expr, species_id):
+                key = interaction_key(math_expr, species_id, "sympy", initial_values.get(id(math_expr), {}))
+                return key is not None and self.classification_cache.get(key) is not None
+
+        counts = classify_algebraically(expressions, self.jobs, self.sympy_timeout, classified)
+        for outcome, count in counts.items():
+            self.interaction_memo.sympy_counts[outcome] += count
+
+    def report_sympy_classifications(self):
+        """
+        If the sympy effect engine is used, report on stderr how each interaction was classified, both by
+        classify_interactions() and (for interactions it did not reach) as the models were compared.
+        """
+        if not self.use_sympy:
+            return
+
+        counts = self.interaction_memo.sympy_counts
+        sys.stderr.write("Interactions classified using sympy: %s symbolically, %s numerically, %s timed out (and were "
+                         "classified numerically)\n" % (counts["symbolically"], counts["numerically"],
+                                                        counts["timed out"]))
+
+    def find_regulatory_arrows(self):
+        """
+        Find the regulatory interactions in every compartment of each model, in a single pass over its reactions.
+        """
+        self.regulatory_arrows = []
         for model_num, model in enumerate(self.models):
             if self.cartoon:
-                arrows = get_regulatory_arrow(model, compartment_id, self.reactions[model_num], self.species_compartment[model_num], self.initial_value[model_num], elided_reactions=self.elided_reactions[model_num], use_sympy=self.use_sympy)
+                arrows = get_regulatory_arrows(model, elided_reactions=self.elided_reactions[model_num],
+                                               engine=self.effect_engine, cache=self.classification_cache,
+                                               memo=self.interaction_memo)
             else:
-                arrows = get_regulatory_arrow(model, compartment_id, self.reactions[model_num], self.species_compartment[model_num], self.initial_value[model_num], use_sympy=self.use_sympy)
-
-            for arrow in arrows:
-                diff_compartment.add_regulatory_arrow(arrow[0], arrow[1], arrow[2], model_num)
+                arrows = get_regulatory_arrows(model, engine=self.effect_engine,
+                                               cache=self.classification_cache, memo=self.interaction_memo)
+            self.regulatory_arrows.append(arrows)
 
     def diff_models(self):
         """
         Print DOT output comparing SBML models
         """
+        if self.sections is not None:
+            raise RuntimeError("Comparing models requires every section of each model to be loaded")
 
         self.check_model_supported()
         self.models = [inline_all_functions(x) for x in self.models]
@@ -662,6 +701,7 @@ class SBMLDiff:
         if self.align:
             align_models(self.models)
 
+        self.classify_interactions()
         self.diff_reactions()
 
         if not self.hide_rules:
@@ -669,10 +709,10 @@ class SBMLDiff:
             self.diff_algebraic_rules()
 
         compartment_ids = set()
-        for model_num, model in enumerate(self.models):
-            for compartment in model.select('compartment'):
-                if "id" in list(compartment.attrs.keys()):
-                    compartment_ids.add(compartment.attrs["id"])
+        for model in self.models:
+            compartment_ids.update(model.compartments.keys())
+
+        self.find_regulatory_arrows()
 
         self.diff_object.check_compartment_exists("NONE") # Is this necessary?
         for compartment_id in compartment_ids:
@@ -681,6 +721,8 @@ class SBMLDiff:
         self.diff_events()
         if self.show_params:
             self.draw_modified_params()
+        self.save_classifications()
+        self.report_sympy_classifications()
 
         # actually print the results of comparison
         self.generate_dot.generate_dot(self.diff_object)
@@ -693,7 +735,7 @@ class SBMLDiff:
 
         Parameters
         ----------
-        model : bs4.BeautifulSoup object produced by parsing an SBML model
+        model : Model (intermediate representation of an SBML model)
 
         model_num : index of the model being abstracted
 
@@ -708,8 +750,7 @@ class SBMLDiff:
 
         # Get list of species
         species = set()
-        for compartment in model.select('compartment'):
-            compartment_id = compartment.attrs["id"]
+        for compartment_id in model.compartments:
             species = species.union(get_species(model, compartment_id))
 
         interactions = {}
@@ -720,13 +761,16 @@ class SBMLDiff:
 
         reactions = get_reactions(model)
         for reaction_id in reactions:
-            reaction = self.reactions[model_num][reaction_id]
-            reactant_list, product_list, compartment, rate_law, _, _ = get_reaction_details(model, reaction, self.species_compartment[model_num])
+            reaction = model.reactions[reaction_id]
+            reactant_list = reaction.reactant_ids
+            product_list = reaction.product_ids
+            rate_law = reaction.rate_law
+            if not rate_law:
+                continue
 
             # Identify all species that appear in kineticLaw
             modifiers = []
-            for ci in rate_law.findAll("ci"):
-                name = ci.text.strip()
+            for name in math_variables(rate_law):
                 if name in species:
                     modifiers.append(name)
             modifiers = set(modifiers)
@@ -738,14 +782,16 @@ class SBMLDiff:
                     if reactant == modifier:
                         continue
 
-                    effect = categorise_interaction(rate_law.parent, modifier, self.initial_value[model_num], use_sympy=self.use_sympy)
+                    effect = categorise_interaction(rate_law, modifier, model.initial_values, engine=self.effect_engine,
+                                                    cache=self.classification_cache, memo=self.interaction_memo)
                     if effect == "monotonic_increasing":
                         interactions[modifier][reactant].add("increase-degredation")
                     elif effect == "monotonic_decreasing":
                         interactions[modifier][reactant].add("decrease-degredation")
 
                 for product in product_list:
-                    effect = categorise_interaction(rate_law.parent, modifier, self.initial_value[model_num], use_sympy=self.use_sympy)
+                    effect = categorise_interaction(rate_law, modifier, model.initial_values, engine=self.effect_engine,
+                                                    cache=self.classification_cache, memo=self.interaction_memo)
                     if effect == "monotonic_increasing":
                         interactions[modifier][product].add("increase-production")
                     elif effect == "monotonic_decreasing":
@@ -772,6 +818,8 @@ class SBMLDiff:
         if self.align:
             align_models(self.models)
 
+        self.classify_interactions()
+
         effect_types = ["increase-degredation", "decrease-degredation", "increase-production", "decrease-production"]
 
         # Construct abstracted version of each model
@@ -787,51 +835,50 @@ class SBMLDiff:
             species_list = species_list.union(species)
 
             for s in species:
-                if s not in list(models_containing_species.keys()):
-                    models_containing_species[s] = set()
-                models_containing_species[s].add(model_num)
+                models_containing_species[s] = models_containing_species.get(s, 0) | model_bit(model_num)
 
-                species_object = model.select_one("listOfSpecies").find(id=s)
-                is_boundary = ""
-                if "boundaryCondition" in list(species_object.attrs.keys()):
-                    is_boundary = species_object.attrs["boundaryCondition"]
+                is_boundary = model.species[s].boundary_condition
 
-                if s not in list(is_boundary_species.keys()):
+                if s not in is_boundary_species:
                     is_boundary_species[s] = is_boundary
                 elif is_boundary_species[s] != is_boundary:
                     is_boundary_species[s] = '?'
 
+        self.save_classifications()
+        self.report_sympy_classifications()
+
         species_list = species_list.difference(ignored_species)
         retained_species = species_list.difference(elided_species)
 
         self.generate_dot.print_header()
 
         for s in retained_species:
-            model_num = list(models_containing_species[s])[0]
+            model_num = model_indexes(models_containing_species[s])[0]
             species_name = get_species_name(self.models[model_num], s)
             self.generate_dot.print_species_node(models_containing_species[s], is_boundary_species[s], s, species_name)
 
-        # Construct interactions[modifier][species][type] = set of model_numbers
+        # Construct interactions[modifier][species][type] = set of model_numbers (as a bitmask; see DiffObject.model_bit)
         interactions = {}
         for s1 in species_list:
             interactions[s1] = {}
             for s2 in species_list:
                 interactions[s1][s2] = {}
                 for effect in effect_types:
-                    interactions[s1][s2][effect] = set()
+                    interactions[s1][s2][effect] = 0
 
-        for model_num, model in enumerate(self.models):
+        for model_num in range(len(self.models)):
+            model_set = model_bit(model_num)
             for modifier in species_list:
-                if model_num not in models_containing_species[modifier]:
+                if not models_containing_species[modifier] & model_set:
                     continue
 
                 for species in species_list:
-                    if model_num not in models_containing_species[species]:
+                    if not models_containing_species[species] & model_set:
                         continue
 
                     effects = abstracted_model[model_num][modifier][species]
                     for effect_type in effects:
-                        interactions[modifier][species][effect_type].add(model_num)
+                        interactions[modifier][species][effect_type] |= model_set
 
         if elided_species:
             interactions = self.elide(species_list, effect_types, interactions, elided_species)
@@ -844,6 +891,22 @@ class SBMLDiff:
 
         self.generate_dot.print_footer()
 
+    def save_classifications(self):
+        """
+        Write the direction of newly classified interactions to the classification cache (if there is one).
+        """
+        if self.classification_cache is not None:
+            self.classification_cache.flush()
+
+    def report_classifications(self):
+        """
+        Report on stderr how often the direction of an interaction was reused (see InteractionMemo), rather than
+        classified again.
+        """
+        memo = self.interaction_memo
+        sys.stderr.write("Interactions: %s lookups, %s reused within this run, %s found in the cache, %s classified\n"
+                         % (memo.hits + memo.misses, memo.hits, memo.cache_hits, memo.classified))
+
     def elide(self, species_list, effect_types, interactions, elided_species):
         """
         Removes certain species from a model, transfering interactions that target them onto the species that they produce.
@@ -852,7 +915,7 @@ class SBMLDiff:
 
         Parameters
         ----------
-        interactions : interactions[modifier][target][effect_type] is set of model numbers for which species with id
+        interactions : interactions[modifier][target][effect_type] is the model set for which species with id
                         modifier has effect effect_type on species with id target
         elided_species : list containing the ide of each species to elide
         species_list : list containing id of every species
@@ -864,6 +927,7 @@ class SBMLDiff:
         """
         elided_species = set(elided_species).intersection(species_list)
         for model_num, model in enumerate(self.models):
+            model_set = model_bit(model_num)
 
             # For each elided species,
             for s in elided_species:
@@ -871,7 +935,7 @@ class SBMLDiff:
                 # find the 'downstream' species (eg. the protein produced from mRNA)
                 downstream = False
                 for s2 in species_list:
-                    if model_num in interactions[s][s2]["increase-production"]:
+                    if interactions[s][s2]["increase-production"] & model_set:
                         downstream = s2
 
                 if not downstream:
@@ -880,8 +944,8 @@ class SBMLDiff:
                 # Transfer interactions targeting the elided species to the downstream species
                 for regulator in species_list:
                     for effect_type in effect_types:
-                        if model_num in interactions[regulator][s][effect_type]:
-                            interactions[regulator][downstream][effect_type].add(model_num)
+                        if interactions[regulator][s][effect_type] & model_set:
+                            interactions[regulator][downstream][effect_type] |= model_set
 
         # Then remove the elided species
         for s in elided_species:
@@ -895,9 +959,9 @@ class SBMLDiff:
 
     def draw_modified_params(self):
         for param_id in list(self.modified_params.keys()):
-            model_set = list(self.modified_params[param_id])
+            model_set = self.modified_params[param_id]
             name = param_id
-            param = self.models[model_set[0]].find(id=param_id)
-            if "name" in list(param.attrs.keys()):
-                name = param.attrs["name"]
+            param = self.models[model_indexes(model_set)[0]].find(param_id)
+            if param and param.name is not None:
+                name = param.name
             self.diff_object.add_param_node(param_id, name, model_set)
@@ -0,0 +1,306 @@
+import copy
+import gc
+import sys
+from contextlib import contextmanager
+from io import BytesIO
+from lxml import etree
+from .compression import BUFFER_TYPES, BufferReader
+
+# Elements that are extracted (together with everything they contain) while a model is streamed
+EXTRACTED_ELEMENTS = ["species", "reaction", "parameter", "compartment", "assignmentRule", "rateRule",
+                      "algebraicRule", "event", "functionDefinition"]
+
+# Elements that are kept (without their text) even if nothing was extracted from inside them
+STRUCTURAL_ELEMENTS = ["sbml", "model"]
+
+if sys.version_info > (3, 0):
+    intern = sys.intern
+
+
+@contextmanager
+def gc_paused():
+    """
+    Context manager that disables the cyclic garbage collector.
+
+    Building a large number of Node records (each of which references its parent) otherwise triggers repeated full
+    collections, which take longer than building the records.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def load_model(source, elements=None):
+    """
+    Incrementally parse an SBML model, keeping only the parts of it used by sbml-diff.
+
+    The file is read using lxml.etree.iterparse(). Species, reactions, parameters, compartments, rules, events and
+    function definitions are converted into compact Node records as soon as their end tag is read, and the
+    corresponding lxml elements are then discarded, so the raw XML is never held in memory in its entirety. Other
+    content (such as notes, unit definitions and model-level annotations) is dropped, but the sbml, model and listOf*
+    elements are kept so the structure of the document is unchanged.
+
+    If only some kinds of element are needed, the others are skipped without being converted.
+
+    Parameters
+    ----------
+    source : a file object, or an SBML model as a string, bytes or another object supporting the buffer protocol (such
+        as a memoryview or mmap)
+    elements : list of the names of the elements to extract (by default, EXTRACTED_ELEMENTS)
+
+    Returns
+    -------
+    a StreamedDocument containing the extracted elements
+
+    """
+    if isinstance(source, str) or isinstance(source, bytes):
+        if not isinstance(source, bytes):
+            source = source.encode("utf-8")
+        source = BytesIO(source)
+    elif isinstance(source, BUFFER_TYPES):
+        source = BufferReader(source)
+    elif hasattr(source, "buffer"):
+        # iterparse() requires bytes, so read from the binary buffer underlying a file opened in text mode
+        source = source.buffer
+
+    if elements is None:
+        elements = EXTRACTED_ELEMENTS
+
+    document = StreamedDocument()
+    stack = [document]
+    depth_in_extracted = 0
+    extracting = False
+
+    parser = etree.iterparse(source, events=("start", "end"), recover=True, huge_tree=True, remove_comments=True,
+                             remove_pis=True)
+
+    try:
+        with gc_paused():
+            for event, element in parser:
+                if event == "start":
+                    if depth_in_extracted:
+                        depth_in_extracted += 1
+                        continue
+
+                    name = etree.QName(element).localname
+                    if name in EXTRACTED_ELEMENTS and not element.prefix:
+                        depth_in_extracted = 1
+                        extracting = name in elements
+                    else:
+                        node = _convert(element, recursive=False)
+                        stack[-1].append(node)
+                        stack.append(node)
+                    continue
+
+                if depth_in_extracted:
+                    depth_in_extracted -= 1
+                    if depth_in_extracted:
+                        continue
+                    if extracting:
+                        stack[-1].append(_convert(element))
+                else:
+                    node = stack.pop()
+                    if not node.contents and node.name not in STRUCTURAL_ELEMENTS and \
+                            not node.name.startswith("listOf"):
+                        node.extract()
+
+                # Discard the parsed element, and any preceding siblings that have already been processed
+                element.clear()
+                while element.getprevious() is not None:
+                    del element.getparent()[0]
+    except etree.XMLSyntaxError:
+        pass
+
+    return document
+
+
+def _convert(element, recursive=True):
+    """
+    Convert an lxml element, and (if recursive) everything it contains, into a Node.
+
+    Names, namespaces, attributes and text are interned, as the same ids and whitespace occur many times in a model.
+    """
+    qname = etree.QName(element)
+    prefix = intern(element.prefix) if element.prefix else None
+    namespace = intern(qname.namespace) if qname.namespace else None
+    attrs = None
+    if len(element.attrib):
+        attrs = dict((intern(key), intern(value)) for key, value in element.attrib.items())
+    node = Node(intern(qname.localname), prefix, namespace, attrs)
+
+    if not recursive:
+        return node
+
+    if element.text is not None:
+        node.append(intern(element.text))
+    for child in element:
+        node.append(_convert(child))
+        if child.tail is not None:
+            node.append(intern(child.tail))
+    return node
+
+
+class Node(object):
+    """
+    A compact record representing an element of an SBML model, with the same properties and methods as
+    document.SBMLElement (and so bs4.element.Tag).
+
+    Records can be pickled, so models can be loaded in other processes (see ir.extract_models).
+    """
+    __slots__ = ["name", "prefix", "namespace", "_attrs", "contents", "parent", "compiled"]
+
+    def __init__(self, name, prefix=None, namespace=None, attrs=None):
+        self.name = name
+        self.prefix = prefix
+        self.namespace = namespace
+        self._attrs = attrs
+        self.contents = []
+        self.parent = None
+        self.compiled = None  # set by rate_laws.compile_math()
+
+    @property
+    def attrs(self):
+        # Most elements of a MathML expression have no attributes, so the dict is only created when needed
+        if self._attrs is None:
+            self._attrs = {}
+        return self._attrs
+
+    def __eq__(self, other):
+        if not isinstance(other, Node):
+            return False
+        return self.name == other.name and (self._attrs or {}) == (other._attrs or {}) and \
+            self.contents == other.contents
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((self.name, self.get_text()))
+
+    def __getstate__(self):
+        # Parent references are restored by __setstate__, rather than pickled
+        return self.name, self.prefix, self.namespace, self._attrs, self.contents
+
+    def __setstate__(self, state):
+        self.name, self.prefix, self.namespace, self._attrs, self.contents = state
+        self.parent = None
+        self.compiled = None
+        for child in self.contents:
+            if not isinstance(child, str):
+                child.parent = self
+
+    def __copy__(self):
+        node = self.__class__.__new__(self.__class__)
+        Node.__init__(node, self.name, self.prefix, self.namespace, dict(self._attrs) if self._attrs else None)
+        for child in self.contents:
+            node.append(child if isinstance(child, str) else copy.copy(child))
+        return node
+
+    def __repr__(self):
+        return "<%s %s>" % (self.name, " ".join('%s="%s"' % item for item in (self._attrs or {}).items()))
+
+    @property
+    def children(self):
+        return iter(self.contents)
+
+    @property
+    def string(self):
+        return self.get_text()
+
+    @string.setter
+    def string(self, value):
+        self._modified()
+        for child in self.contents:
+            if not isinstance(child, str):
+                child.parent = None
+        self.contents = [value]
+
+    def _modified(self):
+        # Discard the compiled form of this element and of the elements containing it, as it is now out of date. If an
+        # element has not been compiled, then neither has any element containing it.
+        node = self
+        while node is not None and node.compiled is not None:
+            node.compiled = None
+            node = node.parent
+
+    def append(self, child):
+        if not isinstance(child, str):
+            child.parent = self
+        self.contents.append(child)
+
+    def descendants(self):
+        """
+        Iterate over the elements contained in this one, in document order.
+        """
+        stack = [iter(self.contents)]
+        while stack:
+            for child in stack[-1]:
+                if not isinstance(child, str):
+                    yield child
+                    stack.append(iter(child.contents))
+                    break
+            else:
+                stack.pop()
+
+    def get_text(self):
+        text = []
+        stack = [iter(self.contents)]
+        while stack:
+            for child in stack[-1]:
+                if isinstance(child, str):
+                    text.append(child)
+                else:
+                    stack.append(iter(child.contents))
+                    break
+            else:
+                stack.pop()
+        return "".join(text)
+
+    def select_one(self, name):
+        return next(self.find_all(name, iterate=True), None)
+
+    def select(self, name):
+        return self.find_all(name)
+
+    def find_all(self, names, iterate=False):
+        if isinstance(names, str):
+            names = [names]
+        matches = (element for element in self.descendants() if element.name in names)
+        return matches if iterate else list(matches)
+
+    def replace_with(self, replacement):
+        self.parent._modified()
+        siblings = self.parent.contents
+        for i, sibling in enumerate(siblings):
+            if sibling is self:
+                siblings[i] = replacement
+                if not isinstance(replacement, str):
+                    replacement.parent = self.parent
+                break
+        self.parent = None
+        return self
+
+    def extract(self):
+        self.parent._modified()
+        siblings = self.parent.contents
+        for i, sibling in enumerate(siblings):
+            if sibling is self:
+                del siblings[i]
+                break
+        self.parent = None
+        return self
+
+
+class StreamedDocument(Node):
+    """
+    An SBML document loaded by load_model(). Like the document object produced by BeautifulSoup, searches include the
+    root (sbml) element.
+    """
+    __slots__ = []
+
+    def __init__(self):
+        Node.__init__(self, "[document]")
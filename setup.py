@@ -1,14 +1,28 @@
 #!/usr/bin/env python
 
+import os
+import re
+
 from setuptools import setup
 
+# The version is defined only in sbml_diff/__init__.py, as it is also part of the key of each cache entry
+with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sbml_diff', '__init__.py')) as f:
+    version = re.search(r'^__version__ = "([^"]+)"', f.read(), re.M).group(1)
+
 setup(name='sbml-diff',
-      version='1.0',
+      version=version,
       description='sbml-diff is a tool for visually comparing SBML models',
       author='James Scott-Brown',
       author_email='james@jamesscottbrown.com',
       url='',
       packages=['sbml_diff'],
       scripts=['sbml-diff.py'],
-      install_requires=['BeautifulSoup4', 'lxml', 'tabulate']
+      install_requires=['BeautifulSoup4', 'lxml', 'tabulate'],
+      extras_require={
+          # the sampled and dual effect engines, and the columnar DiffObject backend
+          'numpy': ['numpy>=1.17'],
+          # the sympy effect engine
+          'sympy': ['sympy'],
+          'all': ['numpy>=1.17', 'sympy'],
+      }
       )
@@ -0,0 +1,22 @@
+import os
+
+from sbml_diff.accessor_functions import get_regulatory_arrow, get_regulatory_arrows
+from sbml_diff.ir import extract_models
+
+EXAMPLES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "examples")
+
+
+def test_get_regulatory_arrow():
+    with open(os.path.join(EXAMPLES, "repressilator", "BIOMD0000000012.xml"), "rb") as f:
+        model = extract_models([f.read()])[0]
+
+    arrows = get_regulatory_arrows(model)
+    assert arrows
+    for compartment, compartment_arrows in arrows.items():
+        assert get_regulatory_arrow(model, compartment) == compartment_arrows
+
+        # reactions, species_compartments and initial_values may still be passed positionally, and are ignored
+        assert get_regulatory_arrow(model, compartment, model.reactions, {}, model.initial_values) == compartment_arrows
+
+    elided = list(model.reactions.values())
+    assert get_regulatory_arrow(model, compartment, None, None, None, elided) == []
@@ -0,0 +1,153 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from sbml_diff import cache
+from sbml_diff.cache import CACHE_FILE_SUFFIX, ClassificationCache, ModelCache
+from sbml_diff.ir import extract_models
+
+EXAMPLES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "examples")
+
+
+def read_example(path):
+    with open(os.path.join(EXAMPLES, path), "rb") as f:
+        return f.read()
+
+
+class Clock:
+    """Stands in for the time module, so that each call to time() returns a later time"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        self.now += 1
+        return self.now
+
+
+def test_model_cache_key():
+    model_cache = ModelCache.__new__(ModelCache)
+    model1 = read_example("SIR/SIRModel1.xml")
+    model2 = read_example("SIR/SIRModel2.xml")
+
+    key, model_string = model_cache.key(model1)
+    assert model_string is model1
+    assert model_cache.key(model1.decode("utf-8"))[0] == key
+    assert model_cache.key(memoryview(model1))[0] == key
+    assert model_cache.key(model2)[0] != key
+    assert model_cache.key(model1, sections=["species"])[0] != key
+
+
+def test_model_cache_round_trip(tmpdir):
+    model_cache = ModelCache(str(tmpdir))
+    model_strings = [read_example("SIR/SIRModel1.xml"), read_example("SIR/SIRModel2.xml")]
+
+    models = extract_models(model_strings, cache=model_cache)
+    assert len(tmpdir.listdir(lambda path: path.ext == CACHE_FILE_SUFFIX)) == 2
+
+    for model_string, model in zip(model_strings, models):
+        cached = model_cache.get(model_cache.key(model_string)[0])
+        assert cached is not None
+        assert list(cached.species) == list(model.species)
+        assert list(cached.reactions) == list(model.reactions)
+        for reaction_id, reaction in model.reactions.items():
+            assert cached.reactions[reaction_id].rate_law == reaction.rate_law
+
+    # the models are then loaded from the cache
+    cached_models = extract_models(model_strings, cache=model_cache)
+    assert [list(model.species) for model in cached_models] == [list(model.species) for model in models]
+
+
+def test_model_cache_missing_and_corrupt_entries(tmpdir):
+    model_cache = ModelCache(str(tmpdir))
+    assert model_cache.get("missing") is None
+
+    path = tmpdir.join("corrupt" + CACHE_FILE_SUFFIX)
+    path.write_binary(b"not a pickle")
+    assert model_cache.get("corrupt") is None
+    assert not path.exists()
+
+
+def test_model_cache_evicts_least_recently_used(tmpdir):
+    model_cache = ModelCache(str(tmpdir), max_size=10 ** 6)
+    entry = "x" * 1000
+    for i, key in enumerate(["a", "b", "c"]):
+        model_cache.put(key, entry)
+        os.utime(model_cache._path(key), (100 + i, 100 + i))
+
+    # using "a" makes "b" the least recently used entry
+    assert model_cache.get("a") == entry
+    size = os.path.getsize(model_cache._path("a"))
+    model_cache.max_size = 2 * size
+    model_cache.evict()
+
+    assert model_cache.get("b") is None
+    assert model_cache.get("a") == entry
+    assert model_cache.get("c") == entry
+
+
+def test_classification_cache_round_trip(tmpdir):
+    path = str(tmpdir.join("classifications.sqlite"))
+    key = ("signature", 0, "numeric", 0, (1.0, None))
+
+    classification_cache = ClassificationCache(path)
+    assert classification_cache.get(key) is None
+    classification_cache.put(key, "monotonic_increasing")
+    assert classification_cache.get(key) == "monotonic_increasing"
+    classification_cache.flush()
+
+    reopened = ClassificationCache(path)
+    assert reopened.get(key) == "monotonic_increasing"
+    assert reopened.get(("signature", 1, "numeric", 0, (1.0, None))) is None
+
+
+def test_classification_cache_evicts_least_recently_used(tmpdir, monkeypatch):
+    monkeypatch.setattr(cache, "time", Clock())
+    path = str(tmpdir.join("classifications.sqlite"))
+
+    classification_cache = ClassificationCache(path, max_entries=2)
+    for name in ["a", "b", "c"]:
+        classification_cache.put((name,), name)
+    classification_cache.flush()
+    assert classification_cache.get(("a",)) is None
+    assert classification_cache.get(("b",)) == "b"
+    classification_cache.flush()
+
+    # "b" has been used since "c" was stored, so "c" is evicted
+    classification_cache.put(("d",), "d")
+    classification_cache.flush()
+    assert classification_cache.get(("c",)) is None
+    assert classification_cache.get(("b",)) == "b"
+    assert classification_cache.get(("d",)) == "d"
+
+
+def test_classification_cache_replaces_corrupt_database(tmpdir):
+    path = tmpdir.join("classifications.sqlite")
+    path.write_binary(b"not a database" * 100)
+
+    classification_cache = ClassificationCache(str(path))
+    classification_cache.put(("a",), "constant")
+    classification_cache.flush()
+    assert ClassificationCache(str(path)).get(("a",)) == "constant"
+
+
+@pytest.mark.parametrize("parser", ["lxml", "bs4", "stream"])
+def test_event_ids_are_the_same_in_every_process(tmpdir, parser):
+    # an event without an id is given one derived from its content, which must not vary between processes (as hash()
+    # does), so that it is the same in a model loaded from the cache as in one parsed again
+    model = read_example("SIR/SIRModel1.xml").decode("utf-8")
+    event = ('<listOfEvents><event><trigger><math xmlns="http://www.w3.org/1998/Math/MathML"><apply><gt/><ci>I</ci>'
+             '<cn>10</cn></apply></math></trigger></event></listOfEvents>')
+    path = tmpdir.join("event.xml")
+    path.write(model.replace("</model>", event + "</model>"))
+
+    script = ("import sys; from sbml_diff.ir import extract_models; "
+              "print(list(extract_models([open(sys.argv[1], 'rb').read()], parser=sys.argv[2])[0].events))")
+    root = os.path.dirname(EXAMPLES)
+    event_ids = set()
+    for seed in ["1", "2"]:
+        env = dict(os.environ, PYTHONHASHSEED=seed, PYTHONPATH=root)
+        event_ids.add(subprocess.check_output([sys.executable, "-c", script, str(path), parser], env=env))
+    assert len(event_ids) == 1
@@ -0,0 +1,100 @@
+import bz2
+import gzip
+import io
+import mmap
+import os
+import zipfile
+
+import pytest
+
+from sbml_diff.compression import compression_type, find_model_in_archive, lzma, open_model
+from sbml_diff.ir import extract_models
+
+EXAMPLES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "examples")
+
+with open(os.path.join(EXAMPLES, "SIR", "SIRModel1.xml"), "rb") as f:
+    MODEL = f.read()
+
+with open(os.path.join(EXAMPLES, "SIR", "SIRModel2.xml"), "rb") as f:
+    OTHER_MODEL = f.read()
+
+MANIFEST = b"""<?xml version="1.0" encoding="utf-8"?>
+<omexManifest xmlns="http://identifiers.org/combine.specifications/omex-manifest">
+  <content location="." format="http://identifiers.org/combine.specifications/omex"/>
+  <content location="./other.xml" format="http://identifiers.org/combine.specifications/sbml.level-2.version-4"/>
+  <content location="./model.xml" format="http://identifiers.org/combine.specifications/sbml.level-2.version-4"
+           master="true"/>
+</omexManifest>"""
+
+
+def zip_archive(members):
+    data = io.BytesIO()
+    with zipfile.ZipFile(data, "w") as archive:
+        for name, content in members:
+            archive.writestr(name, content)
+    return data.getvalue()
+
+
+def compressed_models():
+    models = [
+        ("gzip", gzip.compress(MODEL)),
+        ("bz2", bz2.compress(MODEL)),
+        ("zip", zip_archive([("readme.txt", b"not a model"), ("model.xml", MODEL)])),
+        ("zip", zip_archive([("manifest.xml", MANIFEST), ("other.xml", OTHER_MODEL), ("model.xml", MODEL)])),
+    ]
+    if lzma is not None:
+        models.append(("xz", lzma.compress(MODEL)))
+    return models
+
+
+@pytest.mark.parametrize("compression, data", compressed_models())
+def test_open_compressed_model(tmpdir, compression, data):
+    assert compression_type(data[:6]) == compression
+
+    path = tmpdir.join("model")
+    path.write_binary(data)
+
+    assert open_model(str(path)).read() == MODEL
+    assert open_model(io.BytesIO(data)).read() == MODEL
+    with open(str(path), "rb") as f:
+        assert open_model(f).read() == MODEL
+
+
+def test_open_uncompressed_model(tmpdir):
+    assert compression_type(MODEL[:6]) is None
+
+    path = tmpdir.join("model.xml")
+    path.write_binary(MODEL)
+
+    with open(str(path), "rb") as f:
+        mapped = open_model(f, mapped=True)
+        assert isinstance(mapped, mmap.mmap)
+        assert mapped[:] == MODEL
+        mapped.close()
+
+    with open(str(path), "r") as f:
+        assert open_model(f).read() == MODEL
+
+
+def test_find_model_in_archive():
+    with zipfile.ZipFile(io.BytesIO(zip_archive([("manifest.xml", MANIFEST), ("other.xml", OTHER_MODEL),
+                                                 ("model.xml", MODEL)]))) as archive:
+        assert find_model_in_archive(archive) == "model.xml"
+
+    with zipfile.ZipFile(io.BytesIO(zip_archive([("readme.txt", b"")]))) as archive:
+        assert find_model_in_archive(archive) is None
+
+    with pytest.raises(ValueError):
+        open_model(io.BytesIO(zip_archive([("readme.txt", b"")])))
+
+
+@pytest.mark.parametrize("compression, data", compressed_models())
+def test_extract_compressed_model(tmpdir, compression, data):
+    path = tmpdir.join("model")
+    path.write_binary(data)
+
+    expected = extract_models([MODEL])[0]
+    with open(str(path), "rb") as f:
+        model = extract_models([f])[0]
+    assert list(model.species) == list(expected.species)
+    assert list(model.reactions) == list(expected.reactions)
@@ -0,0 +1,59 @@
+import signal
+import time
+
+import pytest
+
+pytest.importorskip("sympy")
+
+from sbml_diff import effect_direction
+from sbml_diff.effect_direction import InteractionMemo, categorise_interaction, check_sign_algebraically
+from sbml_diff.streaming import load_model
+
+pytestmark = pytest.mark.skipif(not hasattr(signal, "setitimer"), reason="time limits require SIGALRM")
+
+
+def load_math(content):
+    model = ('<sbml><model><listOfReactions><reaction id="r"><kineticLaw>'
+             '<math xmlns="http://www.w3.org/1998/Math/MathML">%s</math>'
+             '</kineticLaw></reaction></listOfReactions></model></sbml>' % content)
+    return load_model(model.encode("utf-8")).select_one("math")
+
+
+def slow_derivative_sign(rate, species_id):
+    time.sleep(10)
+    return "monotonic_decreasing"
+
+
+def test_unclassified_interaction_is_timed(monkeypatch):
+    # an interaction not classified in advance by classify_algebraically() is subject to the same time limit
+    monkeypatch.setattr(effect_direction, "derivative_sign", slow_derivative_sign)
+    math = load_math("<apply><times/><ci>k</ci><ci>S</ci></apply>")
+    counts = {"symbolically": 0, "numerically": 0, "timed out": 0}
+
+    start = time.time()
+    result = check_sign_algebraically(math.select_one("apply"), ["k", "S"], "S", {}, timeout=0.1, counts=counts)
+    assert time.time() - start < 5
+
+    # the interaction is classified numerically instead
+    assert result == "monotonic_increasing"
+    assert counts == {"symbolically": 0, "numerically": 0, "timed out": 1}
+
+
+def test_memo_applies_time_limit(monkeypatch):
+    monkeypatch.setattr(effect_direction, "derivative_sign", slow_derivative_sign)
+    math = load_math("<apply><divide/><ci>k</ci><ci>S</ci></apply>")
+    memo = InteractionMemo(sympy_timeout=0.1)
+
+    assert categorise_interaction(math, "S", {}, engine="sympy", memo=memo) == "monotonic_decreasing"
+    assert memo.sympy_counts["timed out"] == 1
+
+    # the result is reused, rather than classified (or counted) again
+    assert categorise_interaction(math, "S", {}, engine="sympy", memo=memo) == "monotonic_decreasing"
+    assert memo.sympy_counts["timed out"] == 1
+
+
+def test_interaction_classified_symbolically():
+    math = load_math("<apply><divide/><ci>S</ci><apply><plus/><ci>K</ci><ci>S</ci></apply></apply>")
+    memo = InteractionMemo()
+    assert categorise_interaction(math, "S", {}, engine="sympy", memo=memo) == "monotonic_increasing"
+    assert memo.sympy_counts == {"symbolically": 1, "numerically": 0, "timed out": 0}
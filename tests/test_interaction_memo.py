@@ -0,0 +1,66 @@
+import contextlib
+import io
+import os
+
+import pytest
+
+from sbml_diff import effect_direction
+from sbml_diff.generate_dot import GenerateDot
+from sbml_diff.rate_laws import canonical_signature
+from sbml_diff.sbml_diff import SBMLDiff
+
+EXAMPLES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "examples")
+
+
+def compare(paths, abstract=False):
+    models = []
+    for path in paths:
+        with open(os.path.join(EXAMPLES, path), "rb") as f:
+            models.append(f.read())
+    names = [os.path.basename(path) for path in paths]
+
+    sd = SBMLDiff(models, names, GenerateDot(["red", "green", "blue"][:len(paths)], len(paths), model_names=names))
+    with contextlib.redirect_stdout(io.StringIO()):
+        if abstract:
+            sd.diff_abstract_models([], [])
+        else:
+            sd.diff_models()
+    return sd
+
+
+@pytest.mark.parametrize("paths", [
+    ["SIR/SIRModel1.xml", "SIR/SIRModel2.xml", "SIR/SIRModel3.xml"],
+    ["toggle-repressilator/toggle.xml", "toggle-repressilator/repressilator.xml"],
+    ["repressilator/BIOMD0000000012.xml"],
+])
+@pytest.mark.parametrize("abstract", [False, True])
+def test_each_interaction_is_classified_once(monkeypatch, paths, abstract):
+    classified = []
+    check_sign_numerically = effect_direction.check_sign_numerically
+
+    def counting_check_sign(expr, param_names, species_id, initial_values):
+        # an interaction is identified by the expression (up to the names of its variables), the position of the
+        # species among its variables, and the initial values of the variables
+        signature, variables = canonical_signature(expr)
+        values = tuple(initial_values.get(variable) for variable in variables)
+        classified.append((signature, variables.index(species_id), values))
+        return check_sign_numerically(expr, param_names, species_id, initial_values)
+
+    monkeypatch.setattr(effect_direction, "check_sign_numerically", counting_check_sign)
+    memo = compare(paths, abstract).interaction_memo
+
+    assert classified
+    assert len(set(classified)) == len(classified)
+    assert memo.classified == len(classified) == len(memo.results)
+    assert memo.misses == memo.classified
+    assert memo.hits > 0
+
+
+def test_report_classifications(capsys):
+    sd = compare(["SIR/SIRModel1.xml", "SIR/SIRModel2.xml"])
+    capsys.readouterr()
+    sd.report_classifications()
+
+    memo = sd.interaction_memo
+    assert capsys.readouterr().err == ("Interactions: %s lookups, %s reused within this run, 0 found in the cache, "
+                                       "%s classified\n" % (memo.hits + memo.misses, memo.hits, memo.classified))
@@ -0,0 +1,111 @@
+import math
+from fractions import Fraction
+
+import pytest
+
+from sbml_diff import interval_arithmetic
+from sbml_diff.effect_direction import check_sign_interval
+from sbml_diff.interval_arithmetic import INFINITY, Interval, power, reciprocal
+from sbml_diff.streaming import load_model
+
+UNBOUNDED = Interval(-INFINITY, INFINITY)
+
+HILL = ("<apply><divide/><apply><power/><ci>S</ci><cn>2</cn></apply>"
+        "<apply><plus/><ci>K</ci><apply><power/><ci>S</ci><cn>2</cn></apply></apply></apply>")
+
+
+def contains(interval, exact):
+    """Whether an interval contains a number, given exactly as a Fraction"""
+    return Fraction(interval.lo) <= exact <= Fraction(interval.hi)
+
+
+@pytest.mark.parametrize("a, b", [(0.1, 0.2), (1e16, 1.0), (-0.7, 0.3), (1.0 / 3, 2.0 / 3)])
+def test_rounding_is_outward(a, b):
+    x, y = Interval(a), Interval(b)
+
+    # the exact results of these operations on the floats a and b are generally not floats
+    for result, exact in [(x + y, Fraction(a) + Fraction(b)), (x - y, Fraction(a) - Fraction(b)),
+                          (x * y, Fraction(a) * Fraction(b)), (x / y, Fraction(a) / Fraction(b))]:
+        assert result.lo < result.hi
+        assert contains(result, exact)
+
+
+def test_exact_bounds_are_kept():
+    # zero and infinite bounds are exact, so are not moved
+    assert Interval(0.0) + Interval(0.0) == Interval(0.0)
+    assert Interval(0.0, INFINITY) * Interval(2.0, INFINITY) == Interval(0.0, INFINITY)
+
+
+def test_operations_contain_every_result():
+    x, y = Interval(-2.0, 3.0), Interval(0.5, 4.0)
+    for result, values in [(x + y, [-1.5, 7.0]), (x - y, [-6.0, 2.5]), (x * y, [-8.0, 12.0]),
+                           (x / y, [-4.0, 6.0])]:
+        for value in values:
+            assert result.lo <= value <= result.hi
+        assert result.hi - result.lo < 1.001 * (values[1] - values[0])
+
+
+def test_reciprocal():
+    assert contains(reciprocal(Interval(3.0)), Fraction(1, 3))
+    assert reciprocal(Interval(-1.0, 2.0)) == UNBOUNDED
+    assert reciprocal(Interval(0.0, 2.0)) == UNBOUNDED
+    negative = 1 / Interval(-4.0, -2.0)
+    assert negative.lo <= -0.5 and -0.25 <= negative.hi < 0
+
+
+def test_power():
+    # an even power of an interval containing both signs is non-negative
+    squared = power(Interval(-3.0, 2.0), 2)
+    assert squared.lo == 0.0
+    assert 9.0 <= squared.hi
+    assert power(Interval(-3.0, -2.0), 2).lo <= 4.0 <= power(Interval(-3.0, -2.0), 2).hi
+
+    cubed = power(Interval(-3.0, 2.0), 3)
+    assert cubed.lo <= -27.0 and 8.0 <= cubed.hi
+    assert power(Interval(5.0), 0) == Interval(1.0)
+    assert power(Interval(-1.0, 1.0), -1) == UNBOUNDED
+
+    # non-integer powers are only defined for non-negative bases
+    assert power(Interval(-1.0, 4.0), 0.5) == UNBOUNDED
+    root = power(Interval(4.0, 9.0), 0.5)
+    assert root.lo <= 2.0 and 3.0 <= root.hi
+    assert Interval(2.0) ** Interval(10.0) == power(2.0, 10.0)
+
+
+def test_elementary_functions():
+    value = Interval(0.5, 2.0)
+    for function, exact in [(interval_arithmetic.exp, math.exp), (interval_arithmetic.log, math.log),
+                            (interval_arithmetic.sqrt, math.sqrt), (interval_arithmetic.tanh, math.tanh)]:
+        result = function(value)
+        assert result.lo < exact(0.5) and exact(2.0) < result.hi
+
+    assert interval_arithmetic.log(Interval(0.0, 1.0)).lo == -INFINITY
+    assert interval_arithmetic.log(Interval(-2.0, -1.0)) == UNBOUNDED
+    assert interval_arithmetic.exp(Interval(1000.0)).hi == INFINITY
+    assert interval_arithmetic.abs(Interval(-3.0, 2.0)) == Interval(0.0, 3.0)
+    assert interval_arithmetic.cosh(Interval(-1.0, 2.0)).lo <= 1.0
+    assert interval_arithmetic.arcsin(Interval(2.0, 3.0)) == UNBOUNDED
+
+
+def test_nan_is_unbounded():
+    assert Interval(float("NaN")) == UNBOUNDED
+    assert Interval(-INFINITY, INFINITY) * Interval(0.0) == Interval(0.0)
+    assert Interval(INFINITY) - Interval(INFINITY) == UNBOUNDED
+
+
+def load_math(content):
+    model = ('<sbml><model><listOfReactions><reaction id="r"><kineticLaw>'
+             '<math xmlns="http://www.w3.org/1998/Math/MathML">%s</math>'
+             '</kineticLaw></reaction></listOfReactions></model></sbml>' % content)
+    return load_model(model.encode("utf-8")).select_one("math")
+
+
+@pytest.mark.parametrize("content, param_names, expected", [
+    ("<apply><times/><ci>k</ci><ci>S</ci></apply>", ["k", "S"], "monotonic_increasing"),
+    ("<apply><divide/><ci>k</ci><ci>S</ci></apply>", ["k", "S"], "monotonic_decreasing"),
+    (HILL, ["K", "S"], "monotonic_increasing"),
+    ("<apply><times/><ci>S</ci><apply><minus/><cn>3</cn><ci>S</ci></apply></apply>", ["S"], "?"),
+    ("<apply><times/><ci>k</ci><ci>X</ci></apply>", ["k", "X"], "constant"),
+])
+def test_check_sign_interval(content, param_names, expected):
+    assert check_sign_interval(load_math(content), param_names, "S", {}) == expected
@@ -0,0 +1,54 @@
+import pytest
+
+from sbml_diff.ir import extract_models
+
+MODEL = """<?xml version="1.0" encoding="UTF-8"?>
+<sbml xmlns="http://www.sbml.org/sbml/level2/version4" level="2" version="4">
+  <model id="m">
+    <listOfSpecies>
+      <species id="a" compartment="cell" initialConcentration="1"/>
+      <species id="b" compartment="cell" initialConcentration="1"/>
+    </listOfSpecies>
+    <listOfEvents>
+      <event>
+        <trigger>
+          <math xmlns="http://www.w3.org/1998/Math/MathML">
+            <apply><gt/>%s<cn>10</cn></apply>
+          </math>
+        </trigger>
+        <listOfEventAssignments>
+          <eventAssignment variable="a">
+            <math xmlns="http://www.w3.org/1998/Math/MathML"><cn>%s</cn></math>
+          </eventAssignment>
+        </listOfEventAssignments>
+      </event>
+    </listOfEvents>
+  </model>
+</sbml>"""
+
+A_TIMES_B = "<apply><times/><ci>a</ci><ci>b</ci></apply>"
+B_TIMES_A = "<apply><times/><ci>b</ci><ci>a</ci></apply>"
+A_MINUS_B = "<apply><minus/><ci>a</ci><ci>b</ci></apply>"
+B_MINUS_A = "<apply><minus/><ci>b</ci><ci>a</ci></apply>"
+
+
+def event_ids(trigger, assigned_value="0", parser="stream"):
+    model = extract_models([(MODEL % (trigger, assigned_value)).encode("utf-8")], parser=parser)[0]
+    return list(model.events)
+
+
+@pytest.mark.parametrize("parser", ["lxml", "bs4", "stream"])
+def test_event_id_ignores_order_of_commutative_arguments(parser):
+    ids = event_ids(A_TIMES_B, parser=parser)
+    assert len(ids) == 1
+    assert event_ids(B_TIMES_A, parser=parser) == ids
+
+    # the id is the same whichever parser is used
+    assert event_ids(A_TIMES_B) == ids
+
+
+def test_event_id_depends_on_content():
+    ids = event_ids(A_TIMES_B)
+    assert event_ids(A_MINUS_B) != ids
+    assert event_ids(A_MINUS_B) != event_ids(B_MINUS_A)
+    assert event_ids(A_TIMES_B, assigned_value="1") != ids
@@ -0,0 +1,161 @@
+import contextlib
+import io
+import os
+
+import pytest
+
+numpy = pytest.importorskip("numpy")
+
+from sbml_diff.DiffObject import DiffElement, DiffObject
+from sbml_diff.generate_dot import GenerateDot
+from sbml_diff.presence_matrix import INITIAL_ROWS, ColumnarDiffElement, PresenceMatrix
+from sbml_diff.sbml_diff import SBMLDiff
+
+EXAMPLES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "examples")
+
+# Versions of a reaction node added to each model, as (data, model_num)
+VERSIONS = [
+    ({"rate_law": "k * S", "is_fast": False, "stoich": "1"}, 0),
+    ({"rate_law": "k * S", "is_fast": False, "stoich": "1"}, 2),
+    ({"rate_law": "k2 * S", "is_fast": True, "stoich": "1"}, 1),
+    ({"rate_law": "k * S", "is_fast": False, "stoich": "1"}, 9),
+    ({"rate_law": "k3 * S", "is_fast": True, "stoich": "2"}, 8),
+]
+
+
+def build_elements(versions, num_models=10):
+    element = DiffElement()
+    columnar = ColumnarDiffElement(PresenceMatrix(num_models))
+    for data, model_num in versions:
+        element.add(data, model_num)
+        columnar.add(data, model_num)
+    return element, columnar
+
+
+def test_columnar_element_matches_diff_element():
+    element, columnar = build_elements(VERSIONS)
+
+    assert columnar.get_models() == element.get_models() == 0b1100000111
+    assert columnar.all_equal() == element.all_equal()
+    assert sorted(columnar.record.items(), key=repr) == sorted(element.record.items(), key=repr)
+    assert set(columnar.get_data()) == set(element.get_data())
+    for attribute_name in ["rate_law", "is_fast", "stoich"]:
+        assert columnar.compare_attribute(attribute_name) == element.compare_attribute(attribute_name)
+    assert columnar.find_models("is_fast", True) == element.find_models("is_fast", True) == 0b100000010
+    assert columnar.find_models("rate_law", "missing") == element.find_models("rate_law", "missing") == 0
+
+
+def test_single_version():
+    element, columnar = build_elements(VERSIONS[:2])
+    assert columnar.all_equal() and element.all_equal()
+    assert columnar.compare_attribute("rate_law") == element.compare_attribute("rate_law") == "k * S"
+
+
+def test_equal_values_are_the_same_version():
+    element, columnar = build_elements([({"is_fast": True}, 0), ({"is_fast": 1}, 1), ({"is_fast": 1.0}, 2)])
+    assert element.all_equal()
+    assert columnar.all_equal()
+    assert columnar.get_models() == 0b111
+
+
+def test_compare_attribute_without_versions():
+    element, columnar = build_elements([])
+    assert columnar.compare_attribute("rate_law") == element.compare_attribute("rate_law") is False
+
+
+def test_lookups_do_not_change_matrix():
+    matrix = PresenceMatrix(3)
+    columnar = ColumnarDiffElement(matrix)
+
+    assert {"x": 1} not in columnar.record
+    assert matrix.attribute_names is None
+
+    columnar.add({"x": 1, "y": 2}, 0)
+    num_values = len(matrix.values)
+    assert {"x": 1, "y": 2} in columnar.record
+    assert {"x": 1, "y": 5} not in columnar.record
+    assert {"x": 1} not in columnar.record
+    with pytest.raises(KeyError):
+        columnar.record[{"x": 7, "y": 2}]
+    assert len(matrix.values) == num_values
+
+
+def test_model_set_bit_order():
+    # more than 8 models, so each row spans several bytes
+    matrix = PresenceMatrix(20)
+    row = matrix.add_row(matrix.key({"x": 1}))
+    for model_num in [0, 7, 8, 19]:
+        matrix.add(row, model_num)
+    assert matrix.model_set([row]) == (1 << 0) | (1 << 7) | (1 << 8) | (1 << 19)
+
+
+def test_matrix_grows():
+    matrix = PresenceMatrix(2)
+    columnar = ColumnarDiffElement(matrix)
+    for i in range(3 * INITIAL_ROWS):
+        columnar.add({"x": i}, i % 2)
+    assert len(matrix.keys) == 3 * INITIAL_ROWS
+    assert columnar.find_models("x", 3 * INITIAL_ROWS - 1) == 0b10
+    assert columnar.get_models() == 0b11
+
+
+def test_vectorized_queries():
+    matrix = PresenceMatrix(3)
+    presence = {"a": [0, 1, 2], "b": [1], "c": [0, 2]}
+    rows = {}
+    for name, model_nums in sorted(presence.items()):
+        rows[name] = matrix.add_row(matrix.key({"name": name}))
+        for model_num in model_nums:
+            matrix.add(rows[name], model_num)
+
+    assert list(matrix.present_in_all()) == [True, False, False]
+    assert list(matrix.unique_to(1)) == [False, True, False]
+    assert list(matrix.unique_to(0)) == [False, False, False]
+    assert matrix.shared_counts().tolist() == [[2, 1, 2], [1, 2, 1], [2, 1, 2]]
+    assert list(matrix.column("name")) == [matrix.code("a"), matrix.code("b"), matrix.code("c")]
+
+
+def test_similarity():
+    diff_object = DiffObject(3, "columnar")
+    compartment = diff_object.check_compartment_exists("cell")
+    for model_num in range(3):
+        compartment.add_species("A", False, "A", False, model_num)
+    compartment.add_species("B", False, "B", False, 1)
+    compartment.add_regulatory_arrow("A", "B", "monotonic_increasing", 1)
+    compartment.add_regulatory_arrow("A", "B", "monotonic_increasing", 2)
+
+    similarity = diff_object.similarity()
+    assert numpy.allclose(similarity, [[1, 1 / 3.0, 1 / 2.0], [1 / 3.0, 1, 2 / 3.0], [1 / 2.0, 2 / 3.0, 1]])
+
+    with pytest.raises(ValueError):
+        DiffObject(3).similarity()
+
+
+def render(paths, backend, abstract=False):
+    models = []
+    for path in paths:
+        with open(os.path.join(EXAMPLES, path), "rb") as f:
+            models.append(f.read())
+    names = [os.path.basename(path) for path in paths]
+    colors = ["#e41a1c", "#377eb8", "#4daf4a"][:len(paths)]
+
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        sd = SBMLDiff(models, names, GenerateDot(colors, len(paths), model_names=names), diff_backend=backend)
+        if abstract:
+            sd.diff_abstract_models([], [])
+        else:
+            sd.diff_models()
+    return output.getvalue()
+
+
+@pytest.mark.parametrize("paths", [
+    ["SIR/SIRModel1.xml", "SIR/SIRModel2.xml", "SIR/SIRModel3.xml"],
+    ["toggle-repressilator/toggle.xml", "toggle-repressilator/repressilator.xml"],
+    ["repressilator/BIOMD0000000012.xml"],
+])
+@pytest.mark.parametrize("abstract", [False, True])
+def test_backends_produce_identical_output(paths, abstract):
+    output = render(paths, "dict", abstract)
+    assert "digraph comparison" in output
+    assert render(paths, "columnar", abstract) == output
@@ -0,0 +1,148 @@
+import math
+import os
+import subprocess
+import sys
+
+import pytest
+
+from sbml_diff.effect_direction import categorise_interaction
+from sbml_diff.ir import extract_models
+from sbml_diff.rate_laws import canonical_id, canonical_signature, compile_rate_law, evaluate_derivative, \
+    inline_all_functions
+from sbml_diff.streaming import load_model
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MATH = '<math xmlns="http://www.w3.org/1998/Math/MathML">%s</math>'
+
+
+def load_math(*contents):
+    """Load some MathML expressions, as the kinetic laws of reactions in the same model"""
+    reactions = "".join('<reaction id="r%s"><kineticLaw>%s</kineticLaw></reaction>' % (i, MATH % content)
+                        for i, content in enumerate(contents))
+    model = load_model(("<sbml><model><listOfReactions>%s</listOfReactions></model></sbml>" % reactions).encode())
+    return [kinetic_law.select_one("math") for kinetic_law in model.find_all("kineticLaw")]
+
+
+def apply(operator, *args):
+    return "<apply><%s/>%s</apply>" % (operator, "".join(args))
+
+
+def ci(name):
+    return "<ci>%s</ci>" % name
+
+
+def cn(value):
+    return "<cn>%s</cn>" % value
+
+
+# k1 * S / (K + S)
+MICHAELIS_MENTEN = apply("divide", apply("times", ci("k1"), ci("S")), apply("plus", ci("K"), ci("S")))
+
+
+def test_signature_ignores_order_of_commutative_arguments():
+    a, b = load_math(MICHAELIS_MENTEN,
+                     apply("divide", apply("times", ci("S"), ci("k1")), apply("plus", ci("S"), ci("K"))))
+    assert canonical_signature(a)[0] == canonical_signature(b)[0]
+    assert canonical_id(a) == canonical_id(b)
+
+
+def test_signature_ignores_variable_names():
+    a, b = load_math(MICHAELIS_MENTEN,
+                     apply("divide", apply("times", ci("v"), ci("X")), apply("plus", ci("Km"), ci("X"))))
+    signature, variables = canonical_signature(a)
+    other_signature, other_variables = canonical_signature(b)
+    assert signature == other_signature
+
+    # corresponding variables are in the same positions
+    assert dict(zip(variables, other_variables)) == {"k1": "v", "S": "X", "K": "Km"}
+
+    # unlike the signature, canonical_id depends on the names of variables
+    assert canonical_id(a) != canonical_id(b)
+
+
+def test_signature_depends_on_structure():
+    expressions = load_math(
+        MICHAELIS_MENTEN,
+        # k1 * S / (k1 + S): the same operators, but a different pattern of variables
+        apply("divide", apply("times", ci("k1"), ci("S")), apply("plus", ci("k1"), ci("S"))),
+        apply("divide", apply("times", ci("k1"), ci("S")), apply("minus", ci("K"), ci("S"))),
+        apply("divide", apply("times", ci("k1"), ci("S")), apply("plus", cn(2), ci("S"))),
+        apply("divide", apply("plus", ci("K"), ci("S")), apply("times", ci("k1"), ci("S"))),
+    )
+    signatures = [canonical_signature(expression)[0] for expression in expressions]
+    assert len(set(signatures)) == len(signatures)
+
+    # k1 * S / (K + k1) is k1 * S / (K + S) with k1 and S exchanged, as k1 and S can be exchanged in the product
+    equivalent, = load_math(apply("divide", apply("times", ci("k1"), ci("S")), apply("plus", ci("K"), ci("k1"))))
+    signature, variables = canonical_signature(equivalent)
+    assert signature == signatures[0]
+    assert dict(zip(canonical_signature(expressions[0])[1], variables)) == {"k1": "S", "S": "k1", "K": "K"}
+
+
+def test_signature_of_non_commutative_operator():
+    # k - S and S - k differ only in the names of their variables, but the variables are in different positions
+    a, b, c = load_math(apply("minus", ci("k"), ci("S")), apply("minus", ci("S"), ci("k")),
+                        apply("minus", ci("k"), ci("k")))
+    assert canonical_signature(a) == (canonical_signature(b)[0], ("k", "S"))
+    assert canonical_signature(b)[1] == ("S", "k")
+    assert canonical_signature(c)[0] != canonical_signature(a)[0]
+    assert canonical_id(a) != canonical_id(b)
+
+
+def test_signature_is_the_same_in_every_process():
+    # signatures are used as keys of results stored on disk (see cache.ClassificationCache)
+    script = ("import sys; sys.path.insert(0, sys.argv[1]); from tests.test_rate_laws import MICHAELIS_MENTEN, "
+              "load_math; from sbml_diff.rate_laws import canonical_signature; "
+              "print(canonical_signature(load_math(MICHAELIS_MENTEN)[0]))")
+    outputs = set()
+    for seed in ["1", "2"]:
+        env = dict(os.environ, PYTHONHASHSEED=seed, PYTHONPATH=ROOT)
+        outputs.add(subprocess.check_output([sys.executable, "-c", script, ROOT], env=env))
+    assert len(outputs) == 1
+    assert outputs.pop().decode("utf-8").strip() == repr(canonical_signature(load_math(MICHAELIS_MENTEN)[0]))
+
+
+@pytest.mark.parametrize("parser", ["lxml", "bs4", "stream"])
+def test_signature_of_inlined_function(parser):
+    function = MATH % ("<lambda><bvar>%s</bvar><bvar>%s</bvar>%s</lambda>" %
+                       (ci("x"), ci("y"), apply("times", ci("x"), ci("y"))))
+    model = ('<sbml xmlns="http://www.sbml.org/sbml/level2/version4" level="2" version="4"><model>'
+             '<listOfFunctionDefinitions><functionDefinition id="f">%s</functionDefinition>'
+             '</listOfFunctionDefinitions><listOfReactions>'
+             '<reaction id="r1"><kineticLaw>%s</kineticLaw></reaction>'
+             '<reaction id="r2"><kineticLaw>%s</kineticLaw></reaction>'
+             '</listOfReactions></model></sbml>' %
+             (function, MATH % "<apply><ci>f</ci><ci>k</ci><ci>S</ci></apply>",
+              MATH % apply("times", ci("S"), ci("k"))))
+
+    model = inline_all_functions(extract_models([model.encode("utf-8")], parser=parser)[0])
+    called, inlined = [canonical_signature(model.reactions[reaction_id].rate_law) for reaction_id in ["r1", "r2"]]
+    assert called == (inlined[0], ("k", "S"))
+
+
+def test_compile_rate_law():
+    expression, = load_math(MICHAELIS_MENTEN)
+    function, variables = compile_rate_law(expression)
+    assert variables == ["k1", "S", "K"]
+    assert function([2.0, 3.0, 1.0]) == pytest.approx(1.5)
+
+    # the function is only generated once
+    assert compile_rate_law(expression)[0] is function
+
+
+def test_evaluate_derivative():
+    expression, = load_math(MICHAELIS_MENTEN)
+    value, derivative = evaluate_derivative(expression, "S", {"k1": 2.0, "S": 3.0, "K": 1.0}, arithmetic=math)
+    assert value == pytest.approx(1.5)
+    # d/dS (k1 S / (K + S)) = k1 K / (K + S)^2
+    assert derivative == pytest.approx(2.0 / 16)
+
+
+@pytest.mark.parametrize("number", ["<cn></cn>", "<cn>1.2.3</cn>", '<cn type="rational">1<sep/>0</cn>',
+                                    '<cn type="e-notation">1<sep/>99999</cn>'])
+@pytest.mark.parametrize("engine", ["dual", "interval"])
+def test_invalid_number_cannot_be_differentiated(number, engine):
+    expression, = load_math(apply("times", number, ci("S")))
+    assert evaluate_derivative(expression, "S", {"S": 1.0}, arithmetic=math) == (None, None)
+    assert categorise_interaction(expression, "S", {}, engine=engine) == "?"
@@ -0,0 +1,59 @@
+import contextlib
+import glob
+import io
+import os
+
+import pytest
+
+from sbml_diff.document import parse_model
+from sbml_diff.generate_dot import GenerateDot
+from sbml_diff.model_index import INDEXED_ELEMENTS, content_id
+from sbml_diff.sbml_diff import SBMLDiff
+
+EXAMPLES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "examples")
+
+MODEL_FILES = sorted(glob.glob(os.path.join(EXAMPLES, "*", "*.xml")))
+
+
+def read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+@pytest.mark.parametrize("path", MODEL_FILES, ids=os.path.basename)
+def test_stream_parser_extracts_same_elements_as_lxml(path):
+    model_string = read(path)
+    streamed = parse_model(model_string, "stream")
+    parsed = parse_model(model_string, "lxml")
+
+    for name in INDEXED_ELEMENTS:
+        # content_id() depends on the names, attributes and text of an element and everything it contains
+        expected = [content_id(element) for element in parsed.find_all(name) if not element.prefix]
+        assert [content_id(element) for element in streamed.find_all(name)] == expected, name
+
+
+def render(paths, parser, abstract=False):
+    names = [os.path.basename(path) for path in paths]
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        sd = SBMLDiff([read(path) for path in paths], names, GenerateDot(["red", "green", "blue"][:len(paths)],
+                                                                         len(paths), model_names=names),
+                      parser=parser)
+        if abstract:
+            sd.diff_abstract_models([], [])
+        else:
+            sd.diff_models()
+    return output.getvalue()
+
+
+@pytest.mark.parametrize("paths", [
+    ["SIR/SIRModel1.xml", "SIR/SIRModel2.xml", "SIR/SIRModel3.xml"],
+    ["toggle-repressilator/toggle.xml", "toggle-repressilator/repressilator.xml"],
+    ["repressilator/BIOMD0000000012.xml"],
+])
+@pytest.mark.parametrize("abstract", [False, True])
+def test_stream_parser_output_matches_lxml(paths, abstract):
+    paths = [os.path.join(EXAMPLES, path) for path in paths]
+    output = render(paths, "lxml", abstract)
+    assert "digraph comparison" in output
+    assert render(paths, "stream", abstract) == output